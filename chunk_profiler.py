@@ -0,0 +1,133 @@
+import os
+import gc
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter, deque
+from datetime import datetime
+import numpy as np
+
+# --- 慢块采样分析器 ---
+# 后台线程每隔 interval_seconds 对导入线程的 Python 调用栈采样一次 (sys._current_frames)，
+# 样本按块累计; 同时通过 gc.callbacks 统计每块的 GC 暂停时间。
+# 只有一个块的耗时超过滚动窗口内的动态 p99 时才把它的样本写成 collapsed stacks 文件
+# (flamegraph.pl / speedscope 可直接读取)，其余块的样本直接丢弃。
+# tracemalloc 快照需要整个运行期间开启 tracemalloc，开销明显，默认关闭 (trace_memory=True 开启)。
+# C 扩展 (DuckDB / sqlite3 / pandas 解析器) 内部的时间会计在调用它的 Python 帧上，
+# 例如 insert_into、executemany、TextFileReader.get_chunk。
+
+
+class SlowChunkProfiler:
+    """导入循环中的慢块分析器
+
+    块的耗时取两次 end_chunk() 之间的墙钟时间，包含读取/解析 CSV、类型转换、插入和指标采集，
+    因此解析或 GC 引起的尖峰也能被捕获，而不只是插入本身。
+    """
+
+    def __init__(self, profile_dir, interval_seconds=0.005, window=200, min_samples=30,
+                 percentile=99, trace_memory=False, tracemalloc_frames=1):
+        self.profile_dir = os.path.join(profile_dir, datetime.now().strftime('%Y%m%d_%H%M%S'))
+        self.interval_seconds = interval_seconds
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self.trace_memory = trace_memory
+        self.tracemalloc_frames = tracemalloc_frames
+        self.durations = deque(maxlen=window) # 最近 window 个块的耗时
+        self.stacks = Counter() # 当前块的 collapsed stack -> 样本数
+        self.gc_pause_seconds = 0.0
+        self.profiles_written = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._target_ident = None
+        self._gc_start = None
+        self._chunk_start = None
+        self._started_tracemalloc = False
+
+    def _gc_callback(self, phase, info):
+        if phase == 'start':
+            self._gc_start = time.perf_counter()
+        elif self._gc_start is not None:
+            self.gc_pause_seconds += time.perf_counter() - self._gc_start
+            self._gc_start = None
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self._target_ident)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                frame = frame.f_back
+            with self._lock:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def start(self):
+        """开始对调用线程采样"""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self._target_ident = threading.get_ident()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            self._started_tracemalloc = True
+        gc.callbacks.append(self._gc_callback)
+        self._chunk_start = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name='slow-chunk-profiler', daemon=True)
+        self._thread.start()
+
+    def threshold(self):
+        """当前的动态阈值 (秒)；窗口内样本不足 min_samples 时返回 None"""
+        if len(self.durations) < self.min_samples:
+            return None
+        return float(np.percentile(self.durations, self.percentile))
+
+    def end_chunk(self, chunk_index):
+        """结束一个块: 超过动态阈值时写出分析文件并返回日志字段 dict，否则返回 None"""
+        now = time.perf_counter()
+        duration = now - self._chunk_start
+        self._chunk_start = now
+        with self._lock:
+            stacks, self.stacks = self.stacks, Counter()
+        gc_pause, self.gc_pause_seconds = self.gc_pause_seconds, 0.0
+
+        threshold = self.threshold()
+        self.durations.append(duration)
+        if threshold is None or duration <= threshold:
+            return None
+
+        stacks_file = os.path.join(self.profile_dir, f"chunk_{chunk_index}.collapsed")
+        with open(stacks_file, 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        snapshot_file = None
+        if tracemalloc.is_tracing():
+            snapshot_file = os.path.join(self.profile_dir, f"chunk_{chunk_index}.tracemalloc")
+            tracemalloc.take_snapshot().dump(snapshot_file)
+        self.profiles_written += 1
+
+        # 每个栈最内层的帧，用于在日志中快速看出时间花在哪里
+        leaf_counts = Counter()
+        for stack, count in stacks.items():
+            leaf_counts[stack.rsplit(';', 1)[-1]] += count
+        total_samples = sum(stacks.values())
+        return {
+            'chunk_wall_seconds': round(duration, 4),
+            'threshold_seconds': round(threshold, 4),
+            'samples': total_samples,
+            'gc_pause_seconds': round(gc_pause, 4),
+            'top_leaf_frames': [{'frame': name, 'share': round(count / total_samples, 3)}
+                                for name, count in leaf_counts.most_common(3)] if total_samples else [],
+            'collapsed_stacks_file': stacks_file,
+            'tracemalloc_snapshot_file': snapshot_file,
+        }
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
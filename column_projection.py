@@ -0,0 +1,87 @@
+import re
+import pandas as pd
+from csv_cache import datetime_cols, numeric_cols
+
+# --- 列投影和行过滤 ---
+# 列投影下推到读取器 (pandas usecols / 解析缓存的 Arrow 列选择)，不需要的列不会被解析和转换。
+# 行过滤是向量化的 pandas 表达式，在类型转换之前按 CSV 原始单位求值 (例如金额是元而不是 compact 模式的分)，
+# 表达式引用到的列会先临时转换成时间/数值类型，其余列保持原样，被过滤掉的行不再参与类型转换和插入。
+
+
+def resolve_projection(csv_file, columns):
+    """把要保留的列名 (不区分大小写) 解析成 CSV 表头中的原始列名，按文件中的顺序返回
+
+    columns 为 None 时返回 None (不投影)；有列名不存在或没有剩下任何列时抛出 ValueError
+    """
+    if columns is None:
+        return None
+    header = list(pd.read_csv(csv_file, nrows=0).columns)
+    wanted = {c.lower() for c in columns}
+    missing = wanted - {c.lower() for c in header}
+    if missing:
+        raise ValueError(f"CSV 中不存在这些投影列: {sorted(missing)}")
+    return [c for c in header if c.lower() in wanted]
+
+
+def estimate_column_byte_share(csv_file, kept_columns, sample_rows=1000):
+    """用前 sample_rows 行估算保留列占原始 CSV 字节的比例 (每个字段加 1 字节分隔符/换行)"""
+    if kept_columns is None:
+        return 1.0
+    sample = pd.read_csv(csv_file, nrows=sample_rows, dtype=str, keep_default_na=False)
+    column_bytes = {c: int(sample[c].str.len().sum()) + len(sample) for c in sample.columns}
+    total = sum(column_bytes.values())
+    return sum(column_bytes[c] for c in kept_columns) / total if total else 1.0
+
+
+def row_filter_mask(chunk_df, expression):
+    """对 (列名已小写的) 数据块求值过滤表达式，返回布尔 Series；结果为 NaN/NULL 的行视为不满足"""
+    referenced = [c for c in chunk_df.columns if re.search(rf"\b{re.escape(c)}\b", expression)]
+    typed = pd.DataFrame(index=chunk_df.index)
+    for col in referenced:
+        if col in datetime_cols:
+            typed[col] = pd.to_datetime(chunk_df[col], errors='coerce')
+        elif col in numeric_cols:
+            typed[col] = pd.to_numeric(chunk_df[col], errors='coerce')
+        else:
+            typed[col] = chunk_df[col]
+    mask = typed.eval(expression, engine='python')
+    return pd.Series(mask, index=chunk_df.index).fillna(False).astype(bool)
+
+
+def apply_row_filter(chunk_df, expression):
+    """返回 (过滤后的数据块, 被丢弃的行数)；expression 为 None 时原样返回"""
+    if not expression:
+        return chunk_df, 0
+    mask = row_filter_mask(chunk_df, expression)
+    dropped = int((~mask).sum())
+    return (chunk_df[mask] if dropped else chunk_df), dropped
+
+
+def validate_row_filter(csv_file, expression, columns=None, sample_rows=100):
+    """在导入开始前用 CSV 的前 sample_rows 行试算过滤表达式，表达式无效时抛出 ValueError
+
+    否则每个块都会在过滤时出错并被跳过，整次导入不会写入任何数据
+    """
+    if not expression:
+        return
+    sample = pd.read_csv(csv_file, nrows=sample_rows, low_memory=False, usecols=columns)
+    sample.columns = sample.columns.str.lower()
+    try:
+        row_filter_mask(sample, expression)
+    except Exception as e:
+        raise ValueError(f"行过滤表达式 {expression!r} 无效: {e}") from e
+
+
+def filter_accounting(rows_read, rows_dropped, logical_bytes, column_byte_share, columns_kept):
+    """本块被投影和过滤掉的行数/字节数 (字节按原始 CSV 估算)"""
+    bytes_dropped_by_projection = round(logical_bytes * (1 - column_byte_share))
+    kept_bytes = logical_bytes - bytes_dropped_by_projection
+    bytes_dropped_by_filter = round(kept_bytes * rows_dropped / rows_read) if rows_read else 0
+    return {
+        'rows_read': rows_read,
+        'rows_dropped': rows_dropped,
+        'columns_kept': columns_kept,
+        'bytes_dropped_by_projection': bytes_dropped_by_projection,
+        'bytes_dropped_by_filter': bytes_dropped_by_filter,
+        'bytes_dropped': bytes_dropped_by_projection + bytes_dropped_by_filter,
+    }
@@ -0,0 +1,218 @@
+import os
+import sys
+import json
+import time
+import shutil
+import subprocess
+import importlib.util
+from datetime import datetime
+from itertools import islice
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from ingest_utils import get_path_size
+
+# --- 配置参数 ---
+# 源 CSV 数据文件路径
+source_csv_file = 'data_set/2023_Yellow_Taxi_Trip_Data.csv'
+# 每个引擎导入同一段数据: 源文件的前 N 行 (None 表示整个文件)
+slice_rows = 1000000
+# 所有引擎使用相同的块大小
+chunk_size = 10000
+# DuckDB 的 memory_limit (SQLite 和 RocksDB 没有等价的全局内存上限，受同一容器 --memory 限制)
+duckdb_memory_limit = '1GB'
+# 每个引擎进程绑定到相同的 CPU 集合 (仅 Linux)，None 表示不绑定
+cpu_affinity = None # <<<<<<< 例如 [0, 1] >>>>>>>
+# 编译好的 RocksDB 导入程序 (见 README 第 4 步)，不存在时跳过 RocksDB
+rocksdb_binary = './insert_test'
+# insert_rocksdb.cpp 中的 kBuildMarker: 旧版本的二进制忽略命令行参数 (会按默认路径导入整个 CSV)，
+# 计时也包含 CSV 解析，没有这个标记的二进制不会运行
+rocksdb_build_marker = b'insert_test build: args-v2'
+# 输出目录
+compare_dir = 'db/compare'
+compare_log_dir = 'log/compare'
+report_file = 'log/compare/engine_comparison.json'
+output_plot_path = 'plots/engine_comparison.png'
+
+
+def make_slice(source, rows):
+    """把源 CSV 的前 rows 行 (加表头) 原样复制成一个新文件，返回路径；rows 为 None 时直接使用源文件"""
+    if rows is None:
+        return source
+    slice_path = os.path.join(os.path.dirname(source), f"slice_{rows}_{os.path.basename(source)}")
+    if os.path.exists(slice_path) and os.path.getmtime(slice_path) >= os.path.getmtime(source):
+        print(f"使用已有的数据切片: {slice_path}")
+        return slice_path
+    with open(source, 'rb') as src, open(slice_path, 'wb') as dst:
+        dst.writelines(islice(src, rows + 1)) # +1 为表头
+    print(f"已生成数据切片: {slice_path} ({rows} 行)")
+    return slice_path
+
+
+def binary_has_marker(path, marker):
+    """不运行二进制，直接在文件内容中查找构建标记 (旧版本一运行就会开始导入)"""
+    with open(path, 'rb') as f:
+        return marker in f.read()
+
+
+def engine_commands(csv_path):
+    """返回可用引擎的 {引擎名: (命令, 数据库路径, WAL 路径列表, 日志路径)}"""
+    engines = {}
+    if importlib.util.find_spec('duckdb') is not None:
+        db_path = os.path.join(compare_dir, 'taxi_data.duckdb')
+        log_path = os.path.join(compare_log_dir, 'duckdb.jsonl')
+        code = (f"import insert_duckdb as m; m.ingest_and_monitor({csv_path!r}, {db_path!r}, m.table_name, "
+                f"{log_path!r}, {chunk_size}, {duckdb_memory_limit!r})")
+        engines['DuckDB'] = ([sys.executable, '-c', code], db_path, [db_path + '.wal'], log_path)
+    else:
+        print("未安装 duckdb，跳过 DuckDB。")
+
+    db_path = os.path.join(compare_dir, 'taxi_data.sqlite')
+    log_path = os.path.join(compare_log_dir, 'sqlite.jsonl')
+    code = (f"import insert_sqlite as m; m.ingest_and_monitor_sqlite({csv_path!r}, {db_path!r}, m.table_name, "
+            f"{log_path!r}, {chunk_size})")
+    engines['SQLite'] = ([sys.executable, '-c', code], db_path, [db_path + '-wal', db_path + '-journal'], log_path)
+
+    # 纯 Python KV 后端 (insert_kv.py)，定长记录和 JSON 两种值编码: 二者之差就是 JSON 序列化的成本
+    for encoding in ('struct', 'json'):
+        db_path = os.path.join(compare_dir, f'taxi_kv_{encoding}')
+        log_path = os.path.join(compare_log_dir, f'kv_{encoding}.jsonl')
+        code = (f"import insert_kv as m; m.ingest_and_monitor_kv({csv_path!r}, {db_path!r}, {log_path!r}, {chunk_size}, "
+                f"backend=m.kv_backend, value_encoding={encoding!r})")
+        engines[f'KV-{encoding}'] = ([sys.executable, '-c', code], db_path, [], log_path)
+
+    if os.path.isfile(rocksdb_binary) and os.access(rocksdb_binary, os.X_OK) \
+            and not binary_has_marker(rocksdb_binary, rocksdb_build_marker):
+        print(f"{rocksdb_binary} 是旧版本 (缺少构建标记 {rocksdb_build_marker.decode()})，不接受命令行参数，"
+              f"请按 README 第 4 步用当前的 insert_rocksdb.cpp 重新编译。跳过 RocksDB。")
+    elif os.path.isfile(rocksdb_binary) and os.access(rocksdb_binary, os.X_OK):
+        db_path = os.path.join(compare_dir, 'taxi_rocksdb')
+        log_path = os.path.join(compare_log_dir, 'rocksdb.jsonl')
+        engines['RocksDB'] = ([rocksdb_binary, csv_path, db_path, log_path, str(chunk_size)], db_path, [], log_path)
+    else:
+        print(f"未找到可执行的 {rocksdb_binary} (请按 README 第 4 步编译)，跳过 RocksDB。")
+    return engines
+
+
+def run_engine(name, command, stdout_path):
+    """在子进程中运行一个引擎，用 os.wait4 取得该子进程自己的 CPU 时间和峰值 RSS"""
+    def pin_cpus():
+        if cpu_affinity:
+            os.sched_setaffinity(0, cpu_affinity)
+
+    print(f"\n===== 运行 {name} =====")
+    with open(stdout_path, 'w', encoding='utf-8') as out_f:
+        start_time = time.time()
+        proc = subprocess.Popen(command, stdout=out_f, stderr=subprocess.STDOUT, preexec_fn=pin_cpus)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        wall_seconds = time.time() - start_time
+    # Linux 上 ru_maxrss 的单位是 KB，macOS 上是字节
+    peak_rss_bytes = usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+    print(f"{name} 结束 (返回码 {proc.returncode})，耗时 {wall_seconds:.2f} 秒，控制台输出: {stdout_path}")
+    return {
+        'return_code': proc.returncode,
+        'wall_seconds': round(wall_seconds, 4),
+        'cpu_seconds': round(usage.ru_utime + usage.ru_stime, 4),
+        'peak_rss_bytes': peak_rss_bytes,
+    }
+
+
+def load_chunk_series(log_path):
+    """读取引擎日志中的成功块，返回按块排序的 DataFrame"""
+    rows = []
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get('status') == 'SUCCESS':
+                rows.append({'chunk_index': int(entry['chunk_index']),
+                             'rows_ingested': entry['rows_ingested'],
+                             'time_taken_seconds': entry['time_taken_seconds'],
+                             'ingestion_rate_rows_per_sec': entry['ingestion_rate_rows_per_sec'],
+                             'total_time_taken_so_far': entry['total_time_taken_so_far']})
+    return pd.DataFrame(rows).sort_values('chunk_index') if rows else pd.DataFrame()
+
+
+def run_comparison():
+    os.makedirs(compare_log_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(output_plot_path), exist_ok=True)
+    # 每次从空目录开始，保证数据库大小只包含这次导入的数据
+    shutil.rmtree(compare_dir, ignore_errors=True)
+    os.makedirs(compare_dir, exist_ok=True)
+
+    csv_path = make_slice(source_csv_file, slice_rows)
+    results, series = {}, {}
+    for name, (command, db_path, wal_paths, log_path) in engine_commands(csv_path).items():
+        if os.path.exists(log_path):
+            os.remove(log_path)
+        usage = run_engine(name, command, os.path.join(compare_log_dir, f"{name.lower()}_stdout.txt"))
+        if not os.path.exists(log_path):
+            print(f"{name} 没有生成日志，跳过。")
+            continue
+        df = load_chunk_series(log_path)
+        rows = int(df['rows_ingested'].sum()) if not df.empty else 0
+        ingest_seconds = float(df['time_taken_seconds'].sum()) if not df.empty else 0.0
+        on_disk_bytes = get_path_size(db_path) + sum(get_path_size(p) for p in wal_paths)
+        results[name] = {
+            **usage,
+            'rows': rows,
+            'ingest_seconds': round(ingest_seconds, 4),
+            'rows_per_sec_ingest': round(rows / ingest_seconds, 2) if ingest_seconds > 0 else None,
+            'rows_per_sec_end_to_end': round(rows / usage['wall_seconds'], 2) if usage['wall_seconds'] > 0 else None,
+            'on_disk_bytes': on_disk_bytes,
+            'bytes_per_row_on_disk': round(on_disk_bytes / rows, 2) if rows else None,
+            'cpu_seconds_per_million_rows': round(usage['cpu_seconds'] / rows * 1e6, 3) if rows else None,
+        }
+        series[name] = df
+
+    if not results:
+        print("没有引擎成功运行。")
+        return
+
+    # --- 打印归一化报告 ---
+    print("\n--- 引擎对比 (同一数据切片，相同块大小) ---")
+    print(f"{'engine':<10}{'rows':>10}{'rows/s ingest':>15}{'rows/s e2e':>12}{'B/row disk':>12}{'peak MB':>10}{'CPU-s/M rows':>14}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['rows']:>10}{r['rows_per_sec_ingest'] or 0:>15.0f}{r['rows_per_sec_end_to_end'] or 0:>12.0f}"
+              f"{r['bytes_per_row_on_disk'] or 0:>12.1f}{r['peak_rss_bytes'] / 1024 / 1024:>10.1f}"
+              f"{r['cpu_seconds_per_million_rows'] or 0:>14.2f}")
+
+    with open(report_file, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'csv_file': csv_path, 'chunk_size': chunk_size,
+                   'duckdb_memory_limit': duckdb_memory_limit, 'cpu_affinity': cpu_affinity,
+                   'results': results}, f, indent=2)
+    print(f"对比报告已保存到: {report_file}")
+
+    # --- 绘图 ---
+    names = list(results)
+    fig, axes = plt.subplots(nrows=2, ncols=2, figsize=(15, 10))
+    for name, df in series.items():
+        if not df.empty:
+            axes[0][0].plot(df['total_time_taken_so_far'], df['ingestion_rate_rows_per_sec'], label=name)
+    axes[0][0].set_title('Ingestion Rate over Time')
+    axes[0][0].set_xlabel('Cumulative Ingest Time (s)')
+    axes[0][0].set_ylabel('Rows/sec')
+    axes[0][0].grid(True, linestyle='--', alpha=0.6)
+    axes[0][0].legend(loc='upper right')
+
+    bar_panels = [
+        (axes[0][1], 'bytes_per_row_on_disk', 1, 'Bytes per Row on Disk'),
+        (axes[1][0], 'peak_rss_bytes', 1024 * 1024, 'Peak Memory (MB RSS)'),
+        (axes[1][1], 'cpu_seconds_per_million_rows', 1, 'CPU-seconds per Million Rows'),
+    ]
+    for ax, key, scale, title in bar_panels:
+        ax.bar(names, [(results[n][key] or 0) / scale for n in names], color=['tab:blue', 'tab:orange', 'tab:purple', 'tab:red', 'tab:green'][:len(names)])
+        ax.set_title(title)
+        ax.grid(True, axis='y', linestyle='--', alpha=0.6)
+
+    plt.tight_layout() # 自动调整子图布局以防止重叠
+    plt.savefig(output_plot_path, bbox_inches='tight') # bbox_inches='tight' 防止标签被截断
+    print(f"图表已保存到: {output_plot_path}")
+
+
+# --- Run script ---
+if __name__ == "__main__":
+    run_comparison()
@@ -0,0 +1,83 @@
+import os
+import json
+from datetime import datetime
+
+from insert_sqlite import ingest_and_monitor_sqlite, csv_file, table_name, chunk_size
+
+# --- 配置参数 ---
+# 每种编码只导入前 N 个块，保证几种布局处理的是同一段数据 (None 表示全部)
+max_chunks = 50
+# 对比结果输出路径 (JSON)
+summary_file = 'log/sqlite_encoding_comparison.json'
+
+# 参与对比的布局: (名称, storage_encoding, without_rowid)
+variants = [
+    ('text', 'text', False),
+    ('compact', 'compact', False),
+    ('compact_without_rowid', 'compact', True),
+]
+
+
+def summarize_log(log_path):
+    """从 JSONL 日志汇总行数、插入耗时和本进程写入字节
+
+    写入字节用 storage_accounting 中的进程写入 (get_process_write_bytes)，而不是整机的磁盘 I/O 差值，
+    不会把其他进程的写入算进来；平台不支持进程 I/O 计数时返回 None
+    """
+    rows, seconds, write_bytes = 0, 0.0, 0
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry.get('status') != 'SUCCESS':
+                continue
+            rows += entry['rows_ingested']
+            seconds += entry['time_taken_seconds']
+            chunk_write_bytes = entry.get('storage_accounting', {}).get('process_write_bytes_during_chunk', -1)
+            if chunk_write_bytes < 0 or write_bytes is None:
+                write_bytes = None
+            else:
+                write_bytes += chunk_write_bytes
+    return rows, seconds, write_bytes
+
+
+def run_comparison():
+    results = []
+    for name, encoding, without_rowid in variants:
+        db_path = f'db/taxi_data_{name}.sqlite'
+        log_path = f'log/ingestion_log_sqlite_{name}.jsonl'
+        # 每次从空文件开始，避免旧数据和旧日志影响文件大小与统计
+        for path in (db_path, log_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+        print(f"\n===== 布局: {name} =====")
+        ingest_and_monitor_sqlite(csv_file, db_path, table_name, log_path, chunk_size,
+                                  storage_encoding=encoding, without_rowid=without_rowid,
+                                  max_chunks=max_chunks)
+
+        rows, seconds, write_bytes = summarize_log(log_path)
+        file_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
+        results.append({
+            'layout': name,
+            'rows': rows,
+            'db_file_size_bytes': file_size,
+            'db_bytes_per_row': round(file_size / rows, 2) if rows else None,
+            'process_write_bytes_per_row': round(write_bytes / rows, 2) if rows and write_bytes is not None else None,
+            'rows_per_sec': round(rows / seconds, 2) if seconds > 0 else None,
+        })
+
+    # --- 打印对比表 ---
+    print("\n--- SQLite 存储编码对比 ---")
+    print(f"{'layout':<24}{'rows':>10}{'file MB':>10}{'B/row':>10}{'write B/row':>14}{'rows/sec':>12}")
+    for r in results:
+        print(f"{r['layout']:<24}{r['rows']:>10}{r['db_file_size_bytes'] / 1024 / 1024:>10.2f}"
+              f"{r['db_bytes_per_row'] or 0:>10.1f}{r['process_write_bytes_per_row'] or 0:>14.1f}{r['rows_per_sec'] or 0:>12.0f}")
+
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump({'timestamp': datetime.now().isoformat(), 'max_chunks': max_chunks, 'results': results}, f, indent=2)
+    print(f"对比结果已保存到: {summary_file}")
+
+
+# --- Run script ---
+if __name__ == "__main__":
+    run_comparison()
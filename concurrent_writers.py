@@ -0,0 +1,281 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import duckdb
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+
+from csv_cache import coerce_chunk, datetime_cols
+
+# --- 配置参数 ---
+# CSV 数据文件路径
+csv_file = 'data_set/2023_Yellow_Taxi_Trip_Data.csv'
+# 参与测试的行数 (从文件开头读取)，平均分给各写入者，每个写入者拿到互不重叠的一段
+slice_rows = 200000
+# 每个写入者每次事务写入的行数
+chunk_size = 10000
+# 写入者数量: None 表示 1, 2, 4, ... 直到 cpu_count
+writer_counts = None
+# 要测试的模式: (引擎, 方式)
+#   sqlite/thread:   每个线程一个连接，WAL 模式
+#   sqlite/process:  每个进程一个连接，WAL 模式 (绕开 GIL)
+#   duckdb/cursor:   同一个连接上每个线程一个 cursor，直接写目标表
+#   duckdb/staging:  每个线程写自己的 staging 表，最后合并到目标表
+modes = [('sqlite', 'thread'), ('sqlite', 'process'), ('duckdb', 'cursor'), ('duckdb', 'staging')]
+# SQLite 写锁忙等待 / DuckDB 事务冲突重试: 每次重试前的退避时间 (秒) 和单个事务的最长等待时间
+busy_backoff_seconds = 0.001
+busy_timeout_seconds = 30
+# 输出
+db_dir = 'db/concurrency'
+table_name = 'yellow_taxi_trips'
+log_file = 'log/concurrency_benchmark.jsonl'
+output_plot_path = 'plots/concurrency_scaling.png'
+
+
+def load_input(csv_file, rows):
+    """读取并转换测试数据 (与导入脚本相同的类型转换)，不计入写入时间"""
+    df = coerce_chunk(pd.read_csv(csv_file, nrows=rows, low_memory=False))
+    print(f"已读取 {len(df)} 行测试数据。")
+    return df
+
+
+def split_for_writers(df, writers):
+    """把数据平均切成 writers 段 (互不重叠)，每段再切成 chunk_size 行的块"""
+    parts = np.array_split(np.arange(len(df)), writers)
+    return [[df.iloc[idx[i:i + chunk_size]] for i in range(0, len(idx), chunk_size)] for idx in parts]
+
+
+# --- SQLite 写入者 ---
+def sqlite_rows(chunk_df):
+    """DataFrame -> executemany 的元组列表: 时间列转 ISO8601 字符串，NaN/NaT 转 None"""
+    chunk_df = chunk_df.copy()
+    for col in chunk_df.columns:
+        if col in datetime_cols:
+            chunk_df[col] = chunk_df[col].dt.strftime('%Y-%m-%dT%H:%M:%S')
+    chunk_df = chunk_df.astype(object).where(chunk_df.notna(), None)
+    return [tuple(row) for row in chunk_df.values.tolist()]
+
+
+def sqlite_writer(writer_id, db_file, table_name, row_chunks):
+    """一个 SQLite 写入者: 自己的连接，BEGIN IMMEDIATE 获取写锁，遇到 SQLITE_BUSY 时退避重试并统计等待时间"""
+    # timeout=0 关闭内置 busy handler，由这里自己重试，才能统计锁等待时间
+    conn = sqlite3.connect(db_file, timeout=0, isolation_level=None)
+    placeholders = ', '.join(['?'] * len(row_chunks[0][0])) if row_chunks and row_chunks[0] else ''
+    insert_sql = f"INSERT INTO {table_name} VALUES ({placeholders});"
+    busy_wait, busy_retries, rows = 0.0, 0, 0
+    start_time = time.time()
+    try:
+        for rows_to_insert in row_chunks:
+            wait_start = None
+            while True:
+                try:
+                    conn.execute("BEGIN IMMEDIATE;")
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) and 'busy' not in str(e):
+                        raise
+                    wait_start = wait_start or time.time()
+                    if time.time() - wait_start > busy_timeout_seconds:
+                        raise
+                    busy_retries += 1
+                    # 带随机抖动的退避，避免多个写入者同时醒来
+                    time.sleep(busy_backoff_seconds * (1 + random.random()))
+            if wait_start is not None:
+                busy_wait += time.time() - wait_start
+            try:
+                conn.executemany(insert_sql, rows_to_insert)
+                conn.execute("COMMIT;")
+            except Exception:
+                conn.rollback() # 释放写锁，否则其他写入者会一直等到进程退出
+                raise
+            rows += len(rows_to_insert)
+        end_time = time.time()
+    finally:
+        conn.close()
+    return {'writer_id': writer_id, 'rows': rows, 'start_time': start_time, 'end_time': end_time,
+            'busy_wait_seconds': round(busy_wait, 4), 'busy_retries': busy_retries}
+
+
+def run_sqlite(df, writers, kind):
+    db_file = os.path.join(db_dir, f"sqlite_{kind}_{writers}.sqlite")
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode=WAL;") # WAL: 读写不互斥，写入者之间仍然串行
+    columns_sql = []
+    for col, dtype in df.dtypes.items():
+        sqlite_type = 'REAL' if pd.api.types.is_float_dtype(dtype) else 'TEXT'
+        columns_sql.append(f'"{col}" {sqlite_type}')
+    conn.execute(f"CREATE TABLE {table_name} ({', '.join(columns_sql)});")
+    conn.close()
+
+    # 转换成元组放在计时之外，只测量写入和锁竞争
+    parts = [[sqlite_rows(chunk) for chunk in part] for part in split_for_writers(df, writers)]
+    args = [(i, db_file, table_name, part) for i, part in enumerate(parts)]
+    if kind == 'process':
+        with multiprocessing.Pool(processes=writers) as pool:
+            return pool.starmap(sqlite_writer, args)
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        return list(executor.map(lambda a: sqlite_writer(*a), args))
+
+
+# --- DuckDB 写入者 ---
+def duckdb_writer(writer_id, con, target_table, chunks):
+    """一个 DuckDB 写入者: 在自己的 cursor 上追加数据，事务冲突时重试并统计等待时间 (超过 busy_timeout_seconds 放弃)"""
+    cursor = con.cursor()
+    busy_wait, busy_retries, rows = 0.0, 0, 0
+    start_time = time.time()
+    for chunk_df in chunks:
+        wait_start = None
+        while True:
+            try:
+                duckdb.from_df(chunk_df, connection=cursor).insert_into(target_table)
+                break
+            except duckdb.TransactionException:
+                wait_start = wait_start or time.time()
+                if time.time() - wait_start > busy_timeout_seconds:
+                    raise
+                busy_retries += 1
+                time.sleep(busy_backoff_seconds * (1 + random.random()))
+        if wait_start is not None:
+            busy_wait += time.time() - wait_start
+        rows += len(chunk_df)
+    end_time = time.time()
+    cursor.close()
+    return {'writer_id': writer_id, 'rows': rows, 'start_time': start_time, 'end_time': end_time,
+            'busy_wait_seconds': round(busy_wait, 4), 'busy_retries': busy_retries}
+
+
+def run_duckdb(df, writers, kind):
+    db_file = os.path.join(db_dir, f"duckdb_{kind}_{writers}.duckdb")
+    for suffix in ('', '.wal'):
+        if os.path.exists(db_file + suffix):
+            os.remove(db_file + suffix)
+    con = duckdb.connect(db_file)
+    con.execute(f"CREATE TABLE {table_name} AS SELECT * FROM df LIMIT 0;")
+
+    parts = split_for_writers(df, writers)
+    targets = [table_name] * writers
+    if kind == 'staging':
+        targets = [f"{table_name}_stage_{i}" for i in range(writers)]
+        for stage in targets:
+            con.execute(f"CREATE TABLE {stage} AS SELECT * FROM {table_name} LIMIT 0;")
+
+    with ThreadPoolExecutor(max_workers=writers) as executor:
+        results = list(executor.map(lambda i: duckdb_writer(i, con, targets[i], parts[i]), range(writers)))
+
+    if kind == 'staging':
+        # 合并阶段计入最后一个写入者的结束时间，保证总吞吐量包含合并成本
+        merge_start = time.time()
+        con.execute(f"INSERT INTO {table_name} " + " UNION ALL ".join(f"SELECT * FROM {t}" for t in targets) + ";")
+        for stage in targets:
+            con.execute(f"DROP TABLE {stage};")
+        merge_end = time.time()
+        for r in results:
+            r['merge_seconds'] = round(merge_end - merge_start, 4)
+        max(results, key=lambda r: r['end_time'])['end_time'] = merge_end
+    con.close()
+    return results
+
+
+def summarize(engine, kind, writers, results, baseline_throughput):
+    """汇总一次运行: 总吞吐量 (总行数 / 最早开始到最晚结束)、每个写入者的吞吐量和锁等待时间"""
+    total_rows = sum(r['rows'] for r in results)
+    wall = max(r['end_time'] for r in results) - min(r['start_time'] for r in results)
+    throughput = total_rows / wall if wall > 0 else 0
+    for r in results:
+        r['seconds'] = round(r['end_time'] - r['start_time'], 4)
+        r['rows_per_sec'] = round(r['rows'] / r['seconds'], 2) if r['seconds'] > 0 else None
+        del r['start_time'], r['end_time']
+    # 1 个写入者的基准运行失败时不编造加速比
+    if baseline_throughput:
+        speedup = throughput / baseline_throughput
+    else:
+        speedup = 1.0 if writers == 1 else None
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'engine': engine,
+        'mode': kind,
+        'writers': writers,
+        'rows': total_rows,
+        'wall_seconds': round(wall, 4),
+        'aggregate_rows_per_sec': round(throughput, 2),
+        'speedup_vs_1_writer': round(speedup, 3) if speedup is not None else None,
+        'scaling_efficiency': round(speedup / writers, 3) if speedup is not None else None,
+        'total_busy_wait_seconds': round(sum(r['busy_wait_seconds'] for r in results), 4),
+        'per_writer': results,
+    }
+
+
+def run_benchmark():
+    os.makedirs(db_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    os.makedirs(os.path.dirname(output_plot_path), exist_ok=True)
+
+    counts = writer_counts
+    if counts is None:
+        cpu_count = os.cpu_count() or 1
+        counts = sorted({min(2 ** i, cpu_count) for i in range(cpu_count.bit_length() + 1)})
+    df = load_input(csv_file, slice_rows)
+
+    summaries = []
+    with open(log_file, 'a', encoding='utf-8') as log_f:
+        for engine, kind in modes:
+            baseline = None
+            for writers in counts:
+                print(f"\n===== {engine}/{kind}: {writers} 个写入者 =====")
+                try:
+                    if engine == 'sqlite':
+                        results = run_sqlite(df, writers, kind)
+                    else:
+                        results = run_duckdb(df, writers, kind)
+                except Exception as e:
+                    print(f"{engine}/{kind} ({writers} 个写入者) 运行失败: {e}")
+                    log_f.write(json.dumps({'timestamp': datetime.now().isoformat(), 'engine': engine, 'mode': kind,
+                                            'writers': writers, 'status': 'ERROR', 'error': str(e)}) + '\n')
+                    continue
+                summary = summarize(engine, kind, writers, results, baseline)
+                if baseline is None and writers == 1:
+                    baseline = summary['aggregate_rows_per_sec']
+                summaries.append(summary)
+                log_f.write(json.dumps(summary) + '\n')
+                log_f.flush()
+                speedup = summary['speedup_vs_1_writer']
+                print(f"  -> 总吞吐量 {summary['aggregate_rows_per_sec']:.0f} 行/秒，"
+                      f"加速比 {f'{speedup:.2f}' if speedup is not None else 'N/A (没有 1 个写入者的基准)'}，"
+                      f"锁等待合计 {summary['total_busy_wait_seconds']:.3f} 秒")
+                for r in summary['per_writer']:
+                    print(f"     写入者 {r['writer_id']}: {r['rows']} 行, {r['rows_per_sec'] or 0:.0f} 行/秒, "
+                          f"锁等待 {r['busy_wait_seconds']:.3f} 秒 ({r['busy_retries']} 次重试)")
+
+    # --- 绘图: 各模式的总吞吐量随写入者数量的变化 ---
+    if summaries:
+        plot_df = pd.DataFrame([{k: s[k] for k in ('engine', 'mode', 'writers', 'aggregate_rows_per_sec',
+                                                   'total_busy_wait_seconds')} for s in summaries])
+        fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(15, 10), sharex=True)
+        for (engine, kind), group in plot_df.groupby(['engine', 'mode'], sort=False):
+            axes[0].plot(group['writers'], group['aggregate_rows_per_sec'], marker='o', label=f"{engine}/{kind}")
+            axes[1].plot(group['writers'], group['total_busy_wait_seconds'], marker='o', label=f"{engine}/{kind}")
+        axes[0].set_ylabel('Aggregate Rows/sec')
+        axes[0].set_title('Multi-Writer Scaling')
+        axes[0].grid(True, linestyle='--', alpha=0.6)
+        axes[0].legend(loc='upper left')
+        axes[1].set_ylabel('Total Lock-Wait / Busy-Retry Time (s)')
+        axes[1].set_xlabel('Writers')
+        axes[1].grid(True, linestyle='--', alpha=0.6)
+        plt.tight_layout() # 自动调整子图布局以防止重叠
+        plt.savefig(output_plot_path, bbox_inches='tight') # bbox_inches='tight' 防止标签被截断
+        print(f"\n图表已保存到: {output_plot_path}")
+    print(f"详细结果已保存到: {log_file}")
+
+
+# --- Run script ---
+if __name__ == "__main__":
+    run_benchmark()
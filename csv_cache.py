@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+# --- 解析后数据集缓存 ---
+# 第一次运行时把 CSV 按导入脚本相同的规则 (to_datetime / to_numeric, errors='coerce') 解析一次，
+# 写成带类型的 Arrow IPC 文件；之后的运行通过内存映射按块读取，跳过 CSV 解析和类型转换。
+# 缓存键 = 源文件绝对路径 + 大小 + mtime + CACHE_SCHEMA_VERSION，任何一项变化都会生成新的缓存文件。
+
+# 修改下面的列类型规则时必须增加版本号，使旧缓存失效
+CACHE_SCHEMA_VERSION = 1
+
+datetime_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'pickup_datetime', 'dropoff_datetime']
+numeric_cols = ['vendorid', 'passenger_count', 'trip_distance', 'ratecodeid', 'pulocationid',
+                'dolocationid', 'payment_type', 'fare_amount', 'extra', 'mta_tax',
+                'tip_amount', 'tolls_amount', 'improvement_surcharge', 'total_amount',
+                'congestion_surcharge', 'airport_fee']
+
+
+def cache_key(csv_file):
+    """根据源文件路径、大小、mtime 和 schema 版本生成缓存键"""
+    stat = os.stat(csv_file)
+    raw = f"{os.path.abspath(csv_file)}|{stat.st_size}|{stat.st_mtime_ns}|{CACHE_SCHEMA_VERSION}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def cache_path(csv_file, cache_dir):
+    """缓存文件路径: <cache_dir>/<CSV 文件名>.<缓存键>.arrow"""
+    return os.path.join(cache_dir, f"{os.path.basename(csv_file)}.{cache_key(csv_file)}.arrow")
+
+
+def coerce_chunk(chunk_df):
+    """与导入脚本一致的类型转换: 列名小写，时间列 -> datetime64[us]，数值列 -> float64，其余 -> string"""
+    chunk_df.columns = chunk_df.columns.str.lower()
+    for col in chunk_df.columns:
+        if col in datetime_cols:
+            chunk_df[col] = pd.to_datetime(chunk_df[col].astype(str), errors='coerce').astype('datetime64[us]')
+        elif col in numeric_cols:
+            chunk_df[col] = pd.to_numeric(chunk_df[col], errors='coerce').astype('float64')
+        else:
+            chunk_df[col] = chunk_df[col].astype('string')
+    return chunk_df
+
+
+def arrow_schema(columns):
+    """固定的 Arrow schema，保证每个块的类型一致 (不依赖某一块里是否恰好有 NaN)"""
+    fields = []
+    for col in columns:
+        if col in datetime_cols:
+            fields.append(pa.field(col, pa.timestamp('us')))
+        elif col in numeric_cols:
+            fields.append(pa.field(col, pa.float64()))
+        else:
+            fields.append(pa.field(col, pa.string()))
+    return pa.schema(fields)
+
+
+def build_parsed_cache(csv_file, path, chunk_size):
+    """把 CSV 解析并写成 Arrow IPC 文件，先写临时文件再原子替换，返回元数据 dict"""
+    print(f"正在构建解析缓存: {csv_file} -> {path}")
+    start_time = time.time()
+    partial_path = path + '.partial'
+    total_rows = 0
+    writer = None
+    try:
+        for chunk_df in pd.read_csv(csv_file, chunksize=chunk_size, low_memory=False):
+            chunk_df = coerce_chunk(chunk_df)
+            if writer is None:
+                schema = arrow_schema(list(chunk_df.columns))
+                writer = ipc.new_file(partial_path, schema)
+            writer.write_batch(pa.RecordBatch.from_pandas(chunk_df, schema=schema, preserve_index=False))
+            total_rows += len(chunk_df)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError(f"CSV 文件为空，无法构建缓存: {csv_file}")
+    os.replace(partial_path, path)
+
+    metadata = {
+        'source_file': os.path.abspath(csv_file),
+        'source_bytes': os.path.getsize(csv_file),
+        'schema_version': CACHE_SCHEMA_VERSION,
+        'rows': total_rows,
+        'cache_bytes': os.path.getsize(path),
+        'build_seconds': round(time.time() - start_time, 4),
+    }
+    with open(path + '.json', 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+    print(f"解析缓存构建完成: {total_rows} 行，耗时 {metadata['build_seconds']:.2f} 秒")
+    return metadata
+
+
+def ensure_parsed_cache(csv_file, cache_dir, chunk_size):
+    """返回 (缓存文件路径, 元数据)，缓存不存在时先构建"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(csv_file, cache_dir)
+    if os.path.exists(path) and os.path.exists(path + '.json'):
+        with open(path + '.json', 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        print(f"使用已有的解析缓存: {path}")
+        return path, metadata
+    return path, build_parsed_cache(csv_file, path, chunk_size)
+
+
+class CachedChunkReader:
+    """内存映射读取 Arrow IPC 缓存，接口与 pandas 的 TextFileReader 一致 (迭代 / get_chunk(size))
+
+    返回的 DataFrame 使用全局行号作为 index，与 pd.read_csv(chunksize=...) 的行为相同
+    columns: 只读取这些列 (小写列名)，None 表示全部列; 内存映射下未选中的列不会被复制
+    """
+
+    def __init__(self, path, chunksize, columns=None):
+        self.chunksize = chunksize
+        self.columns = columns
+        self._source = pa.memory_map(path, 'r')
+        self._reader = ipc.open_file(self._source)
+        self._next_batch = 0
+        self._pending = [] # 已读取但尚未返回的 RecordBatch
+        self._pending_rows = 0
+        self._row_offset = 0
+
+    def get_chunk(self, size=None):
+        size = size or self.chunksize
+        while self._pending_rows < size and self._next_batch < self._reader.num_record_batches:
+            batch = self._reader.get_batch(self._next_batch)
+            self._next_batch += 1
+            self._pending.append(batch)
+            self._pending_rows += batch.num_rows
+        if self._pending_rows == 0:
+            raise StopIteration
+
+        table = pa.Table.from_batches(self._pending, schema=self._reader.schema)
+        chunk = table.slice(0, size)
+        rest = table.slice(size)
+        self._pending = rest.to_batches()
+        self._pending_rows = rest.num_rows
+
+        if self.columns is not None:
+            chunk = chunk.select(self.columns)
+        chunk_df = chunk.to_pandas()
+        chunk_df.index = pd.RangeIndex(self._row_offset, self._row_offset + len(chunk_df))
+        self._row_offset += len(chunk_df)
+        return chunk_df
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.get_chunk()
+            except StopIteration:
+                return
+
+    def close(self):
+        self._source.close()
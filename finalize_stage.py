@@ -0,0 +1,177 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import json
+import psutil
+from ingest_utils import get_path_size, get_process_write_bytes
+
+# --- 导入后的收尾阶段 ---
+# 最后一块插入之后，表还需要 CHECKPOINT / ANALYZE / 建索引等步骤才能高效查询。
+# 每一步单独记录一行 (status = 'FINALIZE'): 耗时、进程写入字节、数据库大小变化、步骤期间的峰值 RSS；
+# 最后记录一行 'FINALIZE_SUMMARY'，给出从开始导入到可以查询的总时间 (time_to_queryable_seconds)。
+
+
+class PeakRssSampler:
+    """在后台线程中每隔 interval_seconds 采样进程 RSS，记录 with 块期间的峰值"""
+
+    def __init__(self, interval_seconds=0.05):
+        self.interval_seconds = interval_seconds
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+
+def _storage_bytes(db_paths):
+    return sum(get_path_size(p) for p in db_paths)
+
+
+def _write_record(log_f, record):
+    log_f.write(json.dumps(record) + '\n')
+    log_f.flush()
+
+
+def run_finalize_step(step, fn, db_paths, log_f):
+    """执行一个收尾步骤并记录一行日志；fn 返回的 dict 会合并进日志记录，其他返回值忽略"""
+    print(f"收尾步骤: {step} ...")
+    bytes_before = _storage_bytes(db_paths)
+    write_before = get_process_write_bytes()
+    start_time = time.time()
+    with PeakRssSampler() as sampler:
+        try:
+            result = fn()
+            details = result if isinstance(result, dict) else {}
+            status = 'FINALIZE'
+        except Exception as e:
+            print(f"收尾步骤 {step} 发生错误: {e}")
+            details = {'error': str(e)}
+            status = 'FINALIZE_ERROR'
+    duration = time.time() - start_time
+    write_after = get_process_write_bytes()
+    record = {
+        'timestamp': datetime.now().isoformat(),
+        'status': status,
+        'step': step,
+        'duration_seconds': round(duration, 4),
+        'process_write_bytes': write_after - write_before if write_before >= 0 else -1,
+        'db_bytes_before': bytes_before,
+        'db_bytes_after': _storage_bytes(db_paths),
+        'peak_rss_bytes': sampler.peak,
+        **details,
+    }
+    _write_record(log_f, record)
+    print(f"  -> {step}: {duration:.4f} 秒，写入 {record['process_write_bytes'] / 1024 / 1024:.2f} MB，峰值 RSS {sampler.peak / 1024 / 1024:.1f} MB")
+    return record
+
+
+def run_parallel_finalize_steps(group, steps, db_paths, log_f, max_workers=None):
+    """并行执行互相独立的步骤 (例如同一张表上的多个 CREATE INDEX)
+
+    steps: {步骤名: fn}。每个步骤单独记录耗时；写入字节和峰值 RSS 是整个进程的，只能按组记录
+    """
+    print(f"并行收尾步骤 ({group}): {', '.join(steps)} ...")
+    bytes_before = _storage_bytes(db_paths)
+    write_before = get_process_write_bytes()
+    durations, errors = {}, {}
+
+    def timed(step, fn):
+        step_start = time.time()
+        try:
+            fn()
+        except Exception as e:
+            print(f"收尾步骤 {step} 发生错误: {e}")
+            errors[step] = str(e)
+        durations[step] = time.time() - step_start
+
+    start_time = time.time()
+    with PeakRssSampler() as sampler:
+        with ThreadPoolExecutor(max_workers=max_workers or len(steps)) as pool:
+            for future in [pool.submit(timed, step, fn) for step, fn in steps.items()]:
+                future.result()
+    duration = time.time() - start_time
+    write_after = get_process_write_bytes()
+
+    for step in steps:
+        record = {'timestamp': datetime.now().isoformat(),
+                  'status': 'FINALIZE_ERROR' if step in errors else 'FINALIZE',
+                  'step': step, 'parallel_group': group,
+                  'duration_seconds': round(durations[step], 4)}
+        if step in errors:
+            record['error'] = errors[step]
+        _write_record(log_f, record)
+    record = {
+        'timestamp': datetime.now().isoformat(),
+        'status': 'FINALIZE',
+        'step': group,
+        'parallel_steps': list(steps),
+        'failed_steps': sorted(errors),
+        'duration_seconds': round(duration, 4),
+        # 顺序执行的总时间，和 duration_seconds 对比即可看出并行的收益
+        'sum_of_step_seconds': round(sum(durations.values()), 4),
+        'process_write_bytes': write_after - write_before if write_before >= 0 else -1,
+        'db_bytes_before': bytes_before,
+        'db_bytes_after': _storage_bytes(db_paths),
+        'peak_rss_bytes': sampler.peak,
+    }
+    _write_record(log_f, record)
+    print(f"  -> {group}: {duration:.4f} 秒 (各步骤合计 {record['sum_of_step_seconds']:.4f} 秒)，峰值 RSS {sampler.peak / 1024 / 1024:.1f} MB")
+    return record
+
+
+def write_finalize_summary(log_f, run_start_time, finalize_start_time, total_rows, ingest_seconds, records, db_paths):
+    """记录整个收尾阶段的汇总，time_to_queryable_seconds = 从导入开始到收尾结束的墙钟时间
+
+    有步骤最终失败 (finalize_errors 非空) 时表并没有达到可查询状态，time_to_queryable_seconds 为 None
+    """
+    now = time.time()
+    failed = set()
+    for r in records: # 按执行顺序: 之后同名步骤成功 (例如顺序重试) 则不再计为失败
+        failed.update(r.get('failed_steps', []))
+        if r['status'] == 'FINALIZE_ERROR':
+            failed.add(r['step'])
+        else:
+            failed.discard(r['step'])
+    summary = {
+        'timestamp': datetime.now().isoformat(),
+        'status': 'FINALIZE_SUMMARY',
+        'rows': total_rows,
+        'ingest_seconds': round(ingest_seconds, 4), # 各块插入计时窗口之和 (与 total_time_taken_so_far 相同)
+        'ingest_rate_rows_per_sec': round(total_rows / ingest_seconds, 2) if ingest_seconds > 0 else None,
+        'load_wall_seconds': round(finalize_start_time - run_start_time, 4), # 包含 CSV 解析和指标采集
+        'finalize_seconds': round(now - finalize_start_time, 4),
+        'time_to_queryable_seconds': None if failed else round(now - run_start_time, 4),
+        'finalize_steps': {r['step']: r['duration_seconds'] for r in records},
+        'finalize_errors': sorted(failed),
+        'db_bytes_after': _storage_bytes(db_paths),
+    }
+    _write_record(log_f, summary)
+    return summary
+
+
+def print_finalize_summary(summary):
+    if summary['time_to_queryable_seconds'] is None:
+        print(f"收尾步骤失败: {', '.join(summary['finalize_errors'])}，表未达到可查询状态 "
+              f"(导入 {summary['load_wall_seconds']:.4f} 秒 + 收尾 {summary['finalize_seconds']:.4f} 秒)")
+        return
+    print(f"可查询耗时 (time to queryable): {summary['time_to_queryable_seconds']:.4f} 秒 "
+          f"(导入 {summary['load_wall_seconds']:.4f} 秒 + 收尾 {summary['finalize_seconds']:.4f} 秒)")
@@ -0,0 +1,85 @@
+import os
+import sys
+import resource
+import psutil
+
+# --- 导入脚本 (insert_duckdb.py / insert_sqlite.py) 共用的存储统计函数 ---
+
+
+def get_path_size(path):
+    """返回文件大小，或目录下所有文件的总大小 (字节)；路径不存在时返回 0"""
+    if not path or not os.path.exists(path):
+        return 0
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass # 文件可能在遍历期间被引擎删除 (例如 spill 文件)
+    return total
+
+
+def get_process_write_bytes():
+    """当前进程累计写入存储层的字节数 (/proc/<pid>/io 的 write_bytes)，不支持的平台返回 -1"""
+    try:
+        return psutil.Process().io_counters().write_bytes
+    except (AttributeError, psutil.Error, OSError):
+        # macOS 上 psutil 没有 io_counters()
+        return -1
+
+
+def get_process_peak_rss_bytes():
+    """当前进程 RSS 历史最高值 (ru_maxrss; Linux 上单位是 KB，macOS 上是字节)"""
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def get_process_memory():
+    """当前进程的 RSS 和 RSS 历史最高值 (字节)；不同于整机的 memory_used_gb，不包含其他进程"""
+    return {
+        'process_rss_bytes': psutil.Process().memory_info().rss,
+        'process_peak_rss_bytes': get_process_peak_rss_bytes(),
+    }
+
+
+def get_storage_metrics(db_file, wal_files=(), temp_path=None):
+    """获取数据库文件、WAL/日志文件和临时目录的当前大小 (字节)
+
+    temp_path 为 None 表示该引擎没有可观测的临时目录，temp_bytes 记为 None
+    """
+    return {
+        'db_file_bytes': get_path_size(db_file),
+        'wal_bytes': sum(get_path_size(p) for p in wal_files),
+        'temp_bytes': get_path_size(temp_path) if temp_path else None,
+    }
+
+
+def write_amplification(written_bytes, logical_bytes):
+    """写放大 = 进程实际写入字节 / 逻辑导入字节 (原始 CSV 字节)，无法计算时返回 None"""
+    if written_bytes is None or written_bytes < 0 or not logical_bytes:
+        return None
+    return round(written_bytes / logical_bytes, 3)
+
+
+# 大小单位 -> 字节数 (DuckDB 的 '4GB' 按 1000 进制，'3.7 GiB' 按 1024 进制)
+_SIZE_UNITS = {
+    'b': 1, 'byte': 1, 'bytes': 1,
+    'kb': 1000, 'mb': 1000**2, 'gb': 1000**3, 'tb': 1000**4,
+    'kib': 1024, 'mib': 1024**2, 'gib': 1024**3, 'tib': 1024**4,
+}
+
+
+def parse_size_to_bytes(size_str):
+    """将 '4GB'、'256MB'、'3.7 GiB' 这类大小字符串转换为字节数，无法解析时返回 None"""
+    if size_str is None:
+        return None
+    text = str(size_str).strip().lower()
+    number = text.rstrip('abcdefghijklmnopqrstuvwxyz').strip()
+    unit = text[len(number):].strip() or 'b'
+    try:
+        return int(float(number) * _SIZE_UNITS[unit])
+    except (ValueError, KeyError):
+        return None
@@ -5,6 +5,14 @@ import json
 from datetime import datetime
 import psutil
 import pandas as pd # 使用 pandas 来分块读取 CSV
+from ingest_utils import get_process_write_bytes, get_storage_metrics, write_amplification, get_path_size, parse_size_to_bytes, get_process_memory
+from memory_governor import MemoryGovernor
+from csv_cache import ensure_parsed_cache, CachedChunkReader
+from chunk_profiler import SlowChunkProfiler
+from memory_attribution import PhaseMemoryTracker
+from column_projection import resolve_projection, estimate_column_byte_share, apply_row_filter, filter_accounting, validate_row_filter
+from finalize_stage import run_finalize_step, run_parallel_finalize_steps, write_finalize_summary, print_finalize_summary
+from verification import IngestVerifier, column_kind, print_verification, DUCKDB_CHECKSUM_SQL
 
 # --- 配置参数 ---
 # CSV 数据文件路径 (使用 Google Drive 挂载路径)
@@ -23,6 +31,43 @@ duckdb_memory_limit = '4GB'; # <<<<<<< 在这里设置 DuckDB 的内存限制 >>
 # SET threads = N 可以限制CPU使用，有助于控制资源
 # duckdb_threads = 2 # <<<<<<< 可选：在这里设置 DuckDB 的线程数限制 >>>>>>>
 
+# 内存压力调节器 (见 memory_governor.py): 接近容器/进程内存上限时缩小块大小、降低 DuckDB memory_limit、
+# gc.collect() + CHECKPOINT 或暂停，避免在 --memory=256m 这类受限容器中被 OOM kill
+memory_governor_enabled = False # <<<<<<< 在这里开启内存压力调节器 >>>>>>>
+# 开启调节器时 DuckDB 的 memory_limit 取 min(duckdb_memory_limit, 容器内存上限 × 该比例)
+memory_governor_duckdb_limit_fraction = 0.5
+# DuckDB 超出 memory_limit 时 spill 到磁盘的临时目录 (None 表示 DuckDB 默认的 <db_file>.tmp)
+duckdb_temp_directory = None
+# 解析后数据集缓存 (见 csv_cache.py): 首次运行把 CSV 解析成带类型的 Arrow IPC 文件，之后的运行内存映射按块读取，
+# 跳过重复的 CSV 解析和 to_datetime / to_numeric 转换; 设为 False 则绕过缓存，测量端到端的解析成本
+use_parsed_cache = False # <<<<<<< 在这里开启解析缓存 >>>>>>>
+parsed_cache_dir = 'data_set/cache'
+# 引擎内部探针: 每 N 个块采样一次 DuckDB 内部状态 (内存、数据库大小、临时文件 spill)，0 表示关闭
+# 探针在计时窗口之外执行，不影响 ingestion_rate_rows_per_sec
+engine_probe_every_n_chunks = 0 # <<<<<<< 例如 10 >>>>>>>
+# 慢块采样分析器 (见 chunk_profiler.py): 对导入线程持续采样调用栈，只为耗时超过滚动窗口动态 p99 的块
+# 保存 collapsed stacks，文件路径写入该块日志的 slow_chunk_profile 字段
+profile_slow_chunks = False # <<<<<<< 在这里开启慢块分析 >>>>>>>
+# 慢块同时保存 tracemalloc 快照: 整个运行期间开启 tracemalloc，会明显拖慢导入，只用于诊断内存
+profile_slow_chunks_trace_memory = False
+slow_chunk_profile_dir = 'log/profiles'
+# 按阶段的内存归因 (见 memory_attribution.py): 在每块的阶段边界记录 RSS、Python 堆 (tracemalloc)、DuckDB duckdb_memory()，
+# 写入日志的 memory_attribution 字段，结束时汇总每个阶段的峰值和保留内存; tracemalloc 会拖慢导入，只用于诊断
+memory_attribution_enabled = False # <<<<<<< 在这里开启内存归因 >>>>>>>
+# 列投影 (见 column_projection.py): 只读取和导入这些列 (不区分大小写)，None 表示全部列
+# 投影下推到 pandas usecols / 解析缓存的 Arrow 列选择，DuckDB 建表时 read_csv_auto 也只包含这些列
+projection_columns = None # <<<<<<< 例如 ['tpep_pickup_datetime', 'trip_distance', 'fare_amount', 'tip_amount', 'total_amount'] >>>>>>>
+# 行过滤: 向量化的 pandas 表达式，在类型转换之前按 CSV 原始单位求值，None 表示不过滤
+row_filter = None # <<<<<<< 例如 'trip_distance > 0' >>>>>>>
+# 导入后的收尾阶段 (见 finalize_stage.py): 建索引 (多个 cursor 并行) + CHECKPOINT，每一步单独记录耗时、写入字节和峰值内存，
+# 并记录 time_to_queryable_seconds (从开始导入到表可以查询)
+finalize_enabled = False # <<<<<<< 在这里开启收尾阶段 >>>>>>>
+# 导入后要建的索引，每个元素是一个索引包含的列
+finalize_index_columns = [['tpep_pickup_datetime'], ['pulocationid', 'dolocationid']]
+# 导入校验 (见 verification.py): 导入时统计每块的行数、NULL 数和与顺序无关的列校验和，结束后与 DuckDB 中的聚合查询对比，
+# 结果记录为一行 'VERIFICATION'，同时报告插入失败丢失的行和被 errors='coerce' 置为 NULL 的值
+verify_enabled = False # <<<<<<< 在这里开启导入校验 >>>>>>>
+
 # 系统信息采样间隔 (每次块插入后记录)
 # psutil.cpu_percent(interval=None) 是非阻塞的，适合在每次块插入后快速获取
 # 如果需要更细粒度的系统采样，可以在单独的线程中进行，但这里简化为每次块插入后采样
@@ -63,12 +108,127 @@ def get_system_metrics():
 
     return metrics
 
+# --- DuckDB 引擎内部探针 ---
+def probe_duckdb_internals(con, db_file):
+    """采样 DuckDB 内部状态: duckdb_memory()、pragma database_size、临时文件 spill 和缓冲区使用率"""
+    probe = {}
+    try:
+        # 按 tag 统计的内存使用 (缓冲区管理器视角)
+        memory_rows = con.execute(
+            "SELECT tag, memory_usage_bytes, temporary_storage_bytes FROM duckdb_memory();").fetchall()
+        probe['memory_by_tag_bytes'] = {tag: usage for tag, usage, _ in memory_rows if usage}
+        probe['buffer_manager_bytes'] = sum(usage for _, usage, _ in memory_rows)
+        probe['temporary_storage_bytes'] = sum(temp for _, _, temp in memory_rows)
+
+        # 数据库块使用情况 (只取主数据库)
+        size_row = con.execute("PRAGMA database_size;").fetchone()
+        if size_row:
+            _, database_size, block_size, total_blocks, used_blocks, free_blocks, wal_size, memory_usage, _ = size_row
+            probe['database_size'] = {
+                'database_size': database_size,
+                'block_size': block_size,
+                'total_blocks': total_blocks,
+                'used_blocks': used_blocks,
+                'free_blocks': free_blocks,
+                'wal_size': wal_size,
+                'memory_usage': memory_usage,
+            }
+
+        # 缓冲区使用率 = 缓冲区管理器占用 / memory_limit
+        memory_limit, temp_directory = con.execute(
+            "SELECT current_setting('memory_limit'), current_setting('temp_directory');").fetchone()
+        memory_limit_bytes = parse_size_to_bytes(memory_limit)
+        probe['memory_limit_bytes'] = memory_limit_bytes
+        if memory_limit_bytes:
+            probe['buffer_manager_usage_ratio'] = round(probe['buffer_manager_bytes'] / memory_limit_bytes, 4)
+
+        # 临时目录中 spill 到磁盘的字节
+        temp_files = con.execute("SELECT size FROM duckdb_temporary_files();").fetchall()
+        probe['temp_files_count'] = len(temp_files)
+        probe['temp_spill_bytes'] = sum(size for (size,) in temp_files)
+        probe['temp_directory_bytes'] = get_path_size(temp_directory or db_file + '.tmp')
+    except Exception as e:
+        print(f"采样 DuckDB 内部状态时发生错误: {e}")
+        probe['error'] = str(e)
+    return probe
+
+
+# --- 内存压力调节器的 DuckDB 释放内存动作 ---
+def relieve_duckdb_memory(con, min_memory_limit_bytes=64 * 1024**2):
+    """将 DuckDB 的 memory_limit 减半 (不低于下限)，再 CHECKPOINT 把 WAL 刷入数据库文件，返回执行的动作"""
+    current_limit = parse_size_to_bytes(con.execute("SELECT current_setting('memory_limit');").fetchone()[0])
+    new_limit = max(current_limit // 2, min_memory_limit_bytes) if current_limit else min_memory_limit_bytes
+    con.execute(f"SET memory_limit = '{new_limit // 1024**2}MiB';")
+    con.execute("CHECKPOINT;")
+    return {'duckdb_memory_limit_before_bytes': current_limit, 'duckdb_memory_limit_after_bytes': new_limit,
+            'checkpoint': True}
+
+
+# --- 导入后的收尾阶段 ---
+def finalize_duckdb(con, db_file, table_name, index_columns, log_f):
+    """用多个 cursor 并行建索引，再 CHECKPOINT 把 WAL 和索引写入数据库文件，返回各步骤的日志记录"""
+    db_paths = [db_file, db_file + '.wal']
+    table_columns = {row[0].lower() for row in con.execute(f"DESCRIBE {table_name};").fetchall()}
+    index_steps = {}
+    for cols in index_columns or []:
+        if not all(c.lower() in table_columns for c in cols):
+            print(f"跳过索引 {cols}: 表 {table_name} 中没有这些列")
+            continue
+        index_name = f"idx_{table_name}_{'_'.join(cols)}"
+        column_list = ', '.join(f'"{c}"' for c in cols)
+
+        def build_index(sql=f"CREATE INDEX {index_name} ON {table_name} ({column_list});"):
+            cursor = con.cursor() # 每个线程使用自己的 cursor
+            try:
+                cursor.execute(sql)
+            finally:
+                cursor.close()
+        index_steps[f"create_index:{index_name}"] = build_index
+
+    records = []
+    if index_steps:
+        group_record = run_parallel_finalize_steps('parallel_index_builds', index_steps, db_paths, log_f)
+        records.append(group_record)
+        # 同一张表上并发 CREATE INDEX 在 DuckDB 1.5 上可以成功 (20 次试验、每次 4 个索引都建成)，其他版本可能报事务冲突:
+        # 失败的索引在主连接上依次重建，重建成功的不计入 finalize_errors
+        for step in group_record['failed_steps']:
+            records.append(run_finalize_step(step, index_steps[step], db_paths, log_f))
+    records.append(run_finalize_step('checkpoint', lambda: con.execute("CHECKPOINT;"), db_paths, log_f))
+    return records
+
+
 # --- 主插入和监控函数 ---
-def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memory_limit): # Added memory_limit parameter
+def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memory_limit, # Added memory_limit parameter
+                       probe_every_n_chunks=0, memory_governor_enabled=False, temp_directory=None,
+                       governor_limit_fraction=0.5, use_parsed_cache=False, parsed_cache_dir='data_set/cache',
+                       profile_slow_chunks=False, profile_dir='log/profiles', profile_trace_memory=False,
+                       memory_attribution_enabled=False, projection_columns=None, row_filter=None,
+                       finalize_enabled=False, finalize_index_columns=None, verify_enabled=False):
+    run_start_time = time.time() # 用于 time_to_queryable (包含解析、插入和收尾)
+    finalize_summary = None
+    verifier = None
+    verification = None
     total_rows_ingested = 0
     total_time_taken = 0
     chunk_index = 0
     prev_disk_io_counters = None # 用于计算块之间的磁盘 I/O 差值
+    temp_directory = temp_directory or db_file + '.tmp' # DuckDB 持久化数据库的默认临时目录
+    governor = None
+    profiler = SlowChunkProfiler(profile_dir, trace_memory=profile_trace_memory) if profile_slow_chunks else None
+    memory_tracker = None
+    source_columns = None # 投影后保留的 CSV 原始列名，None 表示全部列
+    column_byte_share = 1.0 # 保留列占原始 CSV 字节的比例
+    total_rows_dropped = 0
+    total_bytes_dropped = 0
+
+    # 开启内存压力调节器时，把 DuckDB 的 memory_limit 和容器内存上限绑定
+    if memory_governor_enabled:
+        governor = MemoryGovernor(chunk_size)
+        budget = max(governor.memory_budget(governor_limit_fraction), 64 * 1024**2) # 不低于 64MiB
+        configured = parse_size_to_bytes(memory_limit)
+        if configured is None or budget < configured:
+            memory_limit = f"{budget // 1024**2}MiB"
+        print(f"内存压力调节器已开启，DuckDB memory_limit 绑定为: {memory_limit}，临时目录: {temp_directory}")
 
     print(f"开始从 {csv_file} 插入数据到 DuckDB 数据库 {db_file} 的表 {table_name}")
     print(f"日志将记录到 {log_file}")
@@ -84,11 +244,15 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
         # errors='ignore' on read_csv_auto can sometimes help with malformed lines, but might hide data issues
         # Pass configuration options including memory_limit
         config = {'memory_limit': memory_limit}
+        if memory_governor_enabled:
+            config['temp_directory'] = temp_directory # 显式设置 spill 目录，超出 memory_limit 时写盘而不是 OOM
         # if 'duckdb_threads' in globals(): # Add threads to config if set
         #     config['threads'] = duckdb_threads
 
         with duckdb.connect(database=db_file, read_only=False, config=config) as con: # <<<<<<< 在这里传入 config 参数 >>>>>>>
             print("成功连接到 DuckDB 数据库。")
+            if governor is not None:
+                governor.relief_callback = lambda: relieve_duckdb_memory(con)
             # Optionally verify the setting was applied
             # current_mem_limit = con.execute("SELECT current_setting('memory_limit');").fetchone()[0]
             # print(f"DuckDB 报告的当前内存限制: {current_mem_limit}")
@@ -104,10 +268,13 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
             # --- 使用 read_csv_auto 创建表结构 ---
             # LIMIT 0 确保只获取结构而不插入数据
             try:
+                 # 列投影: 只选择保留的列 (按 CSV 中的顺序，与 pandas usecols 读出的列顺序一致)
+                 source_columns = resolve_projection(csv_file, projection_columns)
+                 select_list = ', '.join(f'"{c}"' for c in source_columns) if source_columns else '*'
                  # Add HEADER=TRUE and possibly other options if read_csv_auto struggles
                  con.execute(f"""
                      CREATE TABLE {table_name} AS
-                     SELECT * FROM read_csv_auto('{csv_file}') LIMIT 0;
+                     SELECT {select_list} FROM read_csv_auto('{csv_file}') LIMIT 0;
                  """)
                  print(f"基于 CSV 结构创建了新表 {table_name}。")
             except duckdb.Error as e:
@@ -120,69 +287,181 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                  print(f"创建表时发生未预期的错误: {e}")
                  return
 
+            # 行过滤表达式在导入开始前验证一次，无效时中止导入 (否则每块都会出错，数据会在没有过滤的情况下被导入)
+            try:
+                validate_row_filter(csv_file, row_filter, source_columns)
+            except Exception as e:
+                print(f"{e}，中止导入。")
+                return
+
+            if verify_enabled:
+                verifier = IngestVerifier({name.lower(): column_kind(name.lower(), column_type)
+                                           for name, column_type, *_ in con.execute(f"DESCRIBE {table_name};").fetchall()})
+
 
             # 打开日志文件, 'a' mode for appending
             with open(log_file, 'a', encoding='utf-8') as log_f:
 
                 # 使用 pandas 分块读取 CSV
+                # 以二进制句柄打开 CSV，通过 tell() 统计已读取的原始 CSV 字节 (逻辑导入字节)
+                csv_handle = None
+                csv_iterator = None
+                parsed_cache_meta = None
                 try:
-                    # Read the full CSV in chunks using pandas
-                    # low_memory=False can help with mixed types but uses more memory
-                    # Specify dtypes if possible for better performance and accuracy
-                    csv_iterator = pd.read_csv(csv_file, chunksize=chunk_size, low_memory=False)
-                    print("成功创建 CSV 读取迭代器。")
+                    if use_parsed_cache:
+                        # 从解析缓存读取 (不存在时先构建); 逻辑导入字节按源 CSV 的平均每行字节数折算
+                        cache_file, parsed_cache_meta = ensure_parsed_cache(csv_file, parsed_cache_dir, chunk_size)
+                        csv_iterator = CachedChunkReader(cache_file, chunk_size,
+                                                         columns=[c.lower() for c in source_columns] if source_columns else None)
+                        source_bytes_per_row = parsed_cache_meta['source_bytes'] / max(parsed_cache_meta['rows'], 1)
+                        print(f"成功创建解析缓存读取器: {cache_file}")
+                    else:
+                        csv_handle = open(csv_file, 'rb')
+                        # Read the full CSV in chunks using pandas
+                        # low_memory=False can help with mixed types but uses more memory
+                        # Specify dtypes if possible for better performance and accuracy
+                        csv_iterator = pd.read_csv(csv_handle, chunksize=chunk_size, low_memory=False, usecols=source_columns)
+                        print("成功创建 CSV 读取迭代器。")
+
+                    if source_columns is not None or row_filter:
+                        column_byte_share = estimate_column_byte_share(csv_file, source_columns)
+                        print(f"列投影: {source_columns or '全部列'} (约占原始字节 {column_byte_share:.1%})，行过滤: {row_filter}")
 
                     # 获取初始磁盘 I/O 计数器
                     initial_metrics = get_system_metrics()
                     prev_disk_io_counters = initial_metrics.get('disk_io_counters', None)
 
+                    # 写放大统计的起点: 进程累计写入字节和 CSV 读取位置
+                    run_start_write_bytes = get_process_write_bytes()
+                    prev_process_write_bytes = run_start_write_bytes
+                    prev_csv_pos = 0
+                    total_logical_bytes = 0
+
 
                     # 迭代处理每个数据块
                     print("开始处理数据块...")
-                    for i, chunk_df in enumerate(csv_iterator):
+                    # 开启调节器时按调节器当前的块大小读取 (块大小会随内存压力变化)
+                    chunk_source = governor.iter_chunks(csv_iterator) if governor is not None else csv_iterator
+                    if profiler is not None:
+                        profiler.start()
+                        print(f"慢块分析器已开启，分析文件目录: {profiler.profile_dir}")
+                    if memory_attribution_enabled:
+                        memory_tracker = PhaseMemoryTracker(engine_memory_fn=lambda: con.execute("SELECT sum(memory_usage_bytes) FROM duckdb_memory();").fetchone()[0])
+                        memory_tracker.start()
+                    for i, chunk_df in enumerate(chunk_source):
                         chunk_index = i + 1
                         rows_in_chunk = len(chunk_df)
+                        # 阶段 read: 从上一块写完日志到本块读取/解析完成 (包含上一块的调节器检查和打印)
+                        if memory_tracker is not None:
+                            memory_tracker.mark('read')
+                        # 本块消耗的原始 CSV 字节; 解析器会预读缓冲区，单块值为近似值，累计值是准确的
+                        if parsed_cache_meta is not None:
+                            logical_bytes = round(rows_in_chunk * source_bytes_per_row)
+                        else:
+                            csv_pos = csv_handle.tell()
+                            logical_bytes = csv_pos - prev_csv_pos
+                            prev_csv_pos = csv_pos
 
                         if rows_in_chunk == 0:
                             print(f"块 {chunk_index} 为空，跳过。")
+                            # 结束本块的慢块分析和内存归因，否则本块的耗时和内存会被算到下一块
+                            if profiler is not None:
+                                profiler.end_chunk(chunk_index)
+                            if memory_tracker is not None:
+                                memory_tracker.end_chunk('read')
                             continue
 
                         # Convert pandas column names to lowercase for consistency with DuckDB
                         chunk_df.columns = chunk_df.columns.str.lower()
 
+                        # --- 行过滤 (向量化，在类型转换之前，计时窗口之外) ---
+                        rows_read = rows_in_chunk
+                        rows_dropped = 0
+                        if row_filter:
+                            try:
+                                chunk_df, rows_dropped = apply_row_filter(chunk_df, row_filter)
+                            except Exception as filter_error:
+                                # 表达式已在开始前验证过，这里出错说明本块数据有问题: 记录为 ERROR 并跳过，
+                                # 不能在没有过滤的情况下插入整块
+                                print(f"块 {chunk_index} 行过滤时发生错误: {filter_error}")
+                                log_entry = {'timestamp': datetime.now().isoformat(), 'chunk_index': chunk_index,
+                                             'status': 'ERROR', 'error': f"row filter: {filter_error}",
+                                             'rows_attempted': rows_in_chunk}
+                                slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                                if slow_chunk_profile is not None:
+                                    log_entry['slow_chunk_profile'] = slow_chunk_profile
+                                if memory_tracker is not None:
+                                    log_entry['memory_attribution'] = memory_tracker.end_chunk('filter')
+                                if verifier is not None:
+                                    verifier.add_failed_chunk(rows_in_chunk)
+                                log_f.write(json.dumps(log_entry) + '\n')
+                                log_f.flush()
+                                print(f"  -> 块 {chunk_index} 已跳过。")
+                                continue
+                            rows_in_chunk = len(chunk_df)
+                        chunk_filter_accounting = None
+                        if source_columns is not None or row_filter:
+                            chunk_filter_accounting = filter_accounting(rows_read, rows_dropped, logical_bytes,
+                                                                        column_byte_share, len(chunk_df.columns))
+                            total_rows_dropped += rows_dropped
+                            total_bytes_dropped += chunk_filter_accounting['bytes_dropped']
+                        if rows_in_chunk == 0:
+                            # 整块都被过滤掉: 不插入，单独记录一行
+                            total_logical_bytes += logical_bytes
+                            log_entry = {'timestamp': datetime.now().isoformat(), 'chunk_index': chunk_index,
+                                         'status': 'FILTERED_OUT', 'filter_accounting': chunk_filter_accounting}
+                            # 结束本块的慢块分析和内存归因，否则本块的耗时和内存会被算到下一块
+                            slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                            if slow_chunk_profile is not None:
+                                log_entry['slow_chunk_profile'] = slow_chunk_profile
+                            if memory_tracker is not None:
+                                log_entry['memory_attribution'] = memory_tracker.end_chunk('filter')
+                            log_f.write(json.dumps(log_entry) + '\n')
+                            log_f.flush()
+                            print(f"块 {chunk_index} 的 {rows_read} 行全部被过滤，跳过。")
+                            continue
+                        # 导入校验: 类型转换之前的 NULL 数，用来统计被 errors='coerce' 置为 NULL 的值
+                        raw_nulls = verifier.raw_null_counts(chunk_df) if verifier is not None else None
+
                         # --- 可选：数据类型清理 ---
                         # 根据你的 CSV 数据，你可能需要在这里对 chunk_df 的列进行类型转换
                         # 如果 CSV 某列有混合类型，pandas 可能将其读成 'object'，插入 DuckDB 时可能出错
                         # 使用errors='coerce'将无法转换的值变为NaN (对于数字) 或 NaT (对于日期时间)，它们在DuckDB中会变成NULL
-                        try:
-                            # Check common datetime column names for taxi data
-                            datetime_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'pickup_datetime', 'dropoff_datetime']
-                            for col in datetime_cols:
-                                if col in chunk_df.columns:
-                                     # Ensure column is treated as string/object before to_datetime
-                                     chunk_df[col] = chunk_df[col].astype(str) # Cast to string first
-                                     # *** Specify format if possible to avoid UserWarning and speed up parsing ***
-                                     # Example for "YYYY-MM-DD HH:MM:SS" like in your output sample:
-                                     # chunk_df[col] = pd.to_datetime(chunk_df[col], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-                                     # Default parsing if format varies or is unknown:
-                                     chunk_df[col] = pd.to_datetime(chunk_df[col], errors='coerce') # coerce invalid parsing to NaT (DuckDB NULL)
-
-                            # Check common numeric column names
-                            numeric_cols = ['vendorid', 'passenger_count', 'trip_distance', 'ratecodeid', 'pulocationid',
-                                            'dolocationid', 'payment_type', 'fare_amount', 'extra', 'mta_tax',
-                                            'tip_amount', 'tolls_amount', 'improvement_surcharge', 'total_amount',
-                                            'congestion_surcharge', 'airport_fee'] # Add/remove based on your CSV
-                            for col in numeric_cols:
-                                 if col in chunk_df.columns:
-                                     # Ensure column is treated as string/object before to_numeric
-                                     chunk_df[col] = chunk_df[col].astype(str) # Cast to string first
-                                     chunk_df[col] = pd.to_numeric(chunk_df[col], errors='coerce') # coerce invalid parsing to NaN (DuckDB NULL)
-
-                        except Exception as cast_error:
-                             print(f"Warning: Data type casting error in chunk {chunk_index}: {cast_error}")
-                             # You might want to log this warning but continue unless casting is critical
-
-
+                        # 解析缓存中的数据已经是目标类型，跳过 CSV 类型转换
+                        if parsed_cache_meta is None:
+                            try:
+                                # Check common datetime column names for taxi data
+                                datetime_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'pickup_datetime', 'dropoff_datetime']
+                                for col in datetime_cols:
+                                    if col in chunk_df.columns:
+                                         # Ensure column is treated as string/object before to_datetime
+                                         chunk_df[col] = chunk_df[col].astype(str) # Cast to string first
+                                         # *** Specify format if possible to avoid UserWarning and speed up parsing ***
+                                         # Example for "YYYY-MM-DD HH:MM:SS" like in your output sample:
+                                         # chunk_df[col] = pd.to_datetime(chunk_df[col], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+                                         # Default parsing if format varies or is unknown:
+                                         chunk_df[col] = pd.to_datetime(chunk_df[col], errors='coerce') # coerce invalid parsing to NaT (DuckDB NULL)
+
+                                # Check common numeric column names
+                                numeric_cols = ['vendorid', 'passenger_count', 'trip_distance', 'ratecodeid', 'pulocationid',
+                                                'dolocationid', 'payment_type', 'fare_amount', 'extra', 'mta_tax',
+                                                'tip_amount', 'tolls_amount', 'improvement_surcharge', 'total_amount',
+                                                'congestion_surcharge', 'airport_fee'] # Add/remove based on your CSV
+                                for col in numeric_cols:
+                                     if col in chunk_df.columns:
+                                         # Ensure column is treated as string/object before to_numeric
+                                         chunk_df[col] = chunk_df[col].astype(str) # Cast to string first
+                                         chunk_df[col] = pd.to_numeric(chunk_df[col], errors='coerce') # coerce invalid parsing to NaN (DuckDB NULL)
+
+                            except Exception as cast_error:
+                                 print(f"Warning: Data type casting error in chunk {chunk_index}: {cast_error}")
+                                 # You might want to log this warning but continue unless casting is critical
+
+
+                        # 导入校验: 按插入的数据统计行数、NULL 数和列校验和 (向量化，计时窗口之外)
+                        verification_stats = verifier.chunk_stats(chunk_df, raw_nulls) if verifier is not None else None
+                        if memory_tracker is not None:
+                            memory_tracker.mark('cast')
                         print(f"处理块 {chunk_index} ({rows_in_chunk} 行)...")
 
                         # --- 插入数据块并计时 ---
@@ -210,6 +489,13 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                                 'end_time_utc': time.time(),
                                 'system_metrics_at_error': get_system_metrics() # 记录出错时的系统状态
                              }
+                             slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                             if slow_chunk_profile is not None:
+                                 log_entry['slow_chunk_profile'] = slow_chunk_profile
+                             if memory_tracker is not None:
+                                 log_entry['memory_attribution'] = memory_tracker.end_chunk('insert')
+                             if verifier is not None:
+                                 verifier.add_failed_chunk(rows_in_chunk)
                              log_f.write(json.dumps(log_entry) + '\n')
                              log_f.flush() # Ensure log is written immediately
                              # In case of data type errors, inspecting the first few rows of the chunk might help
@@ -220,11 +506,14 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
 
                         end_time = time.time()
                         time_taken_chunk = end_time - start_time
+                        if memory_tracker is not None:
+                            memory_tracker.mark('insert')
                         # Avoid division by zero if time taken is negligible
                         time_taken_chunk = max(time_taken_chunk, 0.0001)
 
                         total_time_taken += time_taken_chunk
                         total_rows_ingested += rows_in_chunk
+                        total_logical_bytes += logical_bytes
 
                         # --- 计算速率 ---
                         # 速率 = 行数 / 时间 (秒)
@@ -250,6 +539,29 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                              disk_io_delta['write_count_delta'] = 0
 
 
+                        # --- 存储增长和写放大统计 (在计时窗口之外) ---
+                        # 进程写入字节按 "自上一块以来" 统计，包含引擎后台线程的写入
+                        process_write_bytes = get_process_write_bytes()
+                        chunk_write_bytes = process_write_bytes - prev_process_write_bytes if process_write_bytes >= 0 else -1
+                        total_write_bytes = process_write_bytes - run_start_write_bytes if process_write_bytes >= 0 else -1
+                        prev_process_write_bytes = process_write_bytes
+                        storage_metrics = get_storage_metrics(db_file, [db_file + '.wal'], temp_directory)
+
+                        # --- 引擎内部探针 (每 N 个块采样一次，计时窗口之外) ---
+                        engine_probe = None
+                        if probe_every_n_chunks and chunk_index % probe_every_n_chunks == 0:
+                            probe_start = time.time()
+                            engine_probe = probe_duckdb_internals(con, db_file)
+                            engine_probe['probe_time_seconds'] = round(time.time() - probe_start, 4)
+
+                        # --- 慢块分析: 本块耗时超过动态 p99 时保存调用栈和内存快照 ---
+                        slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+
+                        chunk_verification = verifier.add_chunk(verification_stats) if verifier is not None else None
+
+                        # 阶段 metrics: 系统指标、存储统计、探针和慢块分析
+                        memory_attribution = memory_tracker.end_chunk('metrics') if memory_tracker is not None else None
+
                         # --- 记录日志 ---
                         log_entry = {
                             'timestamp': datetime.now().isoformat(), # Use log write time
@@ -264,6 +576,7 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                                  'cpu_percent': post_insert_metrics.get('cpu_percent', -1),
                                  'memory_percent': post_insert_metrics.get('memory_percent', -1),
                                  'memory_used_gb': post_insert_metrics.get('memory_used_gb', -1),
+                                 **get_process_memory(), # 本进程的 RSS 和 RSS 历史最高值，不受其他进程影响
                                  # You could also log post_insert_metrics['disk_io_counters'] here if needed
                              },
                             'disk_io_delta_during_chunk_bytes': {
@@ -273,10 +586,37 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                             'disk_io_delta_during_chunk_count': {
                                 'read': disk_io_delta['read_count_delta'],
                                 'write': disk_io_delta['write_count_delta']
+                            },
+                            'storage_accounting': {
+                                'logical_bytes_ingested': logical_bytes,
+                                'total_logical_bytes_ingested_so_far': total_logical_bytes,
+                                'db_file_bytes': storage_metrics['db_file_bytes'],
+                                'wal_bytes': storage_metrics['wal_bytes'],
+                                'temp_bytes': storage_metrics['temp_bytes'],
+                                'process_write_bytes_during_chunk': chunk_write_bytes,
+                                'total_process_write_bytes_so_far': total_write_bytes,
+                                'write_amplification': write_amplification(chunk_write_bytes, logical_bytes),
+                                'cumulative_write_amplification': write_amplification(total_write_bytes, total_logical_bytes),
                             }
                         }
+                        if engine_probe is not None:
+                            log_entry['engine_probe'] = engine_probe
+                        if slow_chunk_profile is not None:
+                            log_entry['slow_chunk_profile'] = slow_chunk_profile
+                        if memory_attribution is not None:
+                            log_entry['memory_attribution'] = memory_attribution
+                        if chunk_filter_accounting is not None:
+                            log_entry['filter_accounting'] = chunk_filter_accounting
+                        if chunk_verification is not None:
+                            log_entry['verification'] = chunk_verification
 
                         log_f.write(json.dumps(log_entry) + '\n') # Write one JSON object per line
+
+                        # --- 内存压力检查 (计时窗口之外)，每次干预单独记录一行 ---
+                        if governor is not None:
+                            for governor_record in governor.check(chunk_index):
+                                log_f.write(json.dumps(governor_record) + '\n')
+                                print(f"  -> 内存调节: {governor_record['action']} (内存占用 {governor_record['memory_usage_ratio']:.1%}, 块大小 {governor_record['chunk_size']})")
                         log_f.flush() # Ensure data is written to file immediately
 
                         # --- Print current progress and rate ---
@@ -284,6 +624,11 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                         print(f"  -> 累计插入: {total_rows_ingested} 行，总耗时: {total_time_taken:.4f} 秒。")
                         print(f"  -> CPU: {log_entry['system_metrics_after_chunk'].get('cpu_percent', -1):.1f}%, Mem: {log_entry['system_metrics_after_chunk'].get('memory_percent', -1):.1f}% ({log_entry['system_metrics_after_chunk'].get('memory_used_gb', -1):.2f} GB used)")
                         print(f"  -> Disk I/O (this chunk): Read {disk_io_delta['read_bytes_delta']/1024/1024:.2f} MB, Write {disk_io_delta['write_bytes_delta']/1024/1024:.2f} MB")
+                        print(f"  -> 存储: DB {storage_metrics['db_file_bytes']/1024/1024:.2f} MB, WAL {storage_metrics['wal_bytes']/1024/1024:.2f} MB, 累计写放大 {log_entry['storage_accounting']['cumulative_write_amplification']}")
+                        if engine_probe is not None and 'error' not in engine_probe:
+                            print(f"  -> DuckDB 探针: 缓冲区 {engine_probe['buffer_manager_bytes']/1024/1024:.2f} MB (占 memory_limit {engine_probe.get('buffer_manager_usage_ratio', 0):.1%}), Spill {engine_probe['temp_spill_bytes']/1024/1024:.2f} MB")
+                        if slow_chunk_profile is not None:
+                            print(f"  -> 慢块: {slow_chunk_profile['chunk_wall_seconds']:.4f} 秒 > p99 {slow_chunk_profile['threshold_seconds']:.4f} 秒，分析文件: {slow_chunk_profile['collapsed_stacks_file']}")
 
 
                 except pd.errors.EmptyDataError:
@@ -292,9 +637,39 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
                     print(f"错误: CSV 文件未找到在 {csv_file}")
                 except Exception as e:
                     print(f"读取或处理 CSV 块时发生意外错误: {e}")
+                finally:
+                    if profiler is not None:
+                        profiler.stop()
+                    if memory_tracker is not None:
+                        memory_tracker.stop()
+                        # 整个运行的阶段汇总单独记录一行
+                        log_f.write(json.dumps({'timestamp': datetime.now().isoformat(),
+                                                'status': 'MEMORY_ATTRIBUTION_SUMMARY',
+                                                'phases': memory_tracker.summary()}) + '\n')
+                    if csv_handle is not None:
+                        csv_handle.close()
+                    if parsed_cache_meta is not None and csv_iterator is not None:
+                        csv_iterator.close()
 
             print("\n所有数据块处理完毕。")
 
+            # --- 收尾阶段: 让表可以高效查询所需的步骤，每一步单独记录 ---
+            if finalize_enabled:
+                print("\n开始收尾阶段...")
+                finalize_start_time = time.time()
+                with open(log_file, 'a', encoding='utf-8') as log_f:
+                    finalize_records = finalize_duckdb(con, db_file, table_name, finalize_index_columns, log_f)
+                    finalize_summary = write_finalize_summary(log_f, run_start_time, finalize_start_time,
+                                                              total_rows_ingested, total_time_taken,
+                                                              finalize_records, [db_file, db_file + '.wal'])
+
+            # --- 导入校验: 聚合查询下推到 DuckDB，与导入时的输入端统计对比 ---
+            if verifier is not None:
+                print("\n开始导入校验...")
+                with open(log_file, 'a', encoding='utf-8') as log_f:
+                    verification = verifier.verify(con, table_name, DUCKDB_CHECKSUM_SQL, total_rows_dropped)
+                    log_f.write(json.dumps(verification) + '\n')
+
         # Database connection is closed automatically when exiting the 'with' block
         print("DuckDB 连接已关闭。")
 
@@ -310,6 +685,18 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
         print(f"总共插入行数: {total_rows_ingested}")
         print(f"总耗时: {total_time_taken:.4f} 秒")
         print(f"整体平均插入速率: {overall_avg_rate:.2f} 行/秒")
+        if governor is not None:
+            print(f"内存调节器干预次数: {governor.interventions}")
+        if profiler is not None:
+            print(f"慢块分析文件: {profiler.profiles_written} 个，目录: {profiler.profile_dir}")
+        if memory_tracker is not None:
+            memory_tracker.print_summary()
+        if source_columns is not None or row_filter:
+            print(f"投影/过滤丢弃: {total_rows_dropped} 行，约 {total_bytes_dropped / 1024 / 1024:.2f} MB 原始 CSV 字节")
+        if verification is not None:
+            print_verification(verification)
+        if finalize_summary is not None:
+            print_finalize_summary(finalize_summary)
         print(f"详细日志已保存到: {log_file}")
         print("请检查日志文件分析插入速率下降的原因，并结合系统监控数据（CPU、内存、磁盘 I/O）。")
 
@@ -317,4 +704,14 @@ def ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, memo
 # --- Run script ---
 if __name__ == "__main__":
     # Pass the memory_limit to the ingestion function
-    ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, duckdb_memory_limit)
+    ingest_and_monitor(csv_file, db_file, table_name, log_file, chunk_size, duckdb_memory_limit,
+                       probe_every_n_chunks=engine_probe_every_n_chunks,
+                       memory_governor_enabled=memory_governor_enabled, temp_directory=duckdb_temp_directory,
+                       governor_limit_fraction=memory_governor_duckdb_limit_fraction,
+                       use_parsed_cache=use_parsed_cache, parsed_cache_dir=parsed_cache_dir,
+                       profile_slow_chunks=profile_slow_chunks, profile_dir=slow_chunk_profile_dir,
+                       profile_trace_memory=profile_slow_chunks_trace_memory,
+                       memory_attribution_enabled=memory_attribution_enabled,
+                       projection_columns=projection_columns, row_filter=row_filter,
+                       finalize_enabled=finalize_enabled, finalize_index_columns=finalize_index_columns,
+                       verify_enabled=verify_enabled)
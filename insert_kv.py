@@ -0,0 +1,444 @@
+import os
+import dbm
+import json
+import time
+import shutil
+from datetime import datetime
+import psutil
+import numpy as np
+import pandas as pd # 使用 pandas 来分块读取 CSV
+from ingest_utils import get_process_write_bytes, get_path_size, write_amplification, get_process_memory
+from csv_cache import coerce_chunk, datetime_cols, numeric_cols
+
+# --- 配置参数 ---
+# CSV 数据文件路径
+csv_file = 'data_set/2023_Yellow_Taxi_Trip_Data.csv'
+# 日志文件路径 (每行一个 JSON 对象，字段与 insert_duckdb.py / insert_sqlite.py 相同)
+log_file = 'log/ingestion_log_kv.jsonl'
+# KV 存储目录 (和 RocksDB 一样，一个数据库是一个目录)
+kv_dir = 'db/taxi_kv'
+# CSV 读取和批量写入的块大小 (行数)
+chunk_size = 10000
+# 存储后端: 'log' (追加写日志文件 + 内存索引) 或 'dbm' (标准库 dbm，优先 gdbm，其次 ndbm / dbm.dumb)
+kv_backend = 'log' # <<<<<<< 在这里切换 KV 后端 >>>>>>>
+# 值编码: 'struct' (定长 NumPy 记录，向量化编码) 或 'json' (每行一个带类型的 JSON 对象)
+# 两种编码使用同样的键、后端和类型转换后的数据，对比二者即可得到 JSON 序列化本身的成本
+# (insert_rocksdb.cpp 把原始 CSV 字符串写成 JSON，值的字节数与这里的 'json' 编码不能直接比较)
+kv_value_encoding = 'struct' # <<<<<<< 在这里切换值编码 >>>>>>>
+# 每批写入后是否 fsync (log 后端)；False 时只 flush 到操作系统页缓存
+kv_fsync_each_batch = False
+
+# --- 确保目录存在 ---
+log_dir = os.path.dirname(log_file)
+os.makedirs(log_dir, exist_ok=True)
+print(f"确保日志目录存在: {log_dir}")
+
+
+# --- 获取系统资源信息的函数 ---
+def get_system_metrics():
+    """获取当前的系统资源使用情况，不计算delta，只获取当前值"""
+    metrics = {}
+    try:
+        # CPU 使用率 (瞬时)
+        metrics['cpu_percent'] = psutil.cpu_percent(interval=None)
+
+        # 内存使用率
+        mem = psutil.virtual_memory()
+        metrics['memory_percent'] = mem.percent
+        metrics['memory_used_gb'] = round(mem.used / (1024**3), 2)
+        metrics['memory_available_gb'] = round(mem.available / (1024**3), 2)
+
+        # 磁盘 I/O 计数器
+        metrics['disk_io_counters'] = psutil.disk_io_counters()
+
+    except Exception as e:
+        print(f"获取系统指标时发生错误: {e}")
+        # 返回部分或空指标，避免程序中断
+        metrics['error'] = str(e)
+        if 'cpu_percent' not in metrics: metrics['cpu_percent'] = -1
+        if 'memory_percent' not in metrics: metrics['memory_percent'] = -1
+        metrics['disk_io_counters'] = None # 如果获取失败，设置为 None
+
+    return metrics
+
+
+# --- 键和值的编码 ---
+# 键: 全局行号的 8 字节大端无符号整数，字节序和数值顺序一致 (可排序，不像 "row_10" < "row_9")
+KEY_DTYPE = np.dtype('>u8')
+# 定长记录中时间列的 NULL (NaT 的 int64 表示)
+NULL_TIMESTAMP = np.iinfo(np.int64).min
+# 定长记录中文本列的 NULL: 单个 0xFF 字节 (不会出现在合法的 UTF-8 中，和空字符串 b'' 区分开)
+NULL_TEXT = b'\xff'
+
+
+def build_record_dtype(columns, string_widths):
+    """定长记录的 NumPy dtype: 时间列 -> int64 (epoch 微秒)，数值列 -> float64 (NaN 即 NULL)，其余 -> 定长字节串"""
+    fields = []
+    for col in columns:
+        if col in datetime_cols:
+            fields.append((col, '<i8'))
+        elif col in numeric_cols:
+            fields.append((col, '<f8'))
+        else:
+            fields.append((col, f'S{string_widths.get(col, 1)}'))
+    return np.dtype(fields)
+
+
+def sample_string_widths(csv_file, sample_rows=10000):
+    """用前 sample_rows 行确定文本列的定长宽度 (UTF-8 字节)；之后超出宽度的值由 encode_values_struct 报错，不会被截断"""
+    sample = pd.read_csv(csv_file, nrows=sample_rows, dtype=str, keep_default_na=False)
+    sample.columns = sample.columns.str.lower()
+    return {col: max(int(sample[col].str.encode('utf-8').str.len().max() or 1), 1)
+            for col in sample.columns if col not in datetime_cols and col not in numeric_cols}
+
+
+def encode_keys(first_row_id, count):
+    return np.arange(first_row_id, first_row_id + count, dtype=np.uint64).astype(KEY_DTYPE)
+
+
+def encode_values_struct(chunk_df, record_dtype):
+    """把 (已转换类型的) 数据块向量化编码成定长记录数组"""
+    records = np.empty(len(chunk_df), dtype=record_dtype)
+    for col in record_dtype.names:
+        if col in datetime_cols:
+            records[col] = chunk_df[col].to_numpy(dtype='datetime64[us]').view('i8') # NaT -> NULL_TIMESTAMP
+        elif col in numeric_cols:
+            records[col] = chunk_df[col].to_numpy(dtype='f8', na_value=np.nan)
+        else:
+            is_null = chunk_df[col].isna().to_numpy()
+            encoded = np.char.encode(chunk_df[col].fillna('').to_numpy(dtype=str), 'utf-8')
+            width = record_dtype[col].itemsize
+            if encoded.dtype.itemsize > width: # NumPy 赋值时会静默截断，先检查
+                too_long = np.char.str_len(encoded) > width
+                raise ValueError(f"列 {col} 有 {int(too_long.sum())} 个值超过定长宽度 {width} 字节 "
+                                 f"(最长 {encoded.dtype.itemsize} 字节)，请增大 sample_string_widths 的 sample_rows")
+            encoded[is_null] = NULL_TEXT
+            records[col] = encoded
+    return records
+
+
+def encode_values_json(chunk_df):
+    """每行一个带类型的 JSON 对象 (数值为数字，时间为 ISO 字符串，NULL 为 null)，返回 bytes 列表
+
+    insert_rocksdb.cpp 的 j.dump() 把所有字段写成原始 CSV 字符串，两者的值不相同
+    """
+    lines = chunk_df.to_json(orient='records', lines=True, date_format='iso', date_unit='s')
+    return [line.encode('utf-8') for line in lines.splitlines()]
+
+
+def decode_value_struct(value, record_dtype):
+    """把一个定长记录解码成 dict (用于抽查)"""
+    record = np.frombuffer(value, dtype=record_dtype)[0]
+    row = {}
+    for col in record_dtype.names:
+        v = record[col]
+        if col in datetime_cols:
+            row[col] = None if v == NULL_TIMESTAMP else str(np.datetime64(int(v), 'us'))
+        elif col in numeric_cols:
+            row[col] = None if np.isnan(v) else float(v)
+        else:
+            row[col] = None if v == NULL_TEXT else v.decode('utf-8')
+    return row
+
+
+# --- KV 存储后端 ---
+class AppendOnlyLogStore:
+    """追加写的日志结构 KV 存储
+
+    数据文件 data.log 由记录顺序组成: [键 8 字节大端][值长度 4 字节大端][值]
+    内存索引保存每条记录的键和偏移 (NumPy 数组，每行 16 字节)，同一个键以最后一次写入为准；
+    close() 时把索引写入 index.npy，重启时可以直接加载而不必扫描日志
+    """
+
+    def __init__(self, path, fsync_each_batch=False):
+        os.makedirs(path, exist_ok=True)
+        self.data_path = os.path.join(path, 'data.log')
+        self.index_path = os.path.join(path, 'index.npy')
+        self.fsync_each_batch = fsync_each_batch
+        self._f = open(self.data_path, 'ab')
+        self._offset = self._f.tell()
+        self._index_keys = [] # 每批一个 uint64 数组
+        self._index_offsets = []
+        self._index = None # 合并后的 (keys, offsets)，get() 时按需生成
+
+    def write_batch(self, keys, values):
+        """一次写入一批记录 (一次 write 调用)；values 为定长记录数组或 bytes 列表
+
+        返回键值字节 (键 + 值，不含 4 字节长度头)，与 DbmStore.write_batch 的定义相同
+        """
+        count = len(keys)
+        if isinstance(values, np.ndarray):
+            value_size = values.dtype.itemsize
+            block = np.empty(count, dtype=[('key', KEY_DTYPE), ('length', '>u4'), ('value', f'V{value_size}')])
+            block['key'] = keys
+            block['length'] = value_size
+            block['value'] = values.view(f'V{value_size}')
+            payload = block.tobytes()
+            offsets = self._offset + np.arange(count, dtype=np.uint64) * block.dtype.itemsize
+            kv_bytes = count * (KEY_DTYPE.itemsize + value_size)
+        else:
+            key_bytes = keys.tobytes()
+            lengths = np.array([len(v) for v in values], dtype='>u4')
+            length_bytes = lengths.tobytes()
+            parts = []
+            for i, value in enumerate(values):
+                parts.append(key_bytes[i * 8:(i + 1) * 8])
+                parts.append(length_bytes[i * 4:(i + 1) * 4])
+                parts.append(value)
+            payload = b''.join(parts)
+            record_sizes = lengths.astype(np.uint64) + 12
+            offsets = self._offset + np.concatenate(([0], np.cumsum(record_sizes)[:-1])).astype(np.uint64)
+            kv_bytes = count * KEY_DTYPE.itemsize + int(lengths.sum())
+        self._f.write(payload)
+        self._f.flush()
+        if self.fsync_each_batch:
+            os.fsync(self._f.fileno())
+        self._offset += len(payload)
+        self._index_keys.append(keys.astype(np.uint64))
+        self._index_offsets.append(offsets)
+        self._index = None
+        return kv_bytes
+
+    def get(self, key):
+        if self._index is None:
+            keys = np.concatenate(self._index_keys) if self._index_keys else np.empty(0, dtype=np.uint64)
+            offsets = np.concatenate(self._index_offsets) if self._index_offsets else np.empty(0, dtype=np.uint64)
+            order = np.argsort(keys, kind='stable') # 稳定排序: 相同键中最后写入的排在最后
+            self._index = (keys[order], offsets[order])
+        keys, offsets = self._index
+        pos = np.searchsorted(keys, np.uint64(key), side='right') - 1
+        if pos < 0 or keys[pos] != key:
+            return None
+        with open(self.data_path, 'rb') as f:
+            f.seek(int(offsets[pos]))
+            header = f.read(12)
+            return f.read(int.from_bytes(header[8:12], 'big'))
+
+    def close(self):
+        self._f.close()
+        if self._index_keys:
+            np.save(self.index_path, np.stack([np.concatenate(self._index_keys), np.concatenate(self._index_offsets)]))
+
+
+class DbmStore:
+    """标准库 dbm 存储 (gdbm 时使用 'f' 快速模式，每批结束调用 sync())"""
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+        file_path = os.path.join(path, 'kv')
+        try:
+            self._db = dbm.open(file_path, 'nf') # gdbm: 不在每次写入后同步
+        except (ValueError, *dbm.error): # ndbm / dbm.dumb 不支持 'f'
+            self._db = dbm.open(file_path, 'n')
+        self.implementation = type(self._db).__module__
+
+    def write_batch(self, keys, values):
+        """逐条写入一批记录，返回键值字节 (键 + 值)"""
+        key_bytes = keys.tobytes()
+        if isinstance(values, np.ndarray):
+            value_size = values.dtype.itemsize
+            raw = values.tobytes()
+            values = [raw[i * value_size:(i + 1) * value_size] for i in range(len(keys))]
+        written = 0
+        for i, value in enumerate(values):
+            self._db[key_bytes[i * 8:(i + 1) * 8]] = value
+            written += KEY_DTYPE.itemsize + len(value)
+        if hasattr(self._db, 'sync'):
+            self._db.sync()
+        return written
+
+    def get(self, key):
+        return self._db.get(np.array([key], dtype=KEY_DTYPE).tobytes())
+
+    def close(self):
+        self._db.close()
+
+
+# --- 主插入和监控函数 ---
+def ingest_and_monitor_kv(csv_file, kv_dir, log_file, chunk_size, backend='log', value_encoding='struct',
+                          fsync_each_batch=False):
+    total_rows_ingested = 0
+    total_time_taken = 0
+    total_encode_time = 0
+    total_value_bytes = 0
+    chunk_index = 0
+    store = None
+
+    print(f"开始从 {csv_file} 插入数据到 KV 存储 {kv_dir} (后端: {backend}，值编码: {value_encoding})")
+    print(f"日志将记录到 {log_file}")
+    print(f"块大小 (chunk size): {chunk_size} 行")
+
+    try:
+        # 每次从空目录开始
+        shutil.rmtree(kv_dir, ignore_errors=True)
+        store = AppendOnlyLogStore(kv_dir, fsync_each_batch) if backend == 'log' else DbmStore(kv_dir)
+        if backend != 'log':
+            print(f"使用 dbm 实现: {store.implementation}")
+
+        record_dtype = None
+        if value_encoding == 'struct':
+            header = pd.read_csv(csv_file, nrows=0).columns.str.lower()
+            record_dtype = build_record_dtype(list(header), sample_string_widths(csv_file))
+            print(f"定长记录: {record_dtype.itemsize} 字节/行 (+ 8 字节键)")
+
+        # 打开日志文件, 'a' mode for appending
+        with open(log_file, 'a', encoding='utf-8') as log_f, open(csv_file, 'rb') as csv_handle:
+            # 以二进制句柄读取 CSV，通过 tell() 统计已读取的原始 CSV 字节 (逻辑导入字节)
+            csv_iterator = pd.read_csv(csv_handle, chunksize=chunk_size, low_memory=False)
+            run_start_write_bytes = get_process_write_bytes()
+            prev_process_write_bytes = run_start_write_bytes
+            prev_csv_pos = 0
+            total_logical_bytes = 0
+
+            print("开始处理数据块...")
+            for i, chunk_df in enumerate(csv_iterator):
+                chunk_index = i + 1
+                rows_in_chunk = len(chunk_df)
+                csv_pos = csv_handle.tell()
+                logical_bytes = csv_pos - prev_csv_pos
+                prev_csv_pos = csv_pos
+                if rows_in_chunk == 0:
+                    print(f"块 {chunk_index} 为空，跳过。")
+                    continue
+
+                # 与其他导入脚本相同的类型转换 (errors='coerce')，在计时窗口之外
+                chunk_df = coerce_chunk(chunk_df)
+                first_row_id = int(chunk_df.index[0]) # pandas 分块的 index 是全局行号
+                print(f"处理块 {chunk_index} ({rows_in_chunk} 行)...")
+
+                # --- 编码并批量写入，计时窗口包含编码 (对应 RocksDB 的 JSON 序列化 + WriteBatch) ---
+                start_time = time.time()
+                pre_disk_io = get_system_metrics().get('disk_io_counters', None)
+                try:
+                    keys = encode_keys(first_row_id, rows_in_chunk)
+                    if value_encoding == 'struct':
+                        values = encode_values_struct(chunk_df, record_dtype)
+                    else:
+                        values = encode_values_json(chunk_df)
+                    encode_end_time = time.time()
+                    batch_bytes = store.write_batch(keys, values)
+                except Exception as e:
+                    print(f"写入块 {chunk_index} 时发生错误: {e}")
+                    log_entry = {
+                        'timestamp': datetime.now().isoformat(),
+                        'chunk_index': chunk_index,
+                        'status': 'ERROR',
+                        'error': str(e),
+                        'rows_attempted': rows_in_chunk,
+                        'start_time_utc': start_time,
+                        'end_time_utc': time.time(),
+                        'system_metrics_at_error': get_system_metrics()
+                    }
+                    log_f.write(json.dumps(log_entry) + '\n')
+                    log_f.flush()
+                    continue
+
+                end_time = time.time()
+                time_taken_chunk = max(end_time - start_time, 0.0001)
+                encode_time = encode_end_time - start_time
+                total_time_taken += time_taken_chunk
+                total_encode_time += encode_time
+                total_rows_ingested += rows_in_chunk
+                total_logical_bytes += logical_bytes
+                total_value_bytes += batch_bytes
+                ingestion_rate_rows_per_sec = rows_in_chunk / time_taken_chunk
+
+                # --- 记录块处理后的系统指标和磁盘 I/O 差值 ---
+                post_insert_metrics = get_system_metrics()
+                post_disk_io = post_insert_metrics.get('disk_io_counters', None)
+                disk_io_delta = {'read_bytes_delta': 0, 'write_bytes_delta': 0, 'read_count_delta': 0, 'write_count_delta': 0}
+                if pre_disk_io and post_disk_io:
+                    disk_io_delta['read_bytes_delta'] = post_disk_io.read_bytes - pre_disk_io.read_bytes
+                    disk_io_delta['write_bytes_delta'] = post_disk_io.write_bytes - pre_disk_io.write_bytes
+                    disk_io_delta['read_count_delta'] = post_disk_io.read_count - pre_disk_io.read_count
+                    disk_io_delta['write_count_delta'] = post_disk_io.write_count - pre_disk_io.write_count
+
+                # --- 存储增长和写放大统计 (在计时窗口之外) ---
+                process_write_bytes = get_process_write_bytes()
+                chunk_write_bytes = process_write_bytes - prev_process_write_bytes if process_write_bytes >= 0 else -1
+                total_write_bytes = process_write_bytes - run_start_write_bytes if process_write_bytes >= 0 else -1
+                prev_process_write_bytes = process_write_bytes
+
+                # --- 记录日志 ---
+                log_entry = {
+                    'timestamp': datetime.now().isoformat(),
+                    'chunk_index': chunk_index,
+                    'status': 'SUCCESS',
+                    'rows_ingested': rows_in_chunk,
+                    'time_taken_seconds': round(time_taken_chunk, 4),
+                    'ingestion_rate_rows_per_sec': round(ingestion_rate_rows_per_sec, 2),
+                    'total_rows_ingested_so_far': total_rows_ingested,
+                    'total_time_taken_so_far': round(total_time_taken, 4),
+                    'system_metrics_after_chunk': {
+                        'cpu_percent': post_insert_metrics.get('cpu_percent', -1),
+                        'memory_percent': post_insert_metrics.get('memory_percent', -1),
+                        'memory_used_gb': post_insert_metrics.get('memory_used_gb', -1),
+                        **get_process_memory(), # 本进程的 RSS 和 RSS 历史最高值，不受其他进程影响
+                    },
+                    'disk_io_delta_during_chunk_bytes': {
+                        'read': disk_io_delta['read_bytes_delta'],
+                        'write': disk_io_delta['write_bytes_delta']
+                    },
+                    'disk_io_delta_during_chunk_count': {
+                        'read': disk_io_delta['read_count_delta'],
+                        'write': disk_io_delta['write_count_delta']
+                    },
+                    'storage_accounting': {
+                        'logical_bytes_ingested': logical_bytes,
+                        'total_logical_bytes_ingested_so_far': total_logical_bytes,
+                        'db_file_bytes': get_path_size(kv_dir),
+                        'wal_bytes': 0,
+                        'temp_bytes': None,
+                        'process_write_bytes_during_chunk': chunk_write_bytes,
+                        'total_process_write_bytes_so_far': total_write_bytes,
+                        'write_amplification': write_amplification(chunk_write_bytes, logical_bytes),
+                        'cumulative_write_amplification': write_amplification(total_write_bytes, total_logical_bytes),
+                    },
+                    'kv_accounting': {
+                        'backend': backend,
+                        'value_encoding': value_encoding,
+                        'encode_seconds': round(encode_time, 4),
+                        'write_seconds': round(time_taken_chunk - encode_time, 4),
+                        'batch_bytes': batch_bytes,
+                        'bytes_per_row': round(batch_bytes / rows_in_chunk, 2),
+                    }
+                }
+                log_f.write(json.dumps(log_entry) + '\n')
+                log_f.flush()
+
+                print(f"  -> 完成。耗时: {time_taken_chunk:.4f} 秒 (编码 {encode_time:.4f} 秒)，速率: {ingestion_rate_rows_per_sec:.2f} 行/秒。")
+                print(f"  -> 累计插入: {total_rows_ingested} 行，总耗时: {total_time_taken:.4f} 秒。")
+                print(f"  -> CPU: {log_entry['system_metrics_after_chunk'].get('cpu_percent', -1):.1f}%, Mem: {log_entry['system_metrics_after_chunk'].get('memory_percent', -1):.1f}% ({log_entry['system_metrics_after_chunk'].get('memory_used_gb', -1):.2f} GB used)")
+                print(f"  -> 存储: {log_entry['storage_accounting']['db_file_bytes']/1024/1024:.2f} MB，每行 {batch_bytes / rows_in_chunk:.1f} 字节")
+
+            print("\n所有数据块处理完毕。")
+
+        # 抽查第一行，确认键和值可以读回
+        first_value = store.get(0)
+        if first_value is not None and value_encoding == 'struct':
+            print(f"抽查 row 0: {decode_value_struct(first_value, record_dtype)}")
+        elif first_value is not None:
+            print(f"抽查 row 0: {first_value.decode('utf-8')}")
+
+    except FileNotFoundError:
+        print(f"错误: CSV 文件未找到在 {csv_file}")
+    except Exception as e:
+        print(f"发生未预期的错误: {e}")
+
+    finally:
+        if store is not None:
+            store.close()
+        # --- Summary ---
+        overall_avg_rate = total_rows_ingested / total_time_taken if total_time_taken > 0 else 0
+        print("\n--- 导入总结 (KV) ---")
+        print(f"总共插入行数: {total_rows_ingested}")
+        print(f"总耗时: {total_time_taken:.4f} 秒 (其中值编码 {total_encode_time:.4f} 秒，占 {total_encode_time / total_time_taken if total_time_taken > 0 else 0:.1%})")
+        print(f"整体平均插入速率: {overall_avg_rate:.2f} 行/秒")
+        print(f"写入的键值字节: {total_value_bytes / 1024 / 1024:.2f} MB，存储目录大小: {get_path_size(kv_dir) / 1024 / 1024:.2f} MB")
+        print(f"详细日志已保存到: {log_file}")
+
+
+# --- Run script ---
+if __name__ == "__main__":
+    ingest_and_monitor_kv(csv_file, kv_dir, log_file, chunk_size, backend=kv_backend,
+                          value_encoding=kv_value_encoding, fsync_each_batch=kv_fsync_each_batch)
@@ -7,6 +7,8 @@ import os # 导入 os 模块用于创建目录
 # --- 配置参数 ---
 # 日志文件路径 (与你的脚本一致)
 log_file = 'log/ingestion_log_sqlite.jsonl' # 确保这个路径是正确的
+# 日志对应的引擎名称 (用于图表标题，修改 log_file 时一起修改)
+engine_name = 'SQLite'
 
 # 图表保存路径和文件名
 output_plot_path = 'plots/ingestion_log_sqlite.jsonl.png' # 示例：保存到 plots 目录下的 png 文件
@@ -74,7 +76,7 @@ else:
     axes[0].plot(df['chunk_index'], df['ingestion_rate_rows_per_sec'], label='Ingestion Rate (rows/sec)', color='blue')
     axes[0].set_ylabel('Ingestion Rate (rows/sec)', color='blue')
     axes[0].tick_params(axis='y', labelcolor='blue')
-    axes[0].set_title('DuckDB Ingestion Rate and System Metrics by Chunk Index')
+    axes[0].set_title(f'{engine_name} Ingestion Rate and System Metrics by Chunk Index')
     axes[0].grid(True, linestyle='--', alpha=0.6)
     axes[0].legend(loc='upper left')
 
@@ -1,13 +1,15 @@
 #include <iostream>
 #include <string>
 #include <vector>
+#include <array>
 #include <fstream> // 用于文件操作
 #include <chrono>  // 用于计时
 #include <iomanip> // 用于格式化输出和时间格式化
-#include <limits>  // 用于读取 CSV 时的数值限制
+#include <limits>  // std::numeric_limits (跳过 /proc/self/status 中不需要的行)
 #include <filesystem> // C++17 文件系统操作，用于创建目录
 #include <ctime> // 用于时间转换
 #include <sstream> // 用于时间格式化
+#include <cmath> // std::round
 
 // RocksDB 头文件
 #include "rocksdb/db.h"
@@ -28,6 +30,10 @@ const std::string kDBPath = "db/taxi_rocksdb_cpp_csv"; // 修改为不同的目
 const std::string kLogFile = "log/rocksdb_ingestion_log_cpp.jsonl"; // 修改为 .jsonl 扩展名
 // CSV 读取和批量写入的块大小 (行数)
 const int kChunkSize = 10000;
+// 构建标记: compare_engines.py 在运行前检查编译好的 insert_test 中是否包含这个字符串，
+// 旧版本的二进制不接受命令行参数 (会按默认路径导入整个 CSV)，没有这个标记时拒绝运行
+// 修改命令行参数或日志字段的含义时递增版本号
+const char kBuildMarker[] = "insert_test build: args-v2";
 
 // --- 硬编码的 CSV 列名列表 (用于 JSON 输出的键) ---
 // !! IMPORTANT !! 请根据你的 CSV 文件的实际头部精确调整这个列表的顺序和数量
@@ -57,8 +63,67 @@ std::string GetISO8601Timestamp() {
     return ss.str();
 }
 
+// --- 辅助函数：当前进程累计写入存储层的字节数 (/proc/self/io 的 write_bytes)，不支持的平台返回 -1 ---
+long long GetProcessWriteBytes() {
+    std::ifstream io_file("/proc/self/io");
+    std::string field;
+    long long value = 0;
+    while (io_file >> field >> value) {
+        if (field == "write_bytes:") return value;
+    }
+    return -1; // macOS 等没有 /proc 的平台
+}
+
+// --- 辅助函数：当前进程的内存 (/proc/self/status 中的 VmRSS / VmHWM，单位 kB)，返回字节数，不支持的平台返回 -1 ---
+long long GetProcStatusBytes(const std::string& key) {
+    std::ifstream status_file("/proc/self/status");
+    std::string field;
+    while (status_file >> field) {
+        if (field == key) {
+            long long kb = 0;
+            status_file >> kb;
+            return kb * 1024;
+        }
+        status_file.ignore(std::numeric_limits<std::streamsize>::max(), '\n');
+    }
+    return -1;
+}
+
+// --- 辅助函数：统计 RocksDB 目录大小，WAL (*.log) 和其他文件 (SST、MANIFEST 等) 分开统计 ---
+void GetRocksDBDirSizes(const std::string& db_path, long long& db_file_bytes, long long& wal_bytes) {
+    db_file_bytes = 0;
+    wal_bytes = 0;
+    std::error_code ec;
+    for (const auto& entry : std::filesystem::directory_iterator(db_path, ec)) {
+        if (!entry.is_regular_file(ec)) continue;
+        auto size = static_cast<long long>(entry.file_size(ec));
+        if (ec) continue; // 文件可能在遍历期间被 compaction 删除
+        if (entry.path().extension() == ".log") wal_bytes += size;
+        else db_file_bytes += size;
+    }
+}
+
+// --- 辅助函数：写放大 = 进程写入字节 / 逻辑导入字节，无法计算时返回 null ---
+nlohmann::json WriteAmplification(long long written_bytes, long long logical_bytes) {
+    if (written_bytes < 0 || logical_bytes <= 0) return nullptr;
+    return std::round(static_cast<double>(written_bytes) / logical_bytes * 1000.0) / 1000.0;
+}
+
+
+int main(int argc, char* argv[]) {
+    // --- 命令行参数 (可选)，用于 compare_engines.py 让各引擎导入同一段数据 ---
+    // 用法: ./insert_test [csv_file] [db_path] [log_file] [chunk_size]，省略的参数使用上面的默认配置
+    //       ./insert_test --version 只打印构建标记
+    if (argc > 1 && std::string(argv[1]) == "--version") {
+        std::cout << kBuildMarker << std::endl;
+        return 0;
+    }
+    std::cout << kBuildMarker << std::endl;
+    const std::string csv_file = argc > 1 ? argv[1] : kCsvFile;
+    const std::string db_path = argc > 2 ? argv[2] : kDBPath;
+    const std::string log_file = argc > 3 ? argv[3] : kLogFile;
+    const int chunk_size = argc > 4 ? std::stoi(argv[4]) : kChunkSize;
 
-int main() {
     // --- 配置 RocksDB 选项 ---
     rocksdb_options.create_if_missing = true; // 如果数据库目录不存在，则创建
     rocksdb_options.OptimizeLevelStyleCompaction(); // ★★ 修正 ★★ 调用函数
@@ -74,8 +139,8 @@ int main() {
     // --- 确保目录存在 ---
     std::cout << "确保目录存在..." << std::endl;
     try {
-        std::filesystem::create_directories(std::filesystem::path(kLogFile).parent_path());
-        std::filesystem::create_directories(std::filesystem::path(kDBPath));
+        std::filesystem::create_directories(std::filesystem::path(log_file).parent_path());
+        std::filesystem::create_directories(std::filesystem::path(db_path));
         std::cout << "目录确保成功。" << std::endl;
     } catch (const std::exception& e) {
         std::cerr << "创建目录时发生错误: " << e.what() << std::endl;
@@ -84,8 +149,8 @@ int main() {
 
 
     // --- 清理旧数据库 ---
-    std::cout << "正在清理旧数据库目录: " << kDBPath << std::endl;
-    rocksdb::Status s = rocksdb::DestroyDB(kDBPath, rocksdb_options);
+    std::cout << "正在清理旧数据库目录: " << db_path << std::endl;
+    rocksdb::Status s = rocksdb::DestroyDB(db_path, rocksdb_options);
     if (s.ok()) {
         std::cout << "旧数据库清理成功或目录不存在。" << std::endl;
     } else {
@@ -93,14 +158,14 @@ int main() {
              std::cerr << "清理旧数据库时发生错误: " << s.ToString() << std::endl;
              // return 1; // 如果是严重错误，可以选择退出
         } else {
-             std::cout << "数据库目录 " << kDBPath << " 不存在，无需清理。" << std::endl;
+             std::cout << "数据库目录 " << db_path << " 不存在，无需清理。" << std::endl;
         }
     }
 
     // --- 打开 RocksDB 数据库 ---
     rocksdb::DB* db = nullptr;
-    std::cout << "正在打开 RocksDB 数据库: " << kDBPath << std::endl;
-    s = rocksdb::DB::Open(rocksdb_options, kDBPath, &db);
+    std::cout << "正在打开 RocksDB 数据库: " << db_path << std::endl;
+    s = rocksdb::DB::Open(rocksdb_options, db_path, &db);
     if (!s.ok()) {
         std::cerr << "无法打开数据库: " << s.ToString() << std::endl;
         return 1;
@@ -109,18 +174,18 @@ int main() {
     std::cout << "成功打开 RocksDB 数据库。" << std::endl;
 
     // --- 打开日志文件 ---
-    std::ofstream log_file_stream(kLogFile, std::ios::app); // 以追加模式打开日志文件
+    std::ofstream log_file_stream(log_file, std::ios::app); // 以追加模式打开日志文件
     if (!log_file_stream.is_open()) {
-        std::cerr << "无法打开日志文件: " << kLogFile << std::endl;
+        std::cerr << "无法打开日志文件: " << log_file << std::endl;
         // return 1; // 日志文件无法打开则退出
     }
-    std::cout << "日志将写入到: " << kLogFile << std::endl;
+    std::cout << "日志将写入到: " << log_file << std::endl;
 
 
     // --- 打开 CSV 文件并准备读取器 ---
-    std::cout << "\n正在打开 CSV 文件: " << kCsvFile << std::endl;
+    std::cout << "\n正在打开 CSV 文件: " << csv_file << std::endl;
     // CSVReader 模板参数需要精确匹配你读取的最大列数 (kMaxCsvColumns)
-    io::CSVReader<kMaxCsvColumns, io::trim_chars<>, io::double_quote_escape<',','\"'>> csv_reader(kCsvFile);
+    io::CSVReader<kMaxCsvColumns, io::trim_chars<>, io::double_quote_escape<',','\"'>> csv_reader(csv_file);
 
     // 读取 CSV 头，Fast-CPP-CSV-Parser 需要你提供变量来接收头部数据
     // 提供的变量数量需要匹配 kMaxCsvColumns
@@ -143,42 +208,66 @@ int main() {
 
     std::cout << "CSV 文件打开成功并跳过头部。" << std::endl;
 
+    // 逻辑导入字节和 Python 导入脚本一致: 原始 CSV 文件字节 (含表头、引号和换行)
+    // 用第二个文件句柄与 csv_reader 逐行同步读取原始行 (CSVReader 不支持字段内换行，所以一条记录就是一行)
+    std::ifstream raw_csv(csv_file, std::ios::binary);
+    std::string raw_line;
+    auto ReadRawLineBytes = [&raw_csv, &raw_line]() -> long long {
+        if (!std::getline(raw_csv, raw_line)) return 0;
+        return static_cast<long long>(raw_line.size()) + (raw_csv.eof() ? 0 : 1); // getline 去掉的 '\n'
+    };
+    long long pending_header_bytes = ReadRawLineBytes(); // 表头字节计入第一个块，与 Python 的 tell() 一致
+
 
     // --- 批量读取 CSV 数据并写入 RocksDB ---
-    std::cout << "\n开始从 CSV 读取数据并批量写入 RocksDB (块大小: " << kChunkSize << ")..." << std::endl;
+    std::cout << "\n开始从 CSV 读取数据并批量写入 RocksDB (块大小: " << chunk_size << ")..." << std::endl;
 
     auto start_time_total = std::chrono::high_resolution_clock::now();
     long long total_rows_processed = 0; // 使用 long long 存储总行数
     std::chrono::duration<double> total_write_time_taken = std::chrono::duration<double>::zero(); // 累计写入时间
     int chunk_index = 0;
+    // 写放大统计: 逻辑导入字节 (原始 CSV 字节) 和进程累计写入字节
+    long long total_logical_bytes = 0;
+    const long long run_start_write_bytes = GetProcessWriteBytes();
+    long long prev_process_write_bytes = run_start_write_bytes;
 
-    // 用于接收每一行的列数据 (需要与 kMaxCsvColumns 匹配)
-    std::string cols[kMaxCsvColumns];
+    // 本块解析出的行，每行的列数据 (需要与 kMaxCsvColumns 匹配)
+    std::vector<std::array<std::string, kMaxCsvColumns>> chunk_rows;
+    chunk_rows.reserve(chunk_size);
 
 
     // 循环读取 CSV 数据块
     while(true) { // 外层循环控制块
         chunk_index++;
-        long long rows_in_this_chunk = 0;
+        long long logical_bytes = pending_header_bytes; // 本块消耗的原始 CSV 字节
+        pending_header_bytes = 0;
         rocksdb::WriteBatch batch;
 
-        auto start_time_batch = std::chrono::high_resolution_clock::now();
-
-        // 读取一个块的数据并构建 WriteBatch
-        for (int i = 0; i < kChunkSize; ++i) {
+        // 先读取 (解析) 一个块的数据，解析不计入插入计时，与 Python 导入脚本 (pandas 读取在计时窗口之外) 一致
+        chunk_rows.clear();
+        for (int i = 0; i < chunk_size; ++i) {
+             auto& cols = chunk_rows.emplace_back();
              // read_row 尝试读取一行，成功返回 true，失败 (文件结束或错误) 返回 false
              // read_row 需要 kMaxCsvColumns 个参数
              if (!csv_reader.read_row(cols[0], cols[1], cols[2], cols[3], cols[4], cols[5], cols[6], cols[7], cols[8], cols[9],
                                       cols[10], cols[11], cols[12], cols[13], cols[14], cols[15], cols[16], cols[17], cols[18])) {
-                 // 如果是文件结束且当前块非空，则处理最后一个块
-                 if (rows_in_this_chunk > 0) break;
-                 // 否则，文件结束且当前块为空，跳出外层 while 循环
-                 else goto end_of_csv_reading; // 使用 goto 跳出两层循环
+                 chunk_rows.pop_back();
+                 break;
              }
+             logical_bytes += ReadRawLineBytes();
+        }
+        // 文件结束且当前块为空，跳出外层 while 循环
+        if (chunk_rows.empty()) break;
+        const long long rows_in_this_chunk = static_cast<long long>(chunk_rows.size());
 
-            rows_in_this_chunk++;
+        // 插入计时从这里开始: JSON 序列化 + 构建 WriteBatch + 写入
+        // (对应 Python 导入脚本计时窗口内的 DataFrame 转换和插入)
+        auto start_time_batch = std::chrono::high_resolution_clock::now();
+
+        for (long long row_idx = 0; row_idx < rows_in_this_chunk; ++row_idx) {
+            const auto& cols = chunk_rows[row_idx];
             // 计算当前行的全局行号 (从 0 开始)
-            long long global_row_index = total_rows_processed + rows_in_this_chunk - 1;
+            long long global_row_index = total_rows_processed + row_idx;
 
 
             // --- 生成键 ---
@@ -230,11 +319,34 @@ int main() {
         log_entry["system_metrics_after_chunk"]["cpu_percent"] = -1.0;
         log_entry["system_metrics_after_chunk"]["memory_percent"] = -1.0;
         log_entry["system_metrics_after_chunk"]["memory_used_gb"] = -1.0;
+        // 本进程的 RSS 和 RSS 历史最高值 (与 Python 导入脚本的 get_process_memory() 一致)
+        log_entry["system_metrics_after_chunk"]["process_rss_bytes"] = GetProcStatusBytes("VmRSS:");
+        log_entry["system_metrics_after_chunk"]["process_peak_rss_bytes"] = GetProcStatusBytes("VmHWM:");
         log_entry["disk_io_delta_during_chunk_bytes"]["read"] = 0;
         log_entry["disk_io_delta_during_chunk_bytes"]["write"] = 0;
         log_entry["disk_io_delta_during_chunk_count"]["read"] = 0;
         log_entry["disk_io_delta_during_chunk_count"]["write"] = 0;
 
+        // 存储增长和写放大统计 (与 Python 导入脚本的 storage_accounting 字段一致)
+        total_logical_bytes += logical_bytes;
+        long long process_write_bytes = GetProcessWriteBytes();
+        long long chunk_write_bytes = process_write_bytes >= 0 ? process_write_bytes - prev_process_write_bytes : -1;
+        long long total_write_bytes = process_write_bytes >= 0 ? process_write_bytes - run_start_write_bytes : -1;
+        prev_process_write_bytes = process_write_bytes;
+        long long db_file_bytes = 0, wal_bytes = 0;
+        GetRocksDBDirSizes(db_path, db_file_bytes, wal_bytes);
+        auto& storage = log_entry["storage_accounting"];
+        storage["logical_bytes_ingested"] = logical_bytes;
+        storage["logical_bytes_source"] = "raw_csv_bytes"; // 旧版本按解析后的字段长度统计，与 Python 导入脚本不可比较
+        storage["total_logical_bytes_ingested_so_far"] = total_logical_bytes;
+        storage["db_file_bytes"] = db_file_bytes;
+        storage["wal_bytes"] = wal_bytes;
+        storage["temp_bytes"] = nullptr; // RocksDB 没有单独的临时目录
+        storage["process_write_bytes_during_chunk"] = chunk_write_bytes;
+        storage["total_process_write_bytes_so_far"] = total_write_bytes;
+        storage["write_amplification"] = WriteAmplification(chunk_write_bytes, logical_bytes);
+        storage["cumulative_write_amplification"] = WriteAmplification(total_write_bytes, total_logical_bytes);
+
 
         if (s.ok()) {
             log_entry["status"] = "SUCCESS";
@@ -259,20 +371,12 @@ int main() {
 
         total_rows_processed += rows_in_this_chunk;
 
-        // read_row 遇到文件尾或错误会返回 false，内层循环会跳出
-        // 如果内层循环读完一个完整的 chunk (rows_in_this_chunk == kChunkSize)，外层 while 继续
-        // 如果内层循环读到文件尾或错误 (rows_in_this_chunk < kChunkSize)，break 跳出内层循环
-        // 然后外层 while 检查条件，如果是文件尾，之前设置的 goto 会跳出。
-        // 如果是错误，可以通过检查 s.ok() 来决定是否跳出外层循环。
-        // 当前逻辑是遇到文件尾小于 kChunkSize 时，break 内层循环，然后 goto 跳出外层。
-        // 遇到错误，打印错误日志，然后 continue 外层循环（处理下一个块，如果还有的话）。
+        // 读取循环遇到文件尾或错误 (read_row 返回 false) 时结束本块，块为空时跳出外层 while 循环
+        // 写入错误只打印和记录日志，然后继续处理下一个块 (如果还有的话)
         // 你可能需要调整这里的错误处理逻辑。
 
     } // End of outer while loop
 
-end_of_csv_reading:; // goto 标签
-
-
     auto end_time_total = std::chrono::high_resolution_clock::now();
     std::chrono::duration<double> actual_total_time = end_time_total - start_time_total; // 包含读取和写入的总时间
 
@@ -288,7 +392,7 @@ end_of_csv_reading:; // goto 标签
     std::cout << "总处理 (读取+写入) 耗时: " << std::fixed << std::setprecision(4) << actual_total_time.count() << " 秒" << std::endl;
     std::cout << "总写入 RocksDB 耗时: " << std::fixed << std::setprecision(4) << total_write_time_taken.count() << " 秒" << std::endl;
     std::cout << "整体平均写入 RocksDB 速率: " << std::fixed << std::setprecision(2) << overall_avg_write_rate << " 行/秒" << std::endl;
-    std::cout << "详细日志已保存到: " << kLogFile << std::endl;
+    std::cout << "详细日志已保存到: " << log_file << std::endl;
 
 
     // db_guard 在这里超出作用域，会自动调用 db->Close()
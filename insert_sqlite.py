@@ -6,6 +6,15 @@ from datetime import datetime
 import psutil
 import pandas as pd # 使用 pandas 来分块读取 CSV
 import numpy as np # 用于处理 NaN 值
+import struct # 用于读取 WAL 文件头
+from ingest_utils import get_process_write_bytes, get_storage_metrics, write_amplification, get_process_memory
+from memory_governor import MemoryGovernor
+from csv_cache import ensure_parsed_cache, CachedChunkReader
+from chunk_profiler import SlowChunkProfiler
+from memory_attribution import PhaseMemoryTracker
+from column_projection import resolve_projection, estimate_column_byte_share, apply_row_filter, filter_accounting, validate_row_filter
+from finalize_stage import run_finalize_step, write_finalize_summary, print_finalize_summary
+from verification import IngestVerifier, column_kind, print_verification, register_sqlite_checksum_functions, SQLITE_CHECKSUM_SQL
 
 # --- 配置参数 ---
 # CSV 数据文件路径 (使用 Google Drive 挂载路径)
@@ -18,6 +27,49 @@ db_file = 'db/taxi_data.sqlite' # 修改数据库文件名为更具描述性的
 table_name = 'yellow_taxi_trips_sqlite' # 为 SQLite 表使用不同的名称
 # CSV 读取的块大小 (行数) - 影响每次插入的数据量和监控的粒度
 chunk_size = 10000 # 可以根据内存和CPU调整，太小开销大，太大监控不精细
+# 存储编码模式: 'text' (默认，时间戳存为 ISO8601 TEXT) 或 'compact' (紧凑编码)
+# compact: 时间戳存为 INTEGER (Unix epoch 秒)，低基数文本列存为整数编码 + 查找表，金额列存为 INTEGER (分)
+storage_encoding = 'text' # <<<<<<< 在这里切换存储编码模式 >>>>>>>
+# 是否使用 WITHOUT ROWID 表 (仅在 compact 模式下生效)
+# 会增加一个 row_id 列作为聚簇主键，行数据直接存放在主键 B-tree 中
+sqlite_without_rowid = False
+# 日志模式: None 保持 SQLite 默认 (DELETE 回滚日志)，'WAL' 使用预写日志 (探针才能统计 WAL 帧和 checkpoint)
+sqlite_journal_mode = None
+# 内存压力调节器 (见 memory_governor.py): 接近容器/进程内存上限时缩小块大小、gc.collect()、
+# 释放 SQLite 页缓存并 checkpoint，或暂停，避免在 --memory=256m 这类受限容器中被 OOM kill
+memory_governor_enabled = False # <<<<<<< 在这里开启内存压力调节器 >>>>>>>
+# 解析后数据集缓存 (见 csv_cache.py): 首次运行把 CSV 解析成带类型的 Arrow IPC 文件，之后的运行内存映射按块读取，
+# 跳过重复的 CSV 解析和 to_datetime / to_numeric 转换; 设为 False 则绕过缓存，测量端到端的解析成本
+use_parsed_cache = False # <<<<<<< 在这里开启解析缓存 >>>>>>>
+parsed_cache_dir = 'data_set/cache'
+# 引擎内部探针: 每 N 个块采样一次 SQLite 内部状态 (页数、空闲页、WAL 高水位帧数和 checkpoint 次数)，0 表示关闭
+# 探针在计时窗口之外执行，不影响 ingestion_rate_rows_per_sec
+engine_probe_every_n_chunks = 0 # <<<<<<< 例如 10 >>>>>>>
+# 慢块采样分析器 (见 chunk_profiler.py): 对导入线程持续采样调用栈，只为耗时超过滚动窗口动态 p99 的块
+# 保存 collapsed stacks，文件路径写入该块日志的 slow_chunk_profile 字段
+profile_slow_chunks = False # <<<<<<< 在这里开启慢块分析 >>>>>>>
+# 慢块同时保存 tracemalloc 快照: 整个运行期间开启 tracemalloc，会明显拖慢导入，只用于诊断内存
+profile_slow_chunks_trace_memory = False
+slow_chunk_profile_dir = 'log/profiles'
+# 按阶段的内存归因 (见 memory_attribution.py): 在每块的阶段边界记录 RSS、Python 堆 (tracemalloc)，
+# 写入日志的 memory_attribution 字段，结束时汇总每个阶段的峰值和保留内存; tracemalloc 会拖慢导入，只用于诊断
+memory_attribution_enabled = False # <<<<<<< 在这里开启内存归因 >>>>>>>
+# 列投影 (见 column_projection.py): 只读取和导入这些列 (不区分大小写)，None 表示全部列
+# 投影下推到 pandas usecols / 解析缓存的 Arrow 列选择，表结构也只包含这些列
+projection_columns = None # <<<<<<< 例如 ['tpep_pickup_datetime', 'trip_distance', 'fare_amount', 'tip_amount', 'total_amount'] >>>>>>>
+# 行过滤: 向量化的 pandas 表达式，在类型转换之前按 CSV 原始单位求值，None 表示不过滤
+row_filter = None # <<<<<<< 例如 'trip_distance > 0' >>>>>>>
+# 导入后的收尾阶段 (见 finalize_stage.py): 建索引 + ANALYZE (+ VACUUM) + WAL checkpoint，每一步单独记录耗时、写入字节和峰值内存，
+# 并记录 time_to_queryable_seconds (从开始导入到表可以查询)
+# SQLite 同一时间只有一个写入者，索引依次构建，通过 PRAGMA threads 让每个 CREATE INDEX 使用多线程排序
+finalize_enabled = False # <<<<<<< 在这里开启收尾阶段 >>>>>>>
+# 导入后要建的索引，每个元素是一个索引包含的列
+finalize_index_columns = [['tpep_pickup_datetime'], ['pulocationid', 'dolocationid']]
+# 收尾时是否 VACUUM (会重写整个数据库文件)
+finalize_vacuum = False
+# 导入校验 (见 verification.py): 导入时统计每块的行数、NULL 数和与顺序无关的列校验和，结束后与 SQLite 中的聚合查询对比，
+# 结果记录为一行 'VERIFICATION'，同时报告插入失败丢失的行和被 errors='coerce' 置为 NULL 的值
+verify_enabled = False # <<<<<<< 在这里开启导入校验 >>>>>>>
 
 # 系统信息采样间隔 (每次块插入后记录)
 # psutil.cpu_percent(interval=None) 是非阻塞的，适合在每次块插入后快速获取
@@ -59,15 +111,220 @@ def get_system_metrics():
 
     return metrics
 
+
+# --- SQLite 引擎内部探针 ---
+def read_wal_header(wal_file):
+    """读取 WAL 文件头 (32 字节)，返回 (页大小, checkpoint 序号)；WAL 不存在或为空时返回 (None, None)
+
+    checkpoint 序号在每次 checkpoint 后 WAL 被重置时加 1，可用来统计 checkpoint 事件
+    """
+    try:
+        with open(wal_file, 'rb') as f:
+            header = f.read(32)
+    except OSError:
+        return None, None
+    if len(header) < 32:
+        return None, None
+    _magic, _version, page_size, checkpoint_seq = struct.unpack('>IIII', header[:16])
+    return page_size, checkpoint_seq
+
+
+def probe_sqlite_internals(conn, db_file, probe_state):
+    """采样 SQLite 内部状态: page_count、freelist_count、WAL 帧数和 checkpoint 事件
+
+    probe_state: 跨探针保存上一次的 checkpoint 序号
+    """
+    probe = {}
+    try:
+        page_size = conn.execute("PRAGMA page_size;").fetchone()[0]
+        probe['page_size'] = page_size
+        probe['page_count'] = conn.execute("PRAGMA page_count;").fetchone()[0]
+        probe['freelist_count'] = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        probe['journal_mode'] = conn.execute("PRAGMA journal_mode;").fetchone()[0]
+
+        # WAL 帧数由文件大小推算 (不执行 wal_checkpoint，避免探针本身触发 checkpoint)
+        # 注意: checkpoint 后 WAL 文件不会被截断而是从头复用，文件大小只反映历史最高帧数，
+        # 所以记录为 wal_frames_high_water，而不是当前 WAL 中的帧数
+        wal_file = db_file + '-wal'
+        wal_page_size, checkpoint_seq = read_wal_header(wal_file)
+        if wal_page_size:
+            wal_size = os.path.getsize(wal_file)
+            probe['wal_frames_high_water'] = max(wal_size - 32, 0) // (wal_page_size + 24) # 32 字节文件头，每帧 24 字节帧头
+            probe['wal_checkpoint_seq'] = checkpoint_seq
+            last_seq = probe_state.get('wal_checkpoint_seq')
+            # 第一次探针没有上一次的序号可比，记为 None
+            probe['checkpoint_events_since_last_probe'] = checkpoint_seq - last_seq if last_seq is not None else None
+            probe_state['wal_checkpoint_seq'] = checkpoint_seq
+        else:
+            probe['wal_frames_high_water'] = None
+            probe['wal_checkpoint_seq'] = None
+            probe['checkpoint_events_since_last_probe'] = None
+    except Exception as e:
+        print(f"采样 SQLite 内部状态时发生错误: {e}")
+        probe['error'] = str(e)
+    return probe
+
+
+# --- 内存压力调节器的 SQLite 释放内存动作 ---
+def relieve_sqlite_memory(conn, min_cache_pages=100):
+    """将页缓存 (cache_size) 减半并释放空闲缓存，WAL 模式下再做一次 TRUNCATE checkpoint，返回执行的动作"""
+    cache_size = conn.execute("PRAGMA cache_size;").fetchone()[0]
+    page_size = conn.execute("PRAGMA page_size;").fetchone()[0]
+    # cache_size 为负数时表示 KiB，统一换算成页数
+    cache_pages = cache_size if cache_size >= 0 else -cache_size * 1024 // page_size
+    new_cache_pages = max(cache_pages // 2, min_cache_pages)
+    conn.execute(f"PRAGMA cache_size = {new_cache_pages};")
+    conn.execute("PRAGMA shrink_memory;")
+    details = {'sqlite_cache_pages_before': cache_pages, 'sqlite_cache_pages_after': new_cache_pages}
+    if conn.execute("PRAGMA journal_mode;").fetchone()[0] == 'wal':
+        details['wal_checkpoint'] = list(conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone())
+    return details
+
+
+# --- 紧凑存储编码 (storage_encoding = 'compact') ---
+# 时间戳列 -> INTEGER (Unix epoch 秒)
+compact_datetime_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'pickup_datetime', 'dropoff_datetime']
+# 金额列 -> INTEGER (分)，避免 REAL 的 8 字节浮点存储
+compact_money_cols = ['fare_amount', 'extra', 'mta_tax', 'tip_amount', 'tolls_amount',
+                      'improvement_surcharge', 'total_amount', 'congestion_surcharge', 'airport_fee']
+# 低基数文本列 -> INTEGER 编码，原始值保存在 {table_name}_{col}_lookup 查找表中
+compact_category_cols = ['store_and_fwd_flag']
+# 本身就是整数的编码列 (pandas 因 NaN 会读成 float64，SQLite 中会存成 REAL)
+compact_integer_cols = ['vendorid', 'passenger_count', 'ratecodeid', 'pulocationid', 'dolocationid', 'payment_type']
+
+
+def build_compact_schema(columns, table_name, without_rowid=False):
+    """根据列名生成 compact 模式的 CREATE TABLE 语句和各列的查找表语句"""
+    columns_sql = []
+    if without_rowid:
+        columns_sql.append('"row_id" INTEGER NOT NULL')
+    for col_name in columns:
+        if col_name in compact_datetime_cols or col_name in compact_money_cols \
+                or col_name in compact_category_cols or col_name in compact_integer_cols:
+            sqlite_type = 'INTEGER'
+        elif col_name == 'trip_distance':
+            sqlite_type = 'REAL'
+        else:
+            sqlite_type = 'TEXT'
+        columns_sql.append(f'"{col_name}" {sqlite_type}')
+
+    create_table_sql = f"CREATE TABLE {table_name} ({', '.join(columns_sql)}"
+    if without_rowid:
+        # WITHOUT ROWID 表必须有主键，且主键列不能为 NULL，所以只用 row_id
+        # (时间戳列可能被 coerce 成 NULL，不能放进主键)
+        create_table_sql += ', PRIMARY KEY ("row_id")) WITHOUT ROWID;'
+    else:
+        create_table_sql += ");"
+
+    lookup_sqls = [
+        f"CREATE TABLE {table_name}_{col}_lookup (code INTEGER PRIMARY KEY, value TEXT UNIQUE);"
+        for col in compact_category_cols if col in columns
+    ]
+    return create_table_sql, lookup_sqls
+
+
+def encode_chunk_compact(chunk_df, cursor, table_name, category_codes, with_row_id=False):
+    """将一个数据块转换为 compact 编码 (向量化)，新出现的类别值会写入查找表并立即提交
+
+    category_codes: {列名: {原始值: 编码}}，跨块复用
+    with_row_id: WITHOUT ROWID 模式下加 row_id 列 (取 chunk_df.index，即 CSV 中的原始行号，行过滤后仍可追溯)
+    """
+    for col in compact_datetime_cols:
+        if col in chunk_df.columns:
+            parsed = pd.to_datetime(chunk_df[col], errors='coerce')
+            # 与时间精度无关的 epoch 秒计算 (NaT -> NaN -> <NA>)
+            chunk_df[col] = ((parsed - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).astype('Int64')
+
+    for col in compact_money_cols:
+        if col in chunk_df.columns:
+            chunk_df[col] = (pd.to_numeric(chunk_df[col], errors='coerce') * 100).round().astype('Int64')
+
+    for col in compact_integer_cols:
+        if col in chunk_df.columns:
+            chunk_df[col] = pd.to_numeric(chunk_df[col], errors='coerce').round().astype('Int64')
+
+    if 'trip_distance' in chunk_df.columns:
+        chunk_df['trip_distance'] = pd.to_numeric(chunk_df['trip_distance'], errors='coerce')
+
+    for col in compact_category_cols:
+        if col in chunk_df.columns:
+            codes = category_codes.setdefault(col, {})
+            values = chunk_df[col].astype('string')
+            new_values = [v for v in values.dropna().unique() if v not in codes]
+            if new_values:
+                new_rows = [(len(codes) + i, v) for i, v in enumerate(new_values)]
+                cursor.executemany(f"INSERT INTO {table_name}_{col}_lookup (code, value) VALUES (?, ?);", new_rows)
+                # 查找表单独提交: 本块插入失败时的 rollback 不能撤销已经进入 category_codes 的编码
+                cursor.connection.commit()
+                codes.update((v, code) for code, v in new_rows)
+            chunk_df[col] = values.map(codes).astype('Int64')
+
+    if with_row_id:
+        chunk_df.insert(0, 'row_id', chunk_df.index.to_numpy(dtype='int64'))
+
+    # Int64 的 <NA> 和 float 的 NaN 统一转成 None，以便 SQLite 识别为 NULL
+    return chunk_df.astype(object).where(chunk_df.notna(), None)
+
+
+# --- 导入后的收尾阶段 ---
+def finalize_sqlite(conn, db_file, table_name, index_columns, log_f, vacuum=False):
+    """依次建索引 (多线程排序)、ANALYZE、可选 VACUUM、WAL 模式下 TRUNCATE checkpoint，返回各步骤的日志记录"""
+    db_paths = [db_file, db_file + '-wal', db_file + '-journal']
+    conn.commit() # VACUUM 不能在事务中执行
+    conn.execute(f"PRAGMA threads = {os.cpu_count() or 1};")
+    table_columns = {row[1].lower() for row in conn.execute(f"PRAGMA table_info({table_name});").fetchall()}
+    records = []
+    for cols in index_columns or []:
+        if not all(c.lower() in table_columns for c in cols):
+            print(f"跳过索引 {cols}: 表 {table_name} 中没有这些列")
+            continue
+        index_name = f"idx_{table_name}_{'_'.join(cols)}"
+        column_list = ', '.join(f'"{c}"' for c in cols)
+        sql = f"CREATE INDEX {index_name} ON {table_name} ({column_list});"
+        records.append(run_finalize_step(f"create_index:{index_name}", lambda sql=sql: conn.execute(sql), db_paths, log_f))
+    records.append(run_finalize_step('analyze', lambda: conn.execute("ANALYZE;"), db_paths, log_f))
+    conn.commit()
+    if vacuum:
+        records.append(run_finalize_step('vacuum', lambda: conn.execute("VACUUM;"), db_paths, log_f))
+    if conn.execute("PRAGMA journal_mode;").fetchone()[0] == 'wal':
+        records.append(run_finalize_step(
+            'wal_checkpoint',
+            lambda: {'wal_checkpoint': list(conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchone())},
+            db_paths, log_f))
+    return records
+
+
 # --- 主插入和监控函数 (SQLite 版本) ---
-def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_size):
+def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_size,
+                              storage_encoding='text', without_rowid=False, max_chunks=None,
+                              journal_mode=None, probe_every_n_chunks=0, memory_governor_enabled=False,
+                              use_parsed_cache=False, parsed_cache_dir='data_set/cache',
+                              profile_slow_chunks=False, profile_dir='log/profiles', profile_trace_memory=False,
+                              memory_attribution_enabled=False, projection_columns=None, row_filter=None,
+                              finalize_enabled=False, finalize_index_columns=None, finalize_vacuum=False,
+                              verify_enabled=False):
+    run_start_time = time.time() # 用于 time_to_queryable (包含解析、插入和收尾)
+    finalize_summary = None
+    verifier = None
+    verification = None
     total_rows_ingested = 0
     total_time_taken = 0
     chunk_index = 0
+    compact = storage_encoding == 'compact'
+    category_codes = {} # compact 模式下的类别编码表，跨块复用
+    probe_state = {} # 引擎探针的跨块状态 (上一次的 WAL checkpoint 序号)
+    governor = MemoryGovernor(chunk_size) if memory_governor_enabled else None
+    profiler = SlowChunkProfiler(profile_dir, trace_memory=profile_trace_memory) if profile_slow_chunks else None
+    memory_tracker = None
+    source_columns = None # 投影后保留的 CSV 原始列名，None 表示全部列
+    column_byte_share = 1.0 # 保留列占原始 CSV 字节的比例
+    total_rows_dropped = 0
+    total_bytes_dropped = 0
 
     print(f"开始从 {csv_file} 插入数据到 SQLite 数据库 {db_file} 的表 {table_name}")
     print(f"日志将记录到 {log_file}")
     print(f"块大小 (chunk size): {chunk_size} 行")
+    print(f"存储编码模式: {storage_encoding}" + (" (WITHOUT ROWID)" if compact and without_rowid else ""))
 
     # 使用 with 语句确保连接和文件关闭
     try:
@@ -75,10 +332,18 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
         with sqlite3.connect(db_file) as conn:
             print("成功连接到 SQLite 数据库。")
             cursor = conn.cursor()
+            if governor is not None:
+                governor.relief_callback = lambda: relieve_sqlite_memory(conn)
+                print("内存压力调节器已开启。")
+            if journal_mode:
+                actual_mode = cursor.execute(f"PRAGMA journal_mode={journal_mode};").fetchone()[0]
+                print(f"SQLite 日志模式设置为: {actual_mode}")
 
             # 准备表：如果表已存在，删除它以便重新开始
             try:
                 cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+                for col in compact_category_cols:
+                    cursor.execute(f"DROP TABLE IF EXISTS {table_name}_{col}_lookup;")
                 print(f"如果存在，已删除旧表 {table_name}。")
             except sqlite3.Error as e:
                  print(f"删除旧表时发生 SQLite 错误: {e}")
@@ -90,7 +355,9 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
             try:
                 # 使用 pandas 读取 CSV 头部来推断列名和类型
                 # low_memory=False helps with mixed types
-                temp_df = pd.read_csv(csv_file, nrows=10, low_memory=False)
+                # 列投影: 只保留选中的列 (按 CSV 中的顺序)
+                source_columns = resolve_projection(csv_file, projection_columns)
+                temp_df = pd.read_csv(csv_file, nrows=10, low_memory=False, usecols=source_columns)
                 # Convert column names to lowercase for consistency
                 temp_df.columns = temp_df.columns.str.lower()
 
@@ -105,17 +372,24 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                                               # Storing as TEXT (ISO8601) is generally more readable
                 }
 
-                columns_sql = []
-                for col_name, dtype in temp_df.dtypes.items():
-                    # Handle potential pandas object type becoming more specific after reading more data
-                    # For simplicity, we'll use the initial guess, but be aware of potential type issues
-                    sqlite_type = dtype_mapping.get(str(dtype), 'TEXT') # Default to TEXT if type not in mapping
-                    columns_sql.append(f'"{col_name}" {sqlite_type}') # Quote column names to handle spaces/special chars
-
-                create_table_sql = f"CREATE TABLE {table_name} ({', '.join(columns_sql)});"
+                if compact:
+                    # compact 模式使用固定的列类型，而不是根据前几行推断
+                    create_table_sql, lookup_sqls = build_compact_schema(list(temp_df.columns), table_name, without_rowid)
+                else:
+                    columns_sql = []
+                    for col_name, dtype in temp_df.dtypes.items():
+                        # Handle potential pandas object type becoming more specific after reading more data
+                        # For simplicity, we'll use the initial guess, but be aware of potential type issues
+                        sqlite_type = dtype_mapping.get(str(dtype), 'TEXT') # Default to TEXT if type not in mapping
+                        columns_sql.append(f'"{col_name}" {sqlite_type}') # Quote column names to handle spaces/special chars
+
+                    create_table_sql = f"CREATE TABLE {table_name} ({', '.join(columns_sql)});"
+                    lookup_sqls = []
                 print(f"根据 CSV 结构生成的 CREATE TABLE 语句:\n{create_table_sql}")
 
                 cursor.execute(create_table_sql)
+                for lookup_sql in lookup_sqls:
+                    cursor.execute(lookup_sql)
                 print(f"创建了新表 {table_name}。")
 
             except FileNotFoundError:
@@ -127,74 +401,193 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                  # print(temp_df.head().to_markdown()) # Uncomment for debugging
                  return # 如果创建表失败，无法继续
 
+            # 行过滤表达式在导入开始前验证一次，无效时中止导入 (否则每块都会出错，数据会在没有过滤的情况下被导入)
+            try:
+                validate_row_filter(csv_file, row_filter, source_columns)
+            except Exception as e:
+                print(f"{e}，中止导入。")
+                return
+
+            if verify_enabled:
+                # 按声明的列类型决定校验和种类 (text 模式的时间戳是 ISO8601 TEXT，compact 模式是 epoch 秒 INTEGER)
+                verifier = IngestVerifier({row[1]: column_kind(row[1], row[2])
+                                           for row in cursor.execute(f"PRAGMA table_info({table_name});").fetchall()})
+
 
             # 打开日志文件, 'a' mode for appending
             with open(log_file, 'a', encoding='utf-8') as log_f:
 
                 # 使用 pandas 分块读取 CSV
+                # 以二进制句柄打开 CSV，通过 tell() 统计已读取的原始 CSV 字节 (逻辑导入字节)
+                csv_handle = None
+                csv_iterator = None
+                parsed_cache_meta = None
                 try:
-                    # Read the full CSV in chunks using pandas
-                    # low_memory=False can help with mixed types but uses more memory
-                    csv_iterator = pd.read_csv(csv_file, chunksize=chunk_size, low_memory=False)
-                    print("成功创建 CSV 读取迭代器。")
+                    if use_parsed_cache:
+                        # 从解析缓存读取 (不存在时先构建); 逻辑导入字节按源 CSV 的平均每行字节数折算
+                        cache_file, parsed_cache_meta = ensure_parsed_cache(csv_file, parsed_cache_dir, chunk_size)
+                        csv_iterator = CachedChunkReader(cache_file, chunk_size,
+                                                         columns=[c.lower() for c in source_columns] if source_columns else None)
+                        source_bytes_per_row = parsed_cache_meta['source_bytes'] / max(parsed_cache_meta['rows'], 1)
+                        print(f"成功创建解析缓存读取器: {cache_file}")
+                    else:
+                        csv_handle = open(csv_file, 'rb')
+                        # Read the full CSV in chunks using pandas
+                        # low_memory=False can help with mixed types but uses more memory
+                        csv_iterator = pd.read_csv(csv_handle, chunksize=chunk_size, low_memory=False, usecols=source_columns)
+                        print("成功创建 CSV 读取迭代器。")
+
+                    if source_columns is not None or row_filter:
+                        column_byte_share = estimate_column_byte_share(csv_file, source_columns)
+                        print(f"列投影: {source_columns or '全部列'} (约占原始字节 {column_byte_share:.1%})，行过滤: {row_filter}")
 
                     # 获取初始磁盘 I/O 计数器
                     initial_metrics = get_system_metrics()
                     prev_disk_io_counters = initial_metrics.get('disk_io_counters', None)
 
+                    # 写放大统计的起点: 进程累计写入字节和 CSV 读取位置
+                    run_start_write_bytes = get_process_write_bytes()
+                    prev_process_write_bytes = run_start_write_bytes
+                    prev_csv_pos = 0
+                    total_logical_bytes = 0
+
                     # Prepare INSERT statement template
                     # Use ? as placeholders for values
-                    placeholders = ', '.join(['?'] * len(temp_df.columns))
+                    num_columns = len(temp_df.columns) + (1 if compact and without_rowid else 0) # WITHOUT ROWID 多一个 row_id 列
+                    placeholders = ', '.join(['?'] * num_columns)
                     insert_sql = f"INSERT INTO {table_name} VALUES ({placeholders});"
                     print(f"准备好的 INSERT 语句模板: {insert_sql}")
 
 
                     # 迭代处理每个数据块
                     print("开始处理数据块...")
-                    for i, chunk_df in enumerate(csv_iterator):
+                    # 开启调节器时按调节器当前的块大小读取 (块大小会随内存压力变化)
+                    chunk_source = governor.iter_chunks(csv_iterator) if governor is not None else csv_iterator
+                    if profiler is not None:
+                        profiler.start()
+                        print(f"慢块分析器已开启，分析文件目录: {profiler.profile_dir}")
+                    if memory_attribution_enabled:
+                        memory_tracker = PhaseMemoryTracker()
+                        memory_tracker.start()
+                    for i, chunk_df in enumerate(chunk_source):
                         chunk_index = i + 1
                         rows_in_chunk = len(chunk_df)
+                        # 阶段 read: 从上一块写完日志到本块读取/解析完成 (包含上一块的调节器检查和打印)
+                        if memory_tracker is not None:
+                            memory_tracker.mark('read')
+                        # 本块消耗的原始 CSV 字节; 解析器会预读缓冲区，单块值为近似值，累计值是准确的
+                        if parsed_cache_meta is not None:
+                            logical_bytes = round(rows_in_chunk * source_bytes_per_row)
+                        else:
+                            csv_pos = csv_handle.tell()
+                            logical_bytes = csv_pos - prev_csv_pos
+                            prev_csv_pos = csv_pos
+
+                        if max_chunks is not None and chunk_index > max_chunks:
+                            print(f"已达到块数上限 {max_chunks}，停止读取。")
+                            if profiler is not None:
+                                profiler.end_chunk(chunk_index) # 只读取未导入的块，不归入任何块的日志
+                            break
 
                         if rows_in_chunk == 0:
                             print(f"块 {chunk_index} 为空，跳过。")
+                            # 结束本块的慢块分析和内存归因，否则本块的耗时和内存会被算到下一块
+                            if profiler is not None:
+                                profiler.end_chunk(chunk_index)
+                            if memory_tracker is not None:
+                                memory_tracker.end_chunk('read')
                             continue
 
                         # Convert pandas column names to lowercase for consistency with SQLite
                         chunk_df.columns = chunk_df.columns.str.lower()
 
+                        # --- 行过滤 (向量化，在类型转换之前，计时窗口之外) ---
+                        rows_read = rows_in_chunk
+                        rows_dropped = 0
+                        if row_filter:
+                            try:
+                                chunk_df, rows_dropped = apply_row_filter(chunk_df, row_filter)
+                            except Exception as filter_error:
+                                # 表达式已在开始前验证过，这里出错说明本块数据有问题: 记录为 ERROR 并跳过，
+                                # 不能在没有过滤的情况下插入整块
+                                print(f"块 {chunk_index} 行过滤时发生错误: {filter_error}")
+                                log_entry = {'timestamp': datetime.now().isoformat(), 'chunk_index': chunk_index,
+                                             'status': 'ERROR', 'error': f"row filter: {filter_error}",
+                                             'rows_attempted': rows_in_chunk}
+                                slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                                if slow_chunk_profile is not None:
+                                    log_entry['slow_chunk_profile'] = slow_chunk_profile
+                                if memory_tracker is not None:
+                                    log_entry['memory_attribution'] = memory_tracker.end_chunk('filter')
+                                if verifier is not None:
+                                    verifier.add_failed_chunk(rows_in_chunk)
+                                log_f.write(json.dumps(log_entry) + '\n')
+                                log_f.flush()
+                                print(f"  -> 块 {chunk_index} 已跳过。")
+                                continue
+                            rows_in_chunk = len(chunk_df)
+                        chunk_filter_accounting = None
+                        if source_columns is not None or row_filter:
+                            chunk_filter_accounting = filter_accounting(rows_read, rows_dropped, logical_bytes,
+                                                                        column_byte_share, len(chunk_df.columns))
+                            total_rows_dropped += rows_dropped
+                            total_bytes_dropped += chunk_filter_accounting['bytes_dropped']
+                        if rows_in_chunk == 0:
+                            # 整块都被过滤掉: 不插入，单独记录一行
+                            total_logical_bytes += logical_bytes
+                            log_entry = {'timestamp': datetime.now().isoformat(), 'chunk_index': chunk_index,
+                                         'status': 'FILTERED_OUT', 'filter_accounting': chunk_filter_accounting}
+                            # 结束本块的慢块分析和内存归因，否则本块的耗时和内存会被算到下一块
+                            slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                            if slow_chunk_profile is not None:
+                                log_entry['slow_chunk_profile'] = slow_chunk_profile
+                            if memory_tracker is not None:
+                                log_entry['memory_attribution'] = memory_tracker.end_chunk('filter')
+                            log_f.write(json.dumps(log_entry) + '\n')
+                            log_f.flush()
+                            print(f"块 {chunk_index} 的 {rows_read} 行全部被过滤，跳过。")
+                            continue
+                        # 导入校验: 类型转换之前的 NULL 数，用来统计被 errors='coerce' 置为 NULL 的值
+                        raw_nulls = verifier.raw_null_counts(chunk_df) if verifier is not None else None
+
                         # --- 可选：数据类型清理和转换 ---
                         # 根据你的 CSV 数据，你可能需要在这里对 chunk_df 的列进行类型转换
                         # 将 pandas 的 NaT (对于datetime) 和 NaN (对于numeric) 转换为 None，以便 SQLite 识别为 NULL
                         # 将 datetime 对象转换为 ISO8601 字符串格式
                         try:
-                             # Convert datetime columns to ISO8601 strings
-                             datetime_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'pickup_datetime', 'dropoff_datetime']
-                             for col in datetime_cols:
-                                 if col in chunk_df.columns:
-                                     # First, attempt to convert to datetime, coercing errors
-                                     chunk_df[col] = pd.to_datetime(chunk_df[col], errors='coerce')
-                                     # Then, convert datetime objects to ISO 8601 strings, NaT becomes None
-                                     chunk_df[col] = chunk_df[col].apply(lambda x: x.isoformat() if pd.notna(x) else None)
-
-
-                             # Convert numeric columns, handling NaN
-                             numeric_cols = ['vendorid', 'passenger_count', 'trip_distance', 'ratecodeid', 'pulocationid',
-                                             'dolocationid', 'payment_type', 'fare_amount', 'extra', 'mta_tax',
-                                             'tip_amount', 'tolls_amount', 'improvement_surcharge', 'total_amount',
-                                             'congestion_surcharge', 'airport_fee'] # Add/remove based on your CSV
-                             for col in numeric_cols:
-                                  if col in chunk_df.columns:
-                                      # First, attempt to convert to numeric, coercing errors
-                                      chunk_df[col] = pd.to_numeric(chunk_df[col], errors='coerce')
-                                      # Then, replace NaN with None
-                                      chunk_df[col] = chunk_df[col].replace({np.nan: None})
-
-
-                             # Convert boolean columns to INTEGER (0 or 1)
-                             # Assuming boolean columns exist and are correctly identified by pandas
-                             bool_cols = chunk_df.select_dtypes(include='bool').columns
-                             for col in bool_cols:
-                                 chunk_df[col] = chunk_df[col].astype(int)
+                             if compact:
+                                 # compact 模式: 全部向量化编码 (epoch 秒、分、类别编码)
+                                 # pandas 分块的 index 是全局行号，块大小变化和行过滤后都与 CSV 行对应
+                                 chunk_df = encode_chunk_compact(chunk_df, cursor, table_name, category_codes, without_rowid)
+                             else:
+                                 # Convert datetime columns to ISO8601 strings
+                                 datetime_cols = ['tpep_pickup_datetime', 'tpep_dropoff_datetime', 'pickup_datetime', 'dropoff_datetime']
+                                 for col in datetime_cols:
+                                     if col in chunk_df.columns:
+                                         # First, attempt to convert to datetime, coercing errors
+                                         chunk_df[col] = pd.to_datetime(chunk_df[col], errors='coerce')
+                                         # Then, convert datetime objects to ISO 8601 strings, NaT becomes None
+                                         chunk_df[col] = chunk_df[col].apply(lambda x: x.isoformat() if pd.notna(x) else None)
+
+
+                                 # Convert numeric columns, handling NaN
+                                 numeric_cols = ['vendorid', 'passenger_count', 'trip_distance', 'ratecodeid', 'pulocationid',
+                                                 'dolocationid', 'payment_type', 'fare_amount', 'extra', 'mta_tax',
+                                                 'tip_amount', 'tolls_amount', 'improvement_surcharge', 'total_amount',
+                                                 'congestion_surcharge', 'airport_fee'] # Add/remove based on your CSV
+                                 for col in numeric_cols:
+                                      if col in chunk_df.columns:
+                                          # First, attempt to convert to numeric, coercing errors
+                                          chunk_df[col] = pd.to_numeric(chunk_df[col], errors='coerce')
+                                          # Then, replace NaN with None
+                                          chunk_df[col] = chunk_df[col].replace({np.nan: None})
+
+
+                                 # Convert boolean columns to INTEGER (0 or 1)
+                                 # Assuming boolean columns exist and are correctly identified by pandas
+                                 bool_cols = chunk_df.select_dtypes(include='bool').columns
+                                 for col in bool_cols:
+                                     chunk_df[col] = chunk_df[col].astype(int)
 
 
                         except Exception as cast_error:
@@ -202,6 +595,10 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                              # Log the error but attempt to insert the chunk anyway
 
 
+                        # 导入校验: 按插入的数据统计行数、NULL 数和列校验和 (向量化，计时窗口之外)
+                        verification_stats = verifier.chunk_stats(chunk_df, raw_nulls) if verifier is not None else None
+                        if memory_tracker is not None:
+                            memory_tracker.mark('cast')
                         print(f"处理块 {chunk_index} ({rows_in_chunk} 行)...")
 
                         # --- 插入数据块并计时 ---
@@ -211,11 +608,17 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                         pre_disk_io = pre_insert_metrics.get('disk_io_counters', None)
 
 
+                        attribution_overhead = 0.0 # 计时窗口内内存归因快照本身的耗时，从插入耗时中扣除
                         try:
                             # Convert DataFrame rows to a list of tuples for executemany
                             # .values returns a numpy array, .tolist() converts it to list of lists
                             # Convert inner lists to tuples
                             data_to_insert = [tuple(row) for row in chunk_df.values.tolist()]
+                            # 阶段 to_tuples: values.tolist() 和元组副本 (只在开启内存归因时单独划分)
+                            if memory_tracker is not None:
+                                mark_start = time.time()
+                                memory_tracker.mark('to_tuples')
+                                attribution_overhead = time.time() - mark_start
 
                             # Use executemany for efficient insertion of multiple rows
                             cursor.executemany(insert_sql, data_to_insert)
@@ -234,6 +637,14 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                                 'end_time_utc': time.time(),
                                 'system_metrics_at_error': get_system_metrics() # 记录出错时的系统状态
                              }
+                             conn.rollback() # 丢弃 executemany 已写入的部分行，否则会随下一块的 commit 一起提交
+                             slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                             if slow_chunk_profile is not None:
+                                 log_entry['slow_chunk_profile'] = slow_chunk_profile
+                             if memory_tracker is not None:
+                                 log_entry['memory_attribution'] = memory_tracker.end_chunk('insert')
+                             if verifier is not None:
+                                 verifier.add_failed_chunk(rows_in_chunk)
                              log_f.write(json.dumps(log_entry) + '\n')
                              log_f.flush() # Ensure log is written immediately
                              print(f"  -> 块 {chunk_index} 插入失败。")
@@ -253,6 +664,14 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                                 'end_time_utc': time.time(),
                                 'system_metrics_at_error': get_system_metrics() # Record system state at error
                              }
+                             conn.rollback() # 丢弃 executemany 已写入的部分行，否则会随下一块的 commit 一起提交
+                             slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+                             if slow_chunk_profile is not None:
+                                 log_entry['slow_chunk_profile'] = slow_chunk_profile
+                             if memory_tracker is not None:
+                                 log_entry['memory_attribution'] = memory_tracker.end_chunk('insert')
+                             if verifier is not None:
+                                 verifier.add_failed_chunk(rows_in_chunk)
                              log_f.write(json.dumps(log_entry) + '\n')
                              log_f.flush()
                              print(f"  -> 块 {chunk_index} 插入失败。")
@@ -260,12 +679,15 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
 
 
                         end_time = time.time()
-                        time_taken_chunk = end_time - start_time
+                        time_taken_chunk = end_time - start_time - attribution_overhead
+                        if memory_tracker is not None:
+                            memory_tracker.mark('insert')
                         # Avoid division by zero if time taken is negligible
                         time_taken_chunk = max(time_taken_chunk, 0.0001)
 
                         total_time_taken += time_taken_chunk
                         total_rows_ingested += rows_in_chunk
+                        total_logical_bytes += logical_bytes
 
                         # --- 计算速率 ---
                         # 速率 = 行数 / 时间 (秒)
@@ -293,6 +715,29 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                              disk_io_delta = {'read_bytes_delta': 0, 'write_bytes_delta': 0, 'read_count_delta': 0, 'write_count_delta': 0}
 
 
+                        # --- 存储增长和写放大统计 (在计时窗口之外) ---
+                        # 进程写入字节按 "自上一块以来" 统计，包含引擎后台线程的写入
+                        process_write_bytes = get_process_write_bytes()
+                        chunk_write_bytes = process_write_bytes - prev_process_write_bytes if process_write_bytes >= 0 else -1
+                        total_write_bytes = process_write_bytes - run_start_write_bytes if process_write_bytes >= 0 else -1
+                        prev_process_write_bytes = process_write_bytes
+                        storage_metrics = get_storage_metrics(db_file, [db_file + '-wal', db_file + '-journal'], None)
+
+                        # --- 引擎内部探针 (每 N 个块采样一次，计时窗口之外) ---
+                        engine_probe = None
+                        if probe_every_n_chunks and chunk_index % probe_every_n_chunks == 0:
+                            probe_start = time.time()
+                            engine_probe = probe_sqlite_internals(conn, db_file, probe_state)
+                            engine_probe['probe_time_seconds'] = round(time.time() - probe_start, 4)
+
+                        # --- 慢块分析: 本块耗时超过动态 p99 时保存调用栈和内存快照 ---
+                        slow_chunk_profile = profiler.end_chunk(chunk_index) if profiler is not None else None
+
+                        chunk_verification = verifier.add_chunk(verification_stats) if verifier is not None else None
+
+                        # 阶段 metrics: 系统指标、存储统计、探针和慢块分析
+                        memory_attribution = memory_tracker.end_chunk('metrics') if memory_tracker is not None else None
+
                         # --- 记录日志 ---
                         log_entry = {
                             'timestamp': datetime.now().isoformat(), # Use log write time
@@ -307,6 +752,7 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                                  'cpu_percent': post_insert_metrics.get('cpu_percent', -1),
                                  'memory_percent': post_insert_metrics.get('memory_percent', -1),
                                  'memory_used_gb': post_insert_metrics.get('memory_used_gb', -1),
+                                 **get_process_memory(), # 本进程的 RSS 和 RSS 历史最高值，不受其他进程影响
                                  # You could also log post_insert_metrics['disk_io_counters'] here if needed
                              },
                             'disk_io_delta_during_chunk_bytes': {
@@ -316,10 +762,37 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                             'disk_io_delta_during_chunk_count': {
                                 'read': disk_io_delta['read_count_delta'],
                                 'write': disk_io_delta['write_count_delta']
+                            },
+                            'storage_accounting': {
+                                'logical_bytes_ingested': logical_bytes,
+                                'total_logical_bytes_ingested_so_far': total_logical_bytes,
+                                'db_file_bytes': storage_metrics['db_file_bytes'],
+                                'wal_bytes': storage_metrics['wal_bytes'],
+                                'temp_bytes': storage_metrics['temp_bytes'],
+                                'process_write_bytes_during_chunk': chunk_write_bytes,
+                                'total_process_write_bytes_so_far': total_write_bytes,
+                                'write_amplification': write_amplification(chunk_write_bytes, logical_bytes),
+                                'cumulative_write_amplification': write_amplification(total_write_bytes, total_logical_bytes),
                             }
                         }
+                        if engine_probe is not None:
+                            log_entry['engine_probe'] = engine_probe
+                        if slow_chunk_profile is not None:
+                            log_entry['slow_chunk_profile'] = slow_chunk_profile
+                        if memory_attribution is not None:
+                            log_entry['memory_attribution'] = memory_attribution
+                        if chunk_filter_accounting is not None:
+                            log_entry['filter_accounting'] = chunk_filter_accounting
+                        if chunk_verification is not None:
+                            log_entry['verification'] = chunk_verification
 
                         log_f.write(json.dumps(log_entry) + '\n') # Write one JSON object per line
+
+                        # --- 内存压力检查 (计时窗口之外)，每次干预单独记录一行 ---
+                        if governor is not None:
+                            for governor_record in governor.check(chunk_index):
+                                log_f.write(json.dumps(governor_record) + '\n')
+                                print(f"  -> 内存调节: {governor_record['action']} (内存占用 {governor_record['memory_usage_ratio']:.1%}, 块大小 {governor_record['chunk_size']})")
                         log_f.flush() # Ensure data is written to file immediately
 
                         # --- Print current progress and rate ---
@@ -327,6 +800,11 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                         print(f"  -> 累计插入: {total_rows_ingested} 行，总耗时: {total_time_taken:.4f} 秒。")
                         print(f"  -> CPU: {log_entry['system_metrics_after_chunk'].get('cpu_percent', -1):.1f}%, Mem: {log_entry['system_metrics_after_chunk'].get('memory_percent', -1):.1f}% ({log_entry['system_metrics_after_chunk'].get('memory_used_gb', -1):.2f} GB used)")
                         print(f"  -> Disk I/O (this chunk): Read {disk_io_delta['read_bytes_delta']/1024/1024:.2f} MB, Write {disk_io_delta['write_bytes_delta']/1024/1024:.2f} MB")
+                        print(f"  -> 存储: DB {storage_metrics['db_file_bytes']/1024/1024:.2f} MB, WAL {storage_metrics['wal_bytes']/1024/1024:.2f} MB, 累计写放大 {log_entry['storage_accounting']['cumulative_write_amplification']}")
+                        if engine_probe is not None and 'error' not in engine_probe:
+                            print(f"  -> SQLite 探针: {engine_probe['page_count']} 页 (空闲 {engine_probe['freelist_count']}), WAL 高水位帧数 {engine_probe['wal_frames_high_water']}, checkpoint 次数 {engine_probe['checkpoint_events_since_last_probe']}")
+                        if slow_chunk_profile is not None:
+                            print(f"  -> 慢块: {slow_chunk_profile['chunk_wall_seconds']:.4f} 秒 > p99 {slow_chunk_profile['threshold_seconds']:.4f} 秒，分析文件: {slow_chunk_profile['collapsed_stacks_file']}")
 
 
                 except pd.errors.EmptyDataError:
@@ -335,9 +813,41 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
                     print(f"错误: CSV 文件未找到在 {csv_file}")
                 except Exception as e:
                     print(f"读取或处理 CSV 块时发生意外错误: {e}")
+                finally:
+                    if profiler is not None:
+                        profiler.stop()
+                    if memory_tracker is not None:
+                        memory_tracker.stop()
+                        # 整个运行的阶段汇总单独记录一行
+                        log_f.write(json.dumps({'timestamp': datetime.now().isoformat(),
+                                                'status': 'MEMORY_ATTRIBUTION_SUMMARY',
+                                                'phases': memory_tracker.summary()}) + '\n')
+                    if csv_handle is not None:
+                        csv_handle.close()
+                    if parsed_cache_meta is not None and csv_iterator is not None:
+                        csv_iterator.close()
 
             print("\n所有数据块处理完毕。")
 
+            # --- 收尾阶段: 让表可以高效查询所需的步骤，每一步单独记录 ---
+            if finalize_enabled:
+                print("\n开始收尾阶段...")
+                finalize_start_time = time.time()
+                with open(log_file, 'a', encoding='utf-8') as log_f:
+                    finalize_records = finalize_sqlite(conn, db_file, table_name, finalize_index_columns, log_f,
+                                                       vacuum=finalize_vacuum)
+                    finalize_summary = write_finalize_summary(log_f, run_start_time, finalize_start_time,
+                                                              total_rows_ingested, total_time_taken,
+                                                              finalize_records, [db_file, db_file + '-wal', db_file + '-journal'])
+
+            # --- 导入校验: 聚合查询下推到 SQLite，与导入时的输入端统计对比 ---
+            if verifier is not None:
+                print("\n开始导入校验...")
+                register_sqlite_checksum_functions(conn)
+                with open(log_file, 'a', encoding='utf-8') as log_f:
+                    verification = verifier.verify(conn, table_name, SQLITE_CHECKSUM_SQL, total_rows_dropped)
+                    log_f.write(json.dumps(verification) + '\n')
+
         # Database connection is closed automatically when exiting the 'with' block
         print("SQLite 连接已关闭。")
 
@@ -353,10 +863,32 @@ def ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_siz
         print(f"总共插入行数: {total_rows_ingested}")
         print(f"总耗时: {total_time_taken:.4f} 秒")
         print(f"整体平均插入速率: {overall_avg_rate:.2f} 行/秒")
+        if governor is not None:
+            print(f"内存调节器干预次数: {governor.interventions}")
+        if profiler is not None:
+            print(f"慢块分析文件: {profiler.profiles_written} 个，目录: {profiler.profile_dir}")
+        if memory_tracker is not None:
+            memory_tracker.print_summary()
+        if source_columns is not None or row_filter:
+            print(f"投影/过滤丢弃: {total_rows_dropped} 行，约 {total_bytes_dropped / 1024 / 1024:.2f} MB 原始 CSV 字节")
+        if verification is not None:
+            print_verification(verification)
+        if finalize_summary is not None:
+            print_finalize_summary(finalize_summary)
         print(f"详细日志已保存到: {log_file}")
         print("请检查日志文件分析插入速率，并结合系统监控数据（CPU、内存、磁盘 I/O）。")
 
 
 # --- Run script ---
 if __name__ == "__main__":
-    ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_size)
+    ingest_and_monitor_sqlite(csv_file, db_file, table_name, log_file, chunk_size,
+                              storage_encoding=storage_encoding, without_rowid=sqlite_without_rowid,
+                              journal_mode=sqlite_journal_mode, probe_every_n_chunks=engine_probe_every_n_chunks,
+                              memory_governor_enabled=memory_governor_enabled,
+                              use_parsed_cache=use_parsed_cache, parsed_cache_dir=parsed_cache_dir,
+                              profile_slow_chunks=profile_slow_chunks, profile_dir=slow_chunk_profile_dir,
+                              profile_trace_memory=profile_slow_chunks_trace_memory,
+                              memory_attribution_enabled=memory_attribution_enabled,
+                              projection_columns=projection_columns, row_filter=row_filter,
+                              finalize_enabled=finalize_enabled, finalize_index_columns=finalize_index_columns,
+                              finalize_vacuum=finalize_vacuum, verify_enabled=verify_enabled)
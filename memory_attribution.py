@@ -0,0 +1,114 @@
+import tracemalloc
+import psutil
+from ingest_utils import get_process_peak_rss_bytes
+
+# --- 按阶段的内存归因 ---
+# 在每块的阶段边界 (读取/解析 CSV -> 类型转换 -> [转成元组] -> 插入 -> 指标采集) 记录:
+#   进程 RSS、Python 堆 (tracemalloc 当前值和阶段内峰值)、引擎自报的内存 (DuckDB duckdb_memory())
+# 每个阶段得到 "峰值" (阶段内临时分配的最高点) 和 "保留" (阶段结束时比开始时多出的内存)，
+# 用来判断 RSS 增长来自 pandas 临时副本、泄漏的 DataFrame 还是数据库引擎本身。
+# tracemalloc 会明显降低导入速度，这个模式只用于诊断，不要和吞吐量测试同时开启。
+
+_MB = 1024 * 1024
+
+
+class PhaseMemoryTracker:
+    """导入循环中的阶段内存记录器
+
+    engine_memory_fn: 返回引擎当前内存占用 (字节) 的函数，例如 DuckDB 的 sum(duckdb_memory())；None 表示不记录
+    """
+
+    def __init__(self, engine_memory_fn=None, tracemalloc_frames=1):
+        self.engine_memory_fn = engine_memory_fn
+        self.tracemalloc_frames = tracemalloc_frames
+        self.process = psutil.Process()
+        self.phases = {} # 当前块: 阶段名 -> 记录
+        self.totals = {} # 整个运行: 阶段名 -> 汇总
+        self._last = None
+        self._started_tracemalloc = False
+
+    def _engine_memory(self):
+        if self.engine_memory_fn is None:
+            return None
+        try:
+            return int(self.engine_memory_fn() or 0)
+        except Exception as e:
+            print(f"读取引擎内存时发生错误: {e}")
+            return None
+
+    def _snapshot(self):
+        heap_current, heap_peak = tracemalloc.get_traced_memory()
+        return {
+            'rss': self.process.memory_info().rss,
+            'rss_high_water': get_process_peak_rss_bytes(),
+            'heap': heap_current,
+            'heap_peak': heap_peak,
+            'engine': self._engine_memory(),
+        }
+
+    def start(self):
+        """开启 tracemalloc 并记录第一个阶段边界"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        self._last = self._snapshot()
+
+    def mark(self, phase):
+        """结束名为 phase 的阶段 (从上一个边界到现在)，记录该阶段的内存变化"""
+        now = self._snapshot()
+        last = self._last
+        record = {
+            'rss_bytes': now['rss'],
+            'rss_retained_bytes': now['rss'] - last['rss'],
+            'rss_high_water_growth_bytes': now['rss_high_water'] - last['rss_high_water'],
+            'python_heap_bytes': now['heap'],
+            'python_heap_peak_bytes': now['heap_peak'] - last['heap'], # 阶段内相对起点的临时分配峰值
+            'python_heap_retained_bytes': now['heap'] - last['heap'],
+        }
+        if now['engine'] is not None:
+            record['engine_memory_bytes'] = now['engine']
+            record['engine_retained_bytes'] = now['engine'] - last['engine'] if last['engine'] is not None else None
+        self.phases[phase] = record
+
+        totals = self.totals.setdefault(phase, {
+            'count': 0, 'peak_rss_bytes': 0, 'peak_python_heap_bytes': 0, 'max_python_heap_peak_bytes': 0,
+            'total_rss_retained_bytes': 0, 'total_python_heap_retained_bytes': 0,
+            'total_rss_high_water_growth_bytes': 0, 'total_engine_retained_bytes': 0,
+        })
+        totals['count'] += 1
+        totals['peak_rss_bytes'] = max(totals['peak_rss_bytes'], now['rss'])
+        totals['peak_python_heap_bytes'] = max(totals['peak_python_heap_bytes'], now['heap_peak'])
+        totals['max_python_heap_peak_bytes'] = max(totals['max_python_heap_peak_bytes'], record['python_heap_peak_bytes'])
+        totals['total_rss_retained_bytes'] += record['rss_retained_bytes']
+        totals['total_python_heap_retained_bytes'] += record['python_heap_retained_bytes']
+        totals['total_rss_high_water_growth_bytes'] += record['rss_high_water_growth_bytes']
+        if record.get('engine_retained_bytes') is not None:
+            totals['total_engine_retained_bytes'] += record['engine_retained_bytes']
+
+        tracemalloc.reset_peak()
+        self._last = self._snapshot() # 重新取快照，不把记录本身的开销算进下一阶段
+        return record
+
+    def end_chunk(self, phase):
+        """结束当前块的最后一个阶段，返回本块所有阶段的记录 (写入日志的 memory_attribution 字段)"""
+        self.mark(phase)
+        phases, self.phases = self.phases, {}
+        return phases
+
+    def summary(self):
+        """每个阶段的峰值和保留内存汇总，按累计 RSS 保留量从大到小排列"""
+        return dict(sorted(self.totals.items(), key=lambda item: item[1]['total_rss_retained_bytes'], reverse=True))
+
+    def print_summary(self):
+        print("\n--- 按阶段的内存归因 ---")
+        print(f"{'phase':<12}{'RSS retained MB':>17}{'RSS HWM growth MB':>19}{'heap retained MB':>18}"
+              f"{'max heap peak MB':>18}{'engine retained MB':>20}")
+        for phase, t in self.summary().items():
+            print(f"{phase:<12}{t['total_rss_retained_bytes'] / _MB:>17.2f}{t['total_rss_high_water_growth_bytes'] / _MB:>19.2f}"
+                  f"{t['total_python_heap_retained_bytes'] / _MB:>18.2f}{t['max_python_heap_peak_bytes'] / _MB:>18.2f}"
+                  f"{t['total_engine_retained_bytes'] / _MB:>20.2f}")
+
+    def stop(self):
+        if self._started_tracemalloc:
+            tracemalloc.stop()
@@ -0,0 +1,165 @@
+import gc
+import time
+from datetime import datetime
+import psutil
+
+# --- 内存压力调节器 ---
+# 在导入循环中 (每块插入之后，计时窗口之外) 检查进程/容器内存，
+# 接近上限时依次: gc.collect() + 缩小块大小 -> 让引擎释放内存 (降低 memory_limit、checkpoint) -> 暂停等待。
+# 每次干预都返回一条日志记录 (status = 'MEMORY_GOVERNOR')，由导入脚本写入 JSONL。
+# 受限运行会变慢，但不会被 OOM killer 直接杀掉。
+
+# cgroup v1 没有限制时 limit_in_bytes 是一个接近 2^63 的数
+_CGROUP_V1_UNLIMITED = 1 << 60
+
+
+def _read_int_file(path):
+    try:
+        with open(path, 'r') as f:
+            value = f.read().strip()
+    except OSError:
+        return None
+    if value == 'max':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+def _read_inactive_file(stat_path, key):
+    try:
+        with open(stat_path, 'r') as f:
+            for line in f:
+                name, _, value = line.partition(' ')
+                if name == key:
+                    return int(value)
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def read_cgroup_memory():
+    """读取容器 (cgroup v2 / v1) 的内存使用和上限，返回 (usage_bytes, limit_bytes)；没有限制时返回 (None, None)
+
+    使用量扣除 inactive_file (可回收的页缓存)，与 docker stats 的口径一致
+    """
+    # cgroup v2
+    limit = _read_int_file('/sys/fs/cgroup/memory.max')
+    usage = _read_int_file('/sys/fs/cgroup/memory.current')
+    if limit is not None and usage is not None:
+        return usage - _read_inactive_file('/sys/fs/cgroup/memory.stat', 'inactive_file'), limit
+    # cgroup v1
+    limit = _read_int_file('/sys/fs/cgroup/memory/memory.limit_in_bytes')
+    usage = _read_int_file('/sys/fs/cgroup/memory/memory.usage_in_bytes')
+    if limit is not None and usage is not None and limit < _CGROUP_V1_UNLIMITED:
+        return usage - _read_inactive_file('/sys/fs/cgroup/memory/memory.stat', 'total_inactive_file'), limit
+    return None, None
+
+
+def read_memory_usage():
+    """返回 (usage_bytes, limit_bytes, source)：优先容器 cgroup，否则用进程 RSS 对比物理内存"""
+    usage, limit = read_cgroup_memory()
+    if limit is not None:
+        return usage, limit, 'cgroup'
+    return psutil.Process().memory_info().rss, psutil.virtual_memory().total, 'process_rss'
+
+
+class MemoryGovernor:
+    """导入循环中的内存压力调节器
+
+    chunk_size: 初始块大小 (行数)，压力大时减半，压力解除后逐步恢复
+    relief_callback: 引擎相关的释放内存函数 (例如降低 DuckDB memory_limit 并 CHECKPOINT)，返回描述动作的 dict
+    """
+
+    def __init__(self, chunk_size, soft_ratio=0.75, hard_ratio=0.90, min_chunk_size=1000,
+                 max_pause_seconds=30, pause_interval_seconds=0.5, recover_after_chunks=5,
+                 relief_callback=None):
+        self.initial_chunk_size = chunk_size
+        self.chunk_size = chunk_size
+        self.soft_ratio = soft_ratio
+        self.hard_ratio = hard_ratio
+        self.min_chunk_size = min(min_chunk_size, chunk_size)
+        self.max_pause_seconds = max_pause_seconds
+        self.pause_interval_seconds = pause_interval_seconds
+        self.recover_after_chunks = recover_after_chunks
+        self.relief_callback = relief_callback
+        self.calm_chunks = 0 # 连续低于 soft 阈值的块数
+        self.interventions = 0
+
+    def memory_budget(self, fraction):
+        """返回容器/物理内存上限乘以 fraction 的字节数，用于把引擎的内存限制和容器限制绑定"""
+        _, limit, _ = read_memory_usage()
+        return int(limit * fraction)
+
+    def iter_chunks(self, reader):
+        """替代 `for chunk in reader`：每次按当前 self.chunk_size 从 pandas TextFileReader 读取"""
+        while True:
+            try:
+                yield reader.get_chunk(self.chunk_size)
+            except StopIteration:
+                return
+
+    def _record(self, chunk_index, action, usage, limit, source, **details):
+        self.interventions += 1
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'chunk_index': chunk_index,
+            'status': 'MEMORY_GOVERNOR',
+            'action': action,
+            'memory_source': source,
+            'memory_usage_bytes': usage,
+            'memory_limit_bytes': limit,
+            'memory_usage_ratio': round(usage / limit, 4) if limit else None,
+            'chunk_size': self.chunk_size,
+            **details,
+        }
+
+    def check(self, chunk_index):
+        """检查内存压力并执行必要的干预，返回本次的干预日志记录列表 (没有干预时为空列表)"""
+        records = []
+        usage, limit, source = read_memory_usage()
+        ratio = usage / limit if limit else 0
+
+        if ratio < self.soft_ratio:
+            # 压力解除一段时间后逐步恢复块大小
+            self.calm_chunks += 1
+            if self.chunk_size < self.initial_chunk_size and self.calm_chunks >= self.recover_after_chunks:
+                old_size = self.chunk_size
+                self.chunk_size = min(self.chunk_size * 2, self.initial_chunk_size)
+                self.calm_chunks = 0
+                records.append(self._record(chunk_index, 'grow_chunk_size', usage, limit, source,
+                                            previous_chunk_size=old_size))
+            return records
+        self.calm_chunks = 0
+
+        # soft: 回收 Python 垃圾并缩小块大小
+        collected = gc.collect()
+        old_size = self.chunk_size
+        self.chunk_size = max(self.chunk_size // 2, self.min_chunk_size)
+        usage, limit, source = read_memory_usage()
+        records.append(self._record(chunk_index, 'gc_and_shrink_chunk_size', usage, limit, source,
+                                    gc_collected_objects=collected, previous_chunk_size=old_size))
+        if usage / limit < self.hard_ratio:
+            return records
+
+        # hard: 让引擎释放内存
+        if self.relief_callback is not None:
+            try:
+                details = self.relief_callback() or {}
+            except Exception as e:
+                details = {'error': str(e)}
+            usage, limit, source = read_memory_usage()
+            records.append(self._record(chunk_index, 'engine_relief', usage, limit, source, **details))
+        if usage / limit < self.hard_ratio:
+            return records
+
+        # 仍然超过 hard: 暂停，等待后台 flush/checkpoint 完成或其他进程释放内存
+        pause_start = time.time()
+        while usage / limit >= self.hard_ratio and time.time() - pause_start < self.max_pause_seconds:
+            time.sleep(self.pause_interval_seconds)
+            gc.collect()
+            usage, limit, source = read_memory_usage()
+        records.append(self._record(chunk_index, 'pause', usage, limit, source,
+                                    paused_seconds=round(time.time() - pause_start, 3)))
+        return records
@@ -0,0 +1,103 @@
+import json
+import pandas as pd
+import matplotlib.pyplot as plt
+import os # 导入 os 模块用于创建目录
+
+# --- 配置参数 ---
+# 各引擎的日志文件路径 (需要包含 storage_accounting 字段的新日志)
+engine_logs = {
+    'DuckDB': 'log/ingestion_log_2cpu_256mbram.jsonl',
+    'SQLite': 'log/ingestion_log_sqlite.jsonl',
+    'RocksDB': 'log/rocksdb_ingestion_log_cpp.jsonl',
+}
+
+# 图表保存路径和文件名
+output_plot_path = 'plots/write_amplification.png'
+
+# --- 确保图表输出目录存在 ---
+output_dir = os.path.dirname(output_plot_path)
+if output_dir and not os.path.exists(output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"确保图表输出目录存在: {output_dir}")
+
+
+def load_storage_accounting(log_file):
+    """读取日志中成功块的 storage_accounting 字段，返回 DataFrame (没有该字段的旧日志返回空 DataFrame)"""
+    rows = []
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                log_entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"跳过无效的 JSON 行 (解析错误: {e}): {line.strip()}")
+                continue
+            storage = log_entry.get('storage_accounting')
+            if log_entry.get('status') != 'SUCCESS' or not isinstance(storage, dict):
+                continue
+            rows.append({'chunk_index': int(log_entry['chunk_index']),
+                         'rows': log_entry.get('total_rows_ingested_so_far', 0),
+                         **storage})
+    return pd.DataFrame(rows)
+
+
+def derive_metrics(df):
+    """由原始字段统一计算三个引擎的指标，不依赖各引擎自己算好的写放大"""
+    df = df.sort_values('chunk_index').copy()
+    logical = df['total_logical_bytes_ingested_so_far'].replace(0, pd.NA)
+    written = df['total_process_write_bytes_so_far'].where(df['total_process_write_bytes_so_far'] >= 0)
+    on_disk = df['db_file_bytes'] + df['wal_bytes'] + df['temp_bytes'].fillna(0)
+    df['logical_mb'] = df['total_logical_bytes_ingested_so_far'] / (1024 * 1024)
+    df['on_disk_mb'] = on_disk / (1024 * 1024)
+    df['cumulative_write_amplification'] = (written / logical).astype(float)
+    df['space_amplification'] = (on_disk / logical).astype(float)
+    df['on_disk_bytes_per_row'] = on_disk / df['rows'].replace(0, pd.NA)
+    return df
+
+
+# --- 读取和解析日志文件 ---
+engine_frames = {}
+for engine, log_file in engine_logs.items():
+    try:
+        print(f"正在读取日志文件: {log_file}")
+        df = load_storage_accounting(log_file)
+    except FileNotFoundError:
+        print(f"未找到 {engine} 的日志文件 {log_file}，跳过。")
+        continue
+    if df.empty:
+        print(f"{engine} 的日志中没有 storage_accounting 字段 (旧日志?)，请用新版导入程序重新生成。")
+        continue
+    if engine == 'RocksDB' and 'logical_bytes_source' not in df.columns:
+        # 旧版 insert_test 按解析后的字段长度统计逻辑字节，写放大与按原始 CSV 字节统计的 Python 导入脚本不可比较
+        print(f"{engine} 的日志来自旧版 insert_test (逻辑字节定义不同，写放大不可比较)，请重新编译后再导入。")
+        continue
+    engine_frames[engine] = derive_metrics(df)
+
+# --- 绘图 ---
+if not engine_frames:
+    print("没有可用于绘图的存储统计数据。")
+else:
+    print("正在生成图表...")
+    fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(15, 10), sharex=True)
+
+    print("\n--- 写放大总结 (最后一块) ---")
+    for engine, df in engine_frames.items():
+        axes[0].plot(df['logical_mb'], df['cumulative_write_amplification'], label=engine)
+        axes[1].plot(df['logical_mb'], df['on_disk_mb'], label=engine)
+        last = df.iloc[-1]
+        print(f"{engine}: 逻辑导入 {last['logical_mb']:.1f} MB, 磁盘占用 {last['on_disk_mb']:.1f} MB, "
+              f"写放大 {last['cumulative_write_amplification']:.2f}, 空间放大 {last['space_amplification']:.2f}, "
+              f"{last['on_disk_bytes_per_row']:.1f} B/row")
+
+    axes[0].set_ylabel('Cumulative Write Amplification')
+    axes[0].set_title('Write Amplification and Storage Growth by Engine')
+    axes[0].grid(True, linestyle='--', alpha=0.6)
+    axes[0].legend(loc='upper right')
+
+    axes[1].set_ylabel('DB + WAL + Temp Size (MB)')
+    axes[1].set_xlabel('Logical Bytes Ingested (MB of raw CSV)')
+    axes[1].grid(True, linestyle='--', alpha=0.6)
+    axes[1].legend(loc='upper left')
+
+    plt.tight_layout() # 自动调整子图布局以防止重叠
+    plt.savefig(output_plot_path, bbox_inches='tight') # bbox_inches='tight' 防止标签被截断
+    print(f"图表已保存到: {output_plot_path}")
@@ -0,0 +1,243 @@
+import os
+import sys
+import json
+import math
+import argparse
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# --- 吞吐量回归门禁 ---
+# save:    从 JSONL 日志汇总一个 (engine, config) 的基线 (每块吞吐量分布、p99 块延迟、进程峰值 RSS)，保存到 baselines/
+# compare: 用单侧 Mann-Whitney U 检验 + 中位数比值的 bootstrap 置信区间比较新日志和基线，
+#          出现显著回归时以非零状态码退出，可以直接放进 CI 或调参脚本
+# 同一次运行中相邻块的吞吐量强相关 (缓存、checkpoint、后台合并都跨越多个块)，逐块样本不满足检验要求的独立性，
+# 直接检验会得到过小的 p 值。因此先把连续的 block_size 个块分成一组、取组内中位数 (末尾不足一组的块丢弃)，
+# 检验和 bootstrap 都在组中位数上进行；任一方少于 MIN_BLOCKS 组时不做吞吐量检验。
+# 报告中给出逐块吞吐量的一阶自相关系数，接近 0 时可以减小 --block-size，明显为正时应增大。
+
+baseline_dir = 'baselines'
+# 退出码
+EXIT_OK = 0
+EXIT_REGRESSION = 1
+EXIT_ERROR = 2
+# 吞吐量检验每一方至少需要的组数 (5 对 5 时正态近似下单侧检验能达到的最小 p 值约为 0.006，低于默认 alpha)
+MIN_BLOCKS = 5
+
+
+def _chunk_peak_rss_bytes(entry):
+    """一块日志中导入进程的峰值 RSS (字节)
+
+    优先用 system_metrics_after_chunk 的 process_peak_rss_bytes (ru_maxrss)，其次用内存归因各阶段的 rss_bytes；
+    不使用整机的 memory_used_gb (按 GB 取整且包含其他进程)。都没有时返回 None
+    """
+    peak = entry.get('system_metrics_after_chunk', {}).get('process_peak_rss_bytes')
+    if peak is not None and peak >= 0:
+        return peak
+    phases = entry.get('memory_attribution') or {}
+    phase_rss = [p['rss_bytes'] for p in phases.values() if p.get('rss_bytes') is not None]
+    return max(phase_rss) if phase_rss else None
+
+
+def load_run(log_file, skip_warmup=0):
+    """读取日志中的成功块，返回 (每块吞吐量, 每块耗时, 进程峰值 RSS 字节)；跳过前 skip_warmup 个块"""
+    rates, latencies, memory = [], [], []
+    with open(log_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if entry.get('status') != 'SUCCESS':
+                continue
+            if int(entry.get('chunk_index', 0)) <= skip_warmup:
+                continue
+            rates.append(entry['ingestion_rate_rows_per_sec'])
+            latencies.append(entry['time_taken_seconds'])
+            peak_rss = _chunk_peak_rss_bytes(entry)
+            if peak_rss is not None:
+                memory.append(peak_rss)
+    return np.array(rates, dtype=float), np.array(latencies, dtype=float), (max(memory) if memory else None)
+
+
+def summarize_run(rates, latencies, peak_rss_bytes):
+    return {
+        'chunks': int(len(rates)),
+        'rate_mean': round(float(np.mean(rates)), 2),
+        'rate_median': round(float(np.median(rates)), 2),
+        'rate_p5': round(float(np.percentile(rates, 5)), 2),
+        'rate_p95': round(float(np.percentile(rates, 95)), 2),
+        'latency_p50_seconds': round(float(np.percentile(latencies, 50)), 4),
+        'latency_p99_seconds': round(float(np.percentile(latencies, 99)), 4),
+        'peak_rss_bytes': peak_rss_bytes,
+    }
+
+
+def block_medians(samples, block_size):
+    """把连续的 block_size 个样本分成一组，返回各组的中位数；末尾不足一组的样本丢弃"""
+    n_blocks = len(samples) // block_size
+    if n_blocks == 0:
+        return np.empty(0)
+    return np.median(np.asarray(samples[:n_blocks * block_size], dtype=float).reshape(n_blocks, block_size), axis=1)
+
+
+def lag1_autocorrelation(samples):
+    """相邻样本的一阶自相关系数；样本太少或没有波动时返回 None"""
+    samples = np.asarray(samples, dtype=float)
+    if len(samples) < 3 or np.std(samples) == 0:
+        return None
+    return float(np.corrcoef(samples[:-1], samples[1:])[0, 1])
+
+
+def mann_whitney_less(new, base):
+    """单侧 Mann-Whitney U 检验 (备择假设: new 的分布小于 base)，正态近似 + 并列校正 + 连续性校正，返回 (U, p)"""
+    n1, n2 = len(new), len(base)
+    ranks = pd.Series(np.concatenate([new, base])).rank(method='average').to_numpy()
+    u = ranks[:n1].sum() - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    _, tie_counts = np.unique(np.concatenate([new, base]), return_counts=True)
+    tie_term = (tie_counts ** 3 - tie_counts).sum() / (n * (n - 1))
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term))
+    if sigma == 0:
+        return float(u), 1.0
+    z = (u - n1 * n2 / 2 + 0.5) / sigma
+    return float(u), 0.5 * math.erfc(-z / math.sqrt(2))
+
+
+def bootstrap_median_ratio(new, base, confidence=0.95, iterations=2000, seed=0):
+    """new/base 中位数比值的 bootstrap 百分位置信区间"""
+    rng = np.random.default_rng(seed)
+    new_medians = np.median(rng.choice(new, size=(iterations, len(new)), replace=True), axis=1)
+    base_medians = np.median(rng.choice(base, size=(iterations, len(base)), replace=True), axis=1)
+    ratios = new_medians / base_medians
+    tail = (1 - confidence) / 2 * 100
+    return float(np.percentile(ratios, tail)), float(np.percentile(ratios, 100 - tail))
+
+
+def baseline_path(engine, config):
+    return os.path.join(baseline_dir, f"{engine}__{config}.json")
+
+
+def save_baseline(args):
+    rates, latencies, peak_memory = load_run(args.log_file, args.skip_warmup)
+    if len(rates) == 0:
+        print(f"日志中没有成功的块: {args.log_file}")
+        return EXIT_ERROR
+    os.makedirs(baseline_dir, exist_ok=True)
+    baseline = {
+        'engine': args.engine,
+        'config': args.config,
+        'source_log': args.log_file,
+        'created': datetime.now().isoformat(),
+        'skip_warmup': args.skip_warmup,
+        'summary': summarize_run(rates, latencies, peak_memory),
+        # 保存原始样本，后续比较才能做分布检验
+        'rates': rates.round(2).tolist(),
+        'latencies': latencies.round(4).tolist(),
+    }
+    path = baseline_path(args.engine, args.config)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f)
+    print(f"基线已保存到: {path}")
+    print(json.dumps(baseline['summary'], indent=2))
+    return EXIT_OK
+
+
+def compare_to_baseline(args):
+    path = baseline_path(args.engine, args.config)
+    if not os.path.exists(path):
+        print(f"未找到基线: {path}，请先运行 save")
+        return EXIT_ERROR
+    with open(path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    base_rates, base_latencies = np.array(baseline['rates']), np.array(baseline['latencies'])
+    rates, latencies, peak_memory = load_run(args.log_file, baseline.get('skip_warmup', 0))
+    if len(rates) == 0:
+        print(f"日志中没有成功的块: {args.log_file}")
+        return EXIT_ERROR
+
+    summary = summarize_run(rates, latencies, peak_memory)
+    new_blocks, base_blocks = block_medians(rates, args.block_size), block_medians(base_rates, args.block_size)
+    enough_blocks = min(len(new_blocks), len(base_blocks)) >= MIN_BLOCKS
+    u, p_value, ci_low, ci_high = None, None, None, None
+    if enough_blocks:
+        u, p_value = mann_whitney_less(new_blocks, base_blocks)
+        ci_low, ci_high = bootstrap_median_ratio(new_blocks, base_blocks, confidence=1 - args.alpha)
+    median_ratio = float(np.median(rates) / np.median(base_rates))
+    p99_ratio = summary['latency_p99_seconds'] / max(float(np.percentile(base_latencies, 99)), 1e-9)
+    base_memory = baseline['summary'].get('peak_rss_bytes') # 旧基线只有整机 memory_used_gb，不参与比较
+
+    # 吞吐量回归: 统计显著 (p < alpha，置信区间整体低于 1) 且下降幅度超过 min_effect
+    checks = {
+        'throughput': enough_blocks and p_value < args.alpha and ci_high < 1.0 and median_ratio < 1 - args.min_effect,
+        'latency_p99': p99_ratio > 1 + args.latency_tolerance,
+        'peak_memory': (peak_memory is not None and base_memory is not None
+                        and peak_memory > base_memory * (1 + args.memory_tolerance)),
+    }
+
+    report = {
+        'timestamp': datetime.now().isoformat(),
+        'engine': args.engine,
+        'config': args.config,
+        'log_file': args.log_file,
+        'baseline': baseline['summary'],
+        'candidate': summary,
+        'block_size': args.block_size,
+        'blocks': {'candidate': len(new_blocks), 'baseline': len(base_blocks)},
+        'rate_lag1_autocorrelation': {'candidate': lag1_autocorrelation(rates), 'baseline': lag1_autocorrelation(base_rates)},
+        'mann_whitney_u': round(u, 2) if enough_blocks else None,
+        'p_value': p_value,
+        'median_ratio': round(median_ratio, 4),
+        'median_ratio_ci': [round(ci_low, 4), round(ci_high, 4)] if enough_blocks else None,
+        'latency_p99_ratio': round(p99_ratio, 4),
+        'regressions': [name for name, failed in checks.items() if failed],
+    }
+
+    print(f"--- {args.engine} / {args.config}: 新运行 vs 基线 ---")
+    if enough_blocks:
+        print(f"吞吐量中位数: {summary['rate_median']:.0f} vs {baseline['summary']['rate_median']:.0f} 行/秒 "
+              f"(比值 {median_ratio:.3f}，{(1 - args.alpha):.0%} CI [{ci_low:.3f}, {ci_high:.3f}]，"
+              f"Mann-Whitney p = {p_value:.4g}，{len(new_blocks)} vs {len(base_blocks)} 组 × {args.block_size} 块)")
+    else:
+        print(f"吞吐量中位数: {summary['rate_median']:.0f} vs {baseline['summary']['rate_median']:.0f} 行/秒 (比值 {median_ratio:.3f})；"
+              f"每组 {args.block_size} 块时只有 {len(new_blocks)} vs {len(base_blocks)} 组 (至少需要 {MIN_BLOCKS} 组)，跳过吞吐量检验")
+    print(f"p99 块延迟: {summary['latency_p99_seconds']:.4f} vs {baseline['summary']['latency_p99_seconds']:.4f} 秒 (比值 {p99_ratio:.3f})")
+    if peak_memory is not None and base_memory is not None:
+        print(f"进程峰值 RSS: {peak_memory / 1024 / 1024:.1f} vs {base_memory / 1024 / 1024:.1f} MB")
+    else:
+        print("进程峰值 RSS: 日志或基线中没有进程 RSS，跳过内存检查 (请用新版导入脚本重新生成基线)")
+    if args.report:
+        with open(args.report, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + '\n')
+
+    if report['regressions']:
+        print(f"检测到性能回归: {', '.join(report['regressions'])}")
+        return EXIT_REGRESSION
+    print("未检测到显著回归。")
+    return EXIT_OK
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='吞吐量回归门禁: 保存基线 / 与基线做统计比较')
+    sub = parser.add_subparsers(dest='command', required=True)
+    for name in ('save', 'compare'):
+        p = sub.add_parser(name)
+        p.add_argument('log_file', help='导入脚本生成的 JSONL 日志')
+        p.add_argument('--engine', required=True, help='例如 duckdb / sqlite / rocksdb')
+        p.add_argument('--config', required=True, help='配置标签，例如 2cpu_256mbram')
+    sub.choices['save'].add_argument('--skip-warmup', type=int, default=0, help='忽略前 N 个预热块')
+    compare = sub.choices['compare']
+    compare.add_argument('--alpha', type=float, default=0.01, help='显著性水平')
+    compare.add_argument('--block-size', type=int, default=10,
+                         help='连续多少个块合成一组 (取中位数) 再做检验，抵消相邻块之间的自相关')
+    compare.add_argument('--min-effect', type=float, default=0.05, help='吞吐量中位数下降超过该比例才算回归')
+    compare.add_argument('--latency-tolerance', type=float, default=0.25, help='p99 块延迟允许上升的比例')
+    compare.add_argument('--memory-tolerance', type=float, default=0.10, help='进程峰值 RSS 允许上升的比例')
+    compare.add_argument('--report', default=None, help='把比较结果追加写入该 JSONL 文件')
+    args = parser.parse_args(argv)
+    return save_baseline(args) if args.command == 'save' else compare_to_baseline(args)
+
+
+# --- Run script ---
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+# 导入脚本都是仓库根目录下的平铺模块
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+TAXI_HEADER = ('VendorID,tpep_pickup_datetime,tpep_dropoff_datetime,passenger_count,trip_distance,RatecodeID,'
+               'store_and_fwd_flag,PULocationID,DOLocationID,payment_type,fare_amount,extra,mta_tax,tip_amount,'
+               'tolls_amount,improvement_surcharge,total_amount,congestion_surcharge,airport_fee')
+
+
+def write_taxi_csv(path, rows):
+    """写一个和 2023 Yellow Taxi 数据同样表头的小 CSV；第 i 行的 trip_distance 为 i，store_and_fwd_flag 在 N / Y / 空之间轮换"""
+    flags = ['N', 'Y', '']
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(TAXI_HEADER + '\n')
+        for i in range(rows):
+            minute = i % 60
+            f.write(f"1,01/07/2023 12:{minute:02d}:44 PM,01/07/2023 01:{minute:02d}:35 PM,1,{i},1,{flags[i % 3]},"
+                    f"{100 + i % 7},{200 + i % 5},1,{10 + i % 13}.25,1.0,0.5,2.0,0.0,1.0,14.75,2.5,0.0\n")
+    return str(path)
+
+
+@pytest.fixture
+def taxi_csv(tmp_path):
+    return write_taxi_csv(tmp_path / 'taxi.csv', 30)
@@ -0,0 +1,28 @@
+import os
+import time
+import tracemalloc
+from chunk_profiler import SlowChunkProfiler
+
+
+def test_tracemalloc_is_opt_in(tmp_path):
+    profiler = SlowChunkProfiler(str(tmp_path))
+    profiler.start()
+    try:
+        assert not tracemalloc.is_tracing()
+    finally:
+        profiler.stop()
+
+
+def test_only_chunks_above_dynamic_threshold_are_profiled(tmp_path):
+    profiler = SlowChunkProfiler(str(tmp_path), min_samples=5)
+    profiler.start()
+    try:
+        results = [profiler.end_chunk(i) for i in range(1, 6)] # 窗口内样本不足，没有阈值
+        time.sleep(0.05)
+        slow = profiler.end_chunk(6)
+    finally:
+        profiler.stop()
+    assert results == [None] * 5
+    assert slow is not None and slow['chunk_wall_seconds'] >= 0.05
+    assert os.path.exists(os.path.join(profiler.profile_dir, 'chunk_6.collapsed'))
+    assert profiler.profiles_written == 1
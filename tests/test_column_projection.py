@@ -0,0 +1,35 @@
+import pandas as pd
+import pytest
+from column_projection import resolve_projection, apply_row_filter, filter_accounting, validate_row_filter
+
+
+def test_filter_accounting_splits_projection_and_filter_bytes():
+    # 1000 原始字节，保留列占 40%: 投影丢弃 600 字节；10 行中过滤 3 行，按比例丢弃剩余 400 字节的 30%
+    accounting = filter_accounting(rows_read=10, rows_dropped=3, logical_bytes=1000, column_byte_share=0.4, columns_kept=2)
+    assert accounting == {'rows_read': 10, 'rows_dropped': 3, 'columns_kept': 2,
+                          'bytes_dropped_by_projection': 600, 'bytes_dropped_by_filter': 120, 'bytes_dropped': 720}
+    assert filter_accounting(0, 0, 0, 1.0, 19)['bytes_dropped'] == 0
+
+
+def test_validate_row_filter_rejects_unknown_columns(taxi_csv):
+    validate_row_filter(taxi_csv, 'trip_distance > 5')
+    with pytest.raises(ValueError, match='no_such_column'):
+        validate_row_filter(taxi_csv, 'no_such_column > 5')
+    # 投影之后表达式只能引用保留的列
+    with pytest.raises(ValueError):
+        validate_row_filter(taxi_csv, 'fare_amount > 5', columns=resolve_projection(taxi_csv, ['trip_distance']))
+
+
+def test_row_filter_uses_raw_units_and_drops_null_results(taxi_csv):
+    chunk = pd.read_csv(taxi_csv, nrows=6)
+    chunk.columns = chunk.columns.str.lower()
+    filtered, dropped = apply_row_filter(chunk, "trip_distance >= 2 and store_and_fwd_flag == 'N'")
+    assert filtered['trip_distance'].tolist() == [3]
+    assert dropped == 5
+    assert list(filtered.index) == [3] # 保留原始行号
+
+
+def test_resolve_projection_is_case_insensitive_and_keeps_file_order(taxi_csv):
+    assert resolve_projection(taxi_csv, ['PULocationID', 'vendorid']) == ['VendorID', 'PULocationID']
+    with pytest.raises(ValueError):
+        resolve_projection(taxi_csv, ['missing'])
@@ -0,0 +1,23 @@
+import os
+import compare_engines
+from conftest import REPO_ROOT
+
+
+def test_build_marker_matches_rocksdb_source(tmp_path):
+    with open(os.path.join(REPO_ROOT, 'insert_rocksdb.cpp'), 'rb') as f:
+        assert compare_engines.rocksdb_build_marker in f.read()
+    stale = tmp_path / 'insert_test'
+    stale.write_bytes(b'\x7fELF old build without marker')
+    current = tmp_path / 'insert_test_new'
+    current.write_bytes(b'\x7fELF ...' + compare_engines.rocksdb_build_marker + b'...')
+    assert not compare_engines.binary_has_marker(str(stale), compare_engines.rocksdb_build_marker)
+    assert compare_engines.binary_has_marker(str(current), compare_engines.rocksdb_build_marker)
+
+
+def test_slice_keeps_header_and_first_rows(taxi_csv):
+    slice_path = compare_engines.make_slice(taxi_csv, 5)
+    with open(slice_path) as f:
+        lines = f.read().splitlines()
+    with open(taxi_csv) as f:
+        assert lines == f.read().splitlines()[:6]
+    assert compare_engines.make_slice(taxi_csv, None) == taxi_csv
@@ -0,0 +1,22 @@
+import sqlite3
+import pytest
+import concurrent_writers
+
+
+def test_failed_sqlite_writer_releases_the_write_lock(tmp_path):
+    db_file = str(tmp_path / 'w.sqlite')
+    with sqlite3.connect(db_file) as conn:
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("CREATE TABLE t (a REAL, b TEXT);")
+    # 第二块的参数类型不受支持: executemany 抛出的不是锁错误，不会被重试
+    chunks = [[(1.0, 'x')], [(2.0, object())]]
+    with pytest.raises(sqlite3.Error):
+        concurrent_writers.sqlite_writer(0, db_file, 't', chunks)
+
+    other = sqlite3.connect(db_file, timeout=0, isolation_level=None)
+    try:
+        other.execute("BEGIN IMMEDIATE;") # 失败的写入者仍持有写锁时这里会立即报 database is locked
+        other.execute("COMMIT;")
+        assert other.execute("SELECT count(*) FROM t;").fetchone()[0] == 1 # 第一块已提交，第二块已回滚
+    finally:
+        other.close()
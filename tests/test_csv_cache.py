@@ -0,0 +1,52 @@
+import os
+import pandas as pd
+import csv_cache
+from conftest import write_taxi_csv
+
+
+def test_chunks_have_global_index_and_follow_requested_sizes(tmp_path, taxi_csv):
+    path, metadata = csv_cache.ensure_parsed_cache(taxi_csv, str(tmp_path / 'cache'), chunk_size=7)
+    assert metadata['rows'] == 30
+    reader = csv_cache.CachedChunkReader(path, chunksize=12)
+    try:
+        first = reader.get_chunk()
+        second = reader.get_chunk(5) # 块大小可变 (内存调节器)，跨越缓存文件中 7 行一批的边界
+        rest = list(reader)
+    finally:
+        reader.close()
+    assert [len(first), len(second)] + [len(c) for c in rest] == [12, 5, 12, 1]
+    assert list(second.index) == list(range(12, 17))
+    assert list(rest[-1].index) == [29]
+    # 与 pd.read_csv(chunksize=...) + coerce_chunk 的结果一致
+    expected = csv_cache.coerce_chunk(pd.read_csv(taxi_csv)).iloc[12:17]
+    pd.testing.assert_frame_equal(second, expected, check_dtype=False)
+    assert str(second['tpep_pickup_datetime'].dtype) == 'datetime64[us]'
+
+
+def test_column_selection(tmp_path, taxi_csv):
+    path, _ = csv_cache.ensure_parsed_cache(taxi_csv, str(tmp_path / 'cache'), chunk_size=10)
+    reader = csv_cache.CachedChunkReader(path, chunksize=10, columns=['trip_distance', 'store_and_fwd_flag'])
+    try:
+        chunk = reader.get_chunk()
+    finally:
+        reader.close()
+    assert list(chunk.columns) == ['trip_distance', 'store_and_fwd_flag']
+    assert chunk['trip_distance'].tolist() == [float(i) for i in range(10)]
+
+
+def test_cache_is_rebuilt_when_source_mtime_changes(tmp_path, taxi_csv):
+    cache_dir = str(tmp_path / 'cache')
+    first_path, first_meta = csv_cache.ensure_parsed_cache(taxi_csv, cache_dir, chunk_size=10)
+    again_path, _ = csv_cache.ensure_parsed_cache(taxi_csv, cache_dir, chunk_size=10)
+    assert again_path == first_path
+
+    # 只改 mtime (大小不变) 也要重建
+    stat = os.stat(taxi_csv)
+    os.utime(taxi_csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    touched_path, _ = csv_cache.ensure_parsed_cache(taxi_csv, cache_dir, chunk_size=10)
+    assert touched_path != first_path and os.path.exists(touched_path)
+
+    write_taxi_csv(taxi_csv, 40)
+    rewritten_path, rewritten_meta = csv_cache.ensure_parsed_cache(taxi_csv, cache_dir, chunk_size=10)
+    assert rewritten_path not in (first_path, touched_path)
+    assert (first_meta['rows'], rewritten_meta['rows']) == (30, 40)
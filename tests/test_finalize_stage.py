@@ -0,0 +1,31 @@
+import io
+import json
+import time
+from finalize_stage import run_finalize_step, run_parallel_finalize_steps, write_finalize_summary
+
+
+def _fail():
+    raise RuntimeError("index build failed")
+
+
+def test_failed_parallel_step_withholds_time_to_queryable():
+    log_f = io.StringIO()
+    start = time.time()
+    records = [run_parallel_finalize_steps('indexes', {'idx_a': lambda: None, 'idx_b': _fail}, [], log_f)]
+    summary = write_finalize_summary(log_f, start, start, 10, 1.0, records, [])
+    assert records[0]['failed_steps'] == ['idx_b']
+    assert summary['finalize_errors'] == ['idx_b']
+    assert summary['time_to_queryable_seconds'] is None
+    statuses = [json.loads(line)['status'] for line in log_f.getvalue().splitlines()]
+    assert statuses.count('FINALIZE_ERROR') == 1 and statuses[-1] == 'FINALIZE_SUMMARY'
+
+
+def test_successful_retry_clears_earlier_failure():
+    log_f = io.StringIO()
+    start = time.time()
+    records = [run_parallel_finalize_steps('indexes', {'idx_b': _fail}, [], log_f),
+               run_finalize_step('idx_b', lambda: {'retried': True}, [], log_f)]
+    summary = write_finalize_summary(log_f, start, start, 10, 1.0, records, [])
+    assert records[1]['retried'] is True
+    assert summary['finalize_errors'] == []
+    assert summary['time_to_queryable_seconds'] is not None
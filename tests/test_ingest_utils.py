@@ -0,0 +1,32 @@
+from ingest_utils import get_path_size, get_storage_metrics, parse_size_to_bytes, write_amplification
+
+
+def test_path_size_sums_directory_and_tolerates_missing_paths(tmp_path):
+    (tmp_path / 'a').write_bytes(b'x' * 10)
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'b').write_bytes(b'x' * 5)
+    assert get_path_size(str(tmp_path)) == 15
+    assert get_path_size(str(tmp_path / 'a')) == 10
+    assert get_path_size(str(tmp_path / 'missing')) == 0
+    assert get_path_size(None) == 0
+
+
+def test_storage_metrics_without_temp_dir(tmp_path):
+    db = tmp_path / 'x.db'
+    db.write_bytes(b'x' * 8)
+    metrics = get_storage_metrics(str(db), wal_files=[str(tmp_path / 'x.db-wal')])
+    assert metrics == {'db_file_bytes': 8, 'wal_bytes': 0, 'temp_bytes': None}
+
+
+def test_write_amplification_unavailable_cases():
+    assert write_amplification(300, 100) == 3.0
+    assert write_amplification(-1, 100) is None # 平台不支持 io_counters
+    assert write_amplification(None, 100) is None
+    assert write_amplification(300, 0) is None
+
+
+def test_parse_size_units():
+    assert parse_size_to_bytes('4GB') == 4 * 1000**3
+    assert parse_size_to_bytes('3.5 GiB') == int(3.5 * 1024**3)
+    assert parse_size_to_bytes('512') == 512
+    assert parse_size_to_bytes('lots') is None
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+import insert_kv
+from csv_cache import coerce_chunk
+
+
+def test_log_and_dbm_stores_count_the_same_key_value_bytes(tmp_path):
+    keys = insert_kv.encode_keys(0, 3)
+    records = np.zeros(3, dtype=[('a', '<f8'), ('b', 'S4')])
+    values = [b'x', b'yy', b'zzz']
+    log_store = insert_kv.AppendOnlyLogStore(str(tmp_path / 'log'))
+    dbm_store = insert_kv.DbmStore(str(tmp_path / 'dbm'))
+    try:
+        assert log_store.write_batch(keys, records) == dbm_store.write_batch(keys, records) == 3 * (8 + 12)
+        assert log_store.write_batch(keys, values) == dbm_store.write_batch(keys, values) == 3 * 8 + 6
+        assert log_store.get(2) == dbm_store.get(2) == b'zzz' # 同一个键以最后一次写入为准
+    finally:
+        log_store.close()
+        dbm_store.close()
+
+
+def _typed_chunk(csv_file, nrows):
+    return coerce_chunk(pd.read_csv(csv_file, nrows=nrows))
+
+
+def _record_dtype(csv_file):
+    columns = list(pd.read_csv(csv_file, nrows=0).columns.str.lower())
+    return insert_kv.build_record_dtype(columns, insert_kv.sample_string_widths(csv_file))
+
+
+def test_struct_round_trip_keeps_nulls_distinct_from_empty_text(taxi_csv):
+    record_dtype = _record_dtype(taxi_csv)
+    chunk = _typed_chunk(taxi_csv, 4)
+    chunk.loc[3, 'store_and_fwd_flag'] = ''
+    chunk.loc[0, 'trip_distance'] = float('nan')
+    chunk.loc[1, 'tpep_pickup_datetime'] = None
+    records = insert_kv.encode_values_struct(chunk, record_dtype)
+    rows = [insert_kv.decode_value_struct(records[i:i + 1].tobytes(), record_dtype) for i in range(4)]
+    # 测试 CSV 的 store_and_fwd_flag 依次为 N、Y、空 (NULL)，第 4 行改成空字符串
+    assert [r['store_and_fwd_flag'] for r in rows] == ['N', 'Y', None, '']
+    assert rows[0]['trip_distance'] is None and rows[1]['trip_distance'] == 1.0
+    assert rows[1]['tpep_pickup_datetime'] is None
+    assert rows[0]['tpep_pickup_datetime'] == '2023-01-07T12:00:44.000000'
+
+
+def test_struct_rejects_text_wider_than_the_sampled_width(taxi_csv):
+    record_dtype = _record_dtype(taxi_csv)
+    assert record_dtype['store_and_fwd_flag'].itemsize == 1
+    chunk = _typed_chunk(taxi_csv, 3)
+    chunk.loc[1, 'store_and_fwd_flag'] = 'YES'
+    with pytest.raises(ValueError, match='store_and_fwd_flag'):
+        insert_kv.encode_values_struct(chunk, record_dtype)
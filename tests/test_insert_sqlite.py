@@ -0,0 +1,102 @@
+import sqlite3
+import insert_sqlite
+
+
+def _fail_first_chunk_insert(monkeypatch, table_name):
+    """让第一块的 executemany 写入一半后失败 (查找表的插入不受影响)"""
+    real_connect = sqlite3.connect
+    calls = []
+
+    class FlakyCursor(sqlite3.Cursor):
+        def executemany(self, sql, rows):
+            if sql.startswith(f"INSERT INTO {table_name} VALUES"):
+                calls.append(sql)
+                if len(calls) == 1:
+                    rows = list(rows)
+                    super().executemany(sql, rows[:len(rows) // 2])
+                    raise sqlite3.OperationalError('injected insert failure')
+            return super().executemany(sql, rows)
+
+    class FlakyConnection(sqlite3.Connection):
+        def cursor(self, factory=FlakyCursor):
+            return super().cursor(factory)
+
+    monkeypatch.setattr(sqlite3, 'connect', lambda *a, **k: real_connect(*a, factory=FlakyConnection, **k))
+
+
+def test_compact_insert_failure_keeps_category_codes_decodable(tmp_path, taxi_csv, monkeypatch):
+    db_file = str(tmp_path / 'taxi.db')
+    _fail_first_chunk_insert(monkeypatch, 'taxi')
+    insert_sqlite.ingest_and_monitor_sqlite(taxi_csv, db_file, 'taxi', str(tmp_path / 'log.jsonl'), 10,
+                                            storage_encoding='compact')
+    monkeypatch.undo()
+
+    with sqlite3.connect(db_file) as conn:
+        rows = conn.execute("SELECT count(*) FROM taxi;").fetchone()[0]
+        lookup = dict(conn.execute("SELECT value, code FROM taxi_store_and_fwd_flag_lookup;").fetchall())
+        orphans = conn.execute(
+            "SELECT count(*) FROM taxi t LEFT JOIN taxi_store_and_fwd_flag_lookup l ON t.store_and_fwd_flag = l.code "
+            "WHERE t.store_and_fwd_flag IS NOT NULL AND l.code IS NULL;").fetchone()[0]
+    assert rows == 20 # 第一块 (含写入一半的行) 被回滚
+    assert set(lookup) == {'N', 'Y'}
+    assert orphans == 0
+
+
+def test_failed_chunk_closes_its_slow_chunk_window(tmp_path, taxi_csv, monkeypatch):
+    import chunk_profiler
+    ended = []
+    real_end_chunk = chunk_profiler.SlowChunkProfiler.end_chunk
+    monkeypatch.setattr(chunk_profiler.SlowChunkProfiler, 'end_chunk',
+                        lambda self, chunk_index: ended.append(chunk_index) or real_end_chunk(self, chunk_index))
+    _fail_first_chunk_insert(monkeypatch, 'taxi')
+    insert_sqlite.ingest_and_monitor_sqlite(taxi_csv, str(tmp_path / 'taxi.db'), 'taxi', str(tmp_path / 'log.jsonl'), 10,
+                                            profile_slow_chunks=True, profile_dir=str(tmp_path / 'profiles'))
+    assert ended == [1, 2, 3] # 失败的第 1 块也单独结束，耗时不会算到第 2 块
+
+
+def test_without_rowid_row_ids_are_csv_row_numbers_after_filtering(tmp_path, taxi_csv):
+    db_file = str(tmp_path / 'taxi.db')
+    insert_sqlite.ingest_and_monitor_sqlite(taxi_csv, db_file, 'taxi', str(tmp_path / 'log.jsonl'), 10,
+                                            storage_encoding='compact', without_rowid=True,
+                                            row_filter='trip_distance % 3 == 1')
+    with sqlite3.connect(db_file) as conn:
+        rows = conn.execute("SELECT row_id, trip_distance FROM taxi ORDER BY row_id;").fetchall()
+    # 测试 CSV 中第 i 行的 trip_distance 为 i
+    assert [row_id for row_id, _ in rows] == list(range(1, 30, 3))
+    assert all(row_id == distance for row_id, distance in rows)
+
+
+def test_compact_encoding_stores_integers_and_decodes_back(tmp_path, taxi_csv):
+    db_file = str(tmp_path / 'taxi.db')
+    insert_sqlite.ingest_and_monitor_sqlite(taxi_csv, db_file, 'taxi', str(tmp_path / 'log.jsonl'), 10,
+                                            storage_encoding='compact')
+    with sqlite3.connect(db_file) as conn:
+        pickup, fare, flag, pu_location, fare_type = conn.execute(
+            "SELECT t.tpep_pickup_datetime, t.fare_amount, l.value, t.pulocationid, typeof(t.fare_amount) "
+            "FROM taxi t LEFT JOIN taxi_store_and_fwd_flag_lookup l ON t.store_and_fwd_flag = l.code "
+            "WHERE t.rowid = 2;").fetchone()
+        flag_nulls = conn.execute("SELECT count(*) FROM taxi WHERE store_and_fwd_flag IS NULL;").fetchone()[0]
+    # 测试 CSV 第 1 行 (0 起): 01/07/2023 12:01:44 PM，fare 11.25，flag Y，PULocationID 101
+    assert pickup == 1673092904 # epoch 秒 (2023-01-07T12:01:44)
+    assert (fare, fare_type) == (1125, 'integer') # 金额按分存储
+    assert (flag, pu_location) == ('Y', 101)
+    assert flag_nulls == 10 # 每 3 行一个空 flag，存为 NULL 而不是类别编码
+
+
+def test_probe_counts_checkpoint_events_between_probes(tmp_path):
+    db_file = str(tmp_path / 'probe.db')
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.commit()
+    state = {}
+    first = insert_sqlite.probe_sqlite_internals(conn, db_file, state)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    second = insert_sqlite.probe_sqlite_internals(conn, db_file, state)
+    conn.close()
+    assert first['journal_mode'] == 'wal'
+    assert first['checkpoint_events_since_last_probe'] is None # 第一次探针没有可比的序号
+    assert second['checkpoint_events_since_last_probe'] >= 1
+    assert second['wal_frames_high_water'] >= 1
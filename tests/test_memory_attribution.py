@@ -0,0 +1,36 @@
+import tracemalloc
+from memory_attribution import PhaseMemoryTracker
+
+
+def test_phases_record_heap_peak_and_retained_memory():
+    tracker = PhaseMemoryTracker(engine_memory_fn=lambda: 1000)
+    tracker.start()
+    try:
+        kept = [bytearray(1024) for _ in range(1000)] # 约 1 MB，阶段结束后仍被引用
+        tracker.mark('convert')
+        temp = [bytearray(1024) for _ in range(1000)] # 临时分配，阶段结束前释放
+        del temp
+        phases = tracker.end_chunk('insert')
+    finally:
+        tracker.stop()
+    assert list(phases) == ['convert', 'insert']
+    assert phases['convert']['python_heap_retained_bytes'] >= 1000 * 1024
+    assert phases['insert']['python_heap_peak_bytes'] >= 1000 * 1024
+    assert phases['insert']['python_heap_retained_bytes'] < 1000 * 1024
+    assert phases['insert']['engine_retained_bytes'] == 0
+    assert tracker.phases == {} # end_chunk 清空当前块
+    assert tracker.summary()['convert']['count'] == 1
+    assert not tracemalloc.is_tracing()
+    del kept
+
+
+def test_engine_memory_errors_are_not_fatal():
+    def broken():
+        raise RuntimeError("boom")
+    tracker = PhaseMemoryTracker(engine_memory_fn=broken)
+    tracker.start()
+    try:
+        record = tracker.mark('read')
+    finally:
+        tracker.stop()
+    assert 'engine_memory_bytes' not in record
@@ -0,0 +1,48 @@
+import memory_governor
+from memory_governor import MemoryGovernor
+
+LIMIT = 1000
+
+
+def _feed(monkeypatch, usages):
+    """read_memory_usage 依次返回 usages 中的值 (用完后保持最后一个)"""
+    remaining = list(usages)
+
+    def fake_read_memory_usage():
+        value = remaining.pop(0) if len(remaining) > 1 else remaining[0]
+        return value, LIMIT, 'test'
+    monkeypatch.setattr(memory_governor, 'read_memory_usage', fake_read_memory_usage)
+
+
+def test_escalates_from_shrink_to_engine_relief_to_pause(monkeypatch):
+    relief_calls = []
+    governor = MemoryGovernor(8000, max_pause_seconds=0.05, pause_interval_seconds=0.01,
+                              relief_callback=lambda: relief_calls.append(1) or {'checkpoint': True})
+    # 检查时 950 (> hard)，gc 后仍 950，引擎释放后 920，暂停期间降到 500
+    _feed(monkeypatch, [950, 950, 920, 500])
+    actions = [r['action'] for r in governor.check(1)]
+    assert actions == ['gc_and_shrink_chunk_size', 'engine_relief', 'pause']
+    assert governor.chunk_size == 4000 and relief_calls == [1]
+
+    # 只超过 soft: 缩小块大小就结束，不调用引擎释放
+    _feed(monkeypatch, [800, 800])
+    assert [r['action'] for r in governor.check(2)] == ['gc_and_shrink_chunk_size']
+    assert governor.chunk_size == 2000 and relief_calls == [1]
+
+
+def test_chunk_size_never_drops_below_minimum_and_recovers_after_calm_chunks(monkeypatch):
+    governor = MemoryGovernor(4000, min_chunk_size=1000, recover_after_chunks=3)
+    _feed(monkeypatch, [800])
+    for i in range(4):
+        governor.check(i)
+    assert governor.chunk_size == 1000
+
+    _feed(monkeypatch, [100])
+    sizes = []
+    for i in range(9):
+        records = governor.check(10 + i)
+        sizes.append(governor.chunk_size)
+        if records:
+            assert records[0]['action'] == 'grow_chunk_size'
+    # 每连续 3 个平静的块翻倍一次，不超过初始块大小
+    assert sizes == [1000, 1000, 2000, 2000, 2000, 4000, 4000, 4000, 4000]
@@ -0,0 +1,43 @@
+import json
+import math
+import numpy as np
+import pytest
+import regression_gate
+
+
+def test_mann_whitney_less_matches_normal_approximation():
+    # 完全分离: U = 0，sigma = sqrt(3*3/12*7)，z = (0 - 4.5 + 0.5) / sigma
+    u, p = regression_gate.mann_whitney_less(np.array([1.0, 2.0, 3.0]), np.array([4.0, 5.0, 6.0]))
+    assert u == 0
+    assert p == pytest.approx(0.5 * math.erfc(4 / math.sqrt(2 * 9 / 12 * 7)), rel=1e-12)
+    assert p == pytest.approx(0.0404, abs=1e-4)
+    # 方向相反时 p 接近 1，完全相同 (全部并列) 时 p = 1
+    assert regression_gate.mann_whitney_less(np.array([4.0, 5.0, 6.0]), np.array([1.0, 2.0, 3.0]))[1] > 0.95
+    assert regression_gate.mann_whitney_less(np.ones(4), np.ones(4))[1] == 1.0
+
+
+def test_block_medians_drop_the_incomplete_tail():
+    assert regression_gate.block_medians(np.arange(7.0), 3).tolist() == [1.0, 4.0]
+    assert len(regression_gate.block_medians(np.arange(2.0), 3)) == 0
+
+
+def _write_log(path, rates):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i, rate in enumerate(rates, start=1):
+            f.write(json.dumps({'status': 'SUCCESS', 'chunk_index': i, 'ingestion_rate_rows_per_sec': rate,
+                                'time_taken_seconds': 1000 / rate}) + '\n')
+
+
+def test_compare_detects_regression_on_block_medians(tmp_path, monkeypatch):
+    monkeypatch.setattr(regression_gate, 'baseline_dir', str(tmp_path / 'baselines'))
+    rng = np.random.default_rng(1)
+    _write_log(tmp_path / 'base.jsonl', 1000 + rng.normal(0, 20, 100))
+    _write_log(tmp_path / 'slow.jsonl', 800 + rng.normal(0, 20, 100))
+    _write_log(tmp_path / 'short.jsonl', 800 + rng.normal(0, 20, 30))
+    common = ['--engine', 'duckdb', '--config', 'test']
+    assert regression_gate.main(['save', str(tmp_path / 'base.jsonl')] + common) == regression_gate.EXIT_OK
+    assert regression_gate.main(['compare', str(tmp_path / 'base.jsonl')] + common) == regression_gate.EXIT_OK
+    assert regression_gate.main(['compare', str(tmp_path / 'slow.jsonl')] + common) == regression_gate.EXIT_REGRESSION
+    # 30 块只有 3 组，不做吞吐量检验 (p99 延迟仍会报回归，所以放宽延迟容忍度)
+    assert regression_gate.main(['compare', str(tmp_path / 'short.jsonl'), '--latency-tolerance', '1'] + common) \
+        == regression_gate.EXIT_OK
@@ -0,0 +1,56 @@
+import sqlite3
+import duckdb
+import pandas as pd
+from csv_cache import coerce_chunk
+from verification import (IngestVerifier, column_kind, register_sqlite_checksum_functions,
+                          DUCKDB_CHECKSUM_SQL, SQLITE_CHECKSUM_SQL)
+
+COLUMNS = ['tpep_pickup_datetime', 'trip_distance', 'fare_amount', 'store_and_fwd_flag']
+
+
+def _chunk(taxi_csv):
+    return coerce_chunk(pd.read_csv(taxi_csv, nrows=12))[COLUMNS]
+
+
+def _load(verifier, chunk):
+    verifier.add_chunk(verifier.chunk_stats(chunk, verifier.raw_null_counts(chunk)))
+
+
+def test_duckdb_match_and_mismatch(taxi_csv):
+    chunk = _chunk(taxi_csv)
+    con = duckdb.connect()
+    con.execute("CREATE TABLE t AS SELECT * FROM chunk;")
+    kinds = {row[0]: column_kind(row[0], row[1]) for row in con.execute("DESCRIBE t;").fetchall()}
+    assert kinds == {'tpep_pickup_datetime': 'datetime', 'trip_distance': 'numeric',
+                     'fare_amount': 'numeric', 'store_and_fwd_flag': 'text'}
+    verifier = IngestVerifier(kinds)
+    _load(verifier, chunk)
+    assert verifier.verify(con, 't', DUCKDB_CHECKSUM_SQL)['result'] == 'MATCH'
+
+    # 同长度的文本修改也要能发现
+    con.execute("UPDATE t SET store_and_fwd_flag = 'Y' WHERE store_and_fwd_flag = 'N';")
+    record = verifier.verify(con, 't', DUCKDB_CHECKSUM_SQL)
+    assert record['result'] == 'MISMATCH' and record['mismatched_columns'] == ['store_and_fwd_flag']
+
+
+def test_sqlite_match_data_loss_and_mismatch(taxi_csv):
+    chunk = _chunk(taxi_csv)
+    # 与 insert_sqlite.py text 模式相同: 时间列存为 ISO8601 字符串
+    chunk['tpep_pickup_datetime'] = chunk['tpep_pickup_datetime'].apply(lambda x: x.isoformat() if pd.notna(x) else None)
+    rows = chunk.astype(object).where(chunk.notna(), None).values.tolist()
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE t (tpep_pickup_datetime TEXT, trip_distance REAL, fare_amount REAL, store_and_fwd_flag TEXT);")
+    conn.executemany("INSERT INTO t VALUES (?, ?, ?, ?);", rows)
+    register_sqlite_checksum_functions(conn)
+    kinds = {row[1]: column_kind(row[1], row[2]) for row in conn.execute("PRAGMA table_info(t);").fetchall()}
+    verifier = IngestVerifier(kinds)
+    _load(verifier, chunk)
+    assert verifier.verify(conn, 't', SQLITE_CHECKSUM_SQL)['result'] == 'MATCH'
+
+    verifier.add_failed_chunk(5)
+    record = verifier.verify(conn, 't', SQLITE_CHECKSUM_SQL)
+    assert record['result'] == 'MATCH_WITH_DATA_LOSS' and record['rows']['rows_in_failed_chunks'] == 5
+
+    conn.execute("DELETE FROM t WHERE rowid = 1;")
+    record = verifier.verify(conn, 't', SQLITE_CHECKSUM_SQL)
+    assert record['result'] == 'MISMATCH' and record['rows']['table_rows'] == 11
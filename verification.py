@@ -0,0 +1,196 @@
+import time
+import hashlib
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from csv_cache import datetime_cols, numeric_cols
+
+# --- 导入校验 ---
+# 导入时在输入端对每个成功插入的块做向量化统计: 行数、每列 NULL 数、与行顺序无关的列校验和；
+# 导入结束后把同样的聚合下推到数据库 (一条 SELECT，一次全表扫描)，两边对比即可证明表和输入一致，不需要导出整张表。
+# 校验和按列的种类定义，输入端和 SQL 端必须一一对应:
+#   datetime: 非 NULL 值的 epoch 秒之和 (整数，精确比较)
+#   numeric:  非 NULL 值之和 (浮点，按相对误差比较；compact 模式下是按存储单位 (分、epoch 秒) 求和)
+#   text:     非 NULL 值 UTF-8 字节的 MD5 前 32 位 (无符号整数) 之和 (整数，精确比较)；对内容敏感，同长度的修改 ('N' -> 'Y') 也能发现
+#             SQLite 没有内置的哈希函数，用 register_sqlite_checksum_functions 注册的 Python 函数 md5_32() 计算
+# 另外在类型转换之前统计一次 NULL 数，差值就是被 errors='coerce' 静默置为 NULL 的值
+# (使用解析缓存时转换已在构建缓存时完成，这部分统计不到)。
+
+NUMERIC_RELATIVE_TOLERANCE = 1e-7 # 浮点求和的顺序不同会带来微小误差
+
+DUCKDB_CHECKSUM_SQL = {
+    'datetime': 'sum(epoch_ms(TRY_CAST({col} AS TIMESTAMP)) // 1000)',
+    'numeric': 'sum(TRY_CAST({col} AS DOUBLE))',
+    'text': "sum(('0x' || left(md5(CAST({col} AS VARCHAR)), 8))::BIGINT)",
+}
+
+SQLITE_CHECKSUM_SQL = {
+    'datetime': "sum(CAST(strftime('%s', {col}) AS INTEGER))", # text 模式下的 ISO8601 字符串
+    'numeric': 'total({col})', # total() 总是返回浮点，不会整数溢出
+    'text': 'sum(md5_32({col}))', # 需要先调用 register_sqlite_checksum_functions(conn)
+}
+
+
+def md5_32(value):
+    """文本校验和的单值哈希: UTF-8 字节的 MD5 前 32 位，与 DUCKDB_CHECKSUM_SQL['text'] 相同"""
+    return int(hashlib.md5(str(value).encode('utf-8')).hexdigest()[:8], 16)
+
+
+def register_sqlite_checksum_functions(conn):
+    """在 SQLite 连接上注册 SQLITE_CHECKSUM_SQL 用到的 md5_32()"""
+    conn.create_function('md5_32', 1, lambda v: None if v is None else md5_32(v), deterministic=True)
+
+
+def column_kind(column, declared_type):
+    """根据列名和数据库中的列类型决定校验和的种类 ('datetime' / 'numeric' / 'text')"""
+    declared_type = (declared_type or '').upper()
+    if column in datetime_cols and not any(t in declared_type for t in ('INT', 'REAL', 'DOUBLE')):
+        return 'datetime' # compact 模式的 epoch 秒 INTEGER 列按 numeric 校验
+    if 'TIMESTAMP' in declared_type or 'DATE' in declared_type:
+        return 'datetime'
+    if column in numeric_cols or any(t in declared_type for t in ('INT', 'REAL', 'DOUBLE', 'FLOAT', 'DECIMAL', 'NUMERIC')):
+        return 'numeric'
+    return 'text'
+
+
+def _column_checksum(series, kind):
+    values = series.dropna()
+    if kind == 'datetime':
+        if not pd.api.types.is_datetime64_any_dtype(values):
+            values = pd.to_datetime(values, format='ISO8601', errors='coerce').dropna() # SQLite text 模式的 ISO 字符串
+        return int(values.to_numpy().astype('datetime64[s]').astype(np.int64).sum())
+    if kind == 'numeric':
+        return float(pd.to_numeric(values, errors='coerce').sum())
+    counts = values.astype(str).value_counts() # 文本列通常取值很少，每个不同的值只哈希一次
+    return int(sum(md5_32(v) * int(n) for v, n in counts.items()))
+
+
+class IngestVerifier:
+    """累计输入端的统计，导入结束后与数据库端的聚合结果对比
+
+    column_kinds: {列名 (小写，与表中一致): 'datetime' / 'numeric' / 'text'}
+    """
+
+    def __init__(self, column_kinds):
+        self.column_kinds = column_kinds
+        self.rows = 0
+        self.nulls = {col: 0 for col in column_kinds}
+        self.raw_nulls = {col: 0 for col in column_kinds}
+        self.checksums = {col: 0 if kind != 'numeric' else 0.0 for col, kind in column_kinds.items()}
+        self.failed_chunks = 0
+        self.rows_in_failed_chunks = 0
+
+    def raw_null_counts(self, chunk_df):
+        """类型转换之前每列的 NULL 数 (CSV 中的空字段)"""
+        return chunk_df.isna().sum().to_dict()
+
+    def chunk_stats(self, chunk_df, raw_nulls):
+        """类型转换之后、插入之前的本块统计；插入成功后再调用 add_chunk 累计"""
+        nulls = chunk_df.isna().sum().to_dict()
+        stats = {'rows': len(chunk_df), 'nulls': {}, 'raw_nulls': {}, 'checksums': {}}
+        for col, kind in self.column_kinds.items():
+            if col not in chunk_df.columns:
+                continue
+            stats['nulls'][col] = int(nulls[col])
+            stats['raw_nulls'][col] = int(raw_nulls.get(col, nulls[col]))
+            stats['checksums'][col] = _column_checksum(chunk_df[col], kind)
+        return stats
+
+    def add_chunk(self, stats):
+        """累计一个成功插入的块，返回写入该块日志的 verification 字段"""
+        self.rows += stats['rows']
+        for col, count in stats['nulls'].items():
+            self.nulls[col] += count
+            self.raw_nulls[col] += stats['raw_nulls'][col]
+            self.checksums[col] += stats['checksums'][col]
+        null_values = sum(stats['nulls'].values())
+        return {'rows': stats['rows'], 'null_values': null_values,
+                'coerced_to_null': null_values - sum(stats['raw_nulls'].values())}
+
+    def add_failed_chunk(self, rows):
+        """插入失败被跳过的块: 这些行不在表中，单独统计为丢失"""
+        self.failed_chunks += 1
+        self.rows_in_failed_chunks += rows
+
+    def query_table(self, con, table_name, checksum_sql):
+        """一条 SELECT 计算表的行数、每列 NULL 数和校验和 (con 为 DuckDB 或 SQLite 连接)"""
+        expressions = ['count(*)']
+        for col, kind in self.column_kinds.items():
+            quoted = f'"{col}"'
+            expressions.append(f'count(*) - count({quoted})')
+            expressions.append(checksum_sql[kind].format(col=quoted))
+        row = con.execute(f"SELECT {', '.join(expressions)} FROM {table_name};").fetchone()
+        table = {'rows': row[0], 'nulls': {}, 'checksums': {}}
+        for i, col in enumerate(self.column_kinds):
+            table['nulls'][col] = row[1 + 2 * i]
+            checksum = row[2 + 2 * i] or 0 # 空表或全 NULL 时 sum() 返回 NULL
+            table['checksums'][col] = float(checksum) if self.column_kinds[col] == 'numeric' else int(checksum)
+        return table
+
+    def _checksum_matches(self, kind, expected, actual):
+        if kind == 'numeric':
+            return abs(expected - actual) <= NUMERIC_RELATIVE_TOLERANCE * max(abs(expected), abs(actual), 1.0)
+        return expected == actual
+
+    def verify(self, con, table_name, checksum_sql, rows_filtered=0):
+        """对比输入端和数据库端，返回 'VERIFICATION' 日志记录
+
+        result: MATCH (表与输入完全一致)、MATCH_WITH_DATA_LOSS (表与插入的数据一致，但有块插入失败或值被置为 NULL)、
+                MISMATCH (表与插入的数据不一致)
+        """
+        start_time = time.time()
+        table = self.query_table(con, table_name, checksum_sql)
+        columns = {}
+        mismatched = []
+        for col, kind in self.column_kinds.items():
+            expected_checksum = self.checksums[col]
+            nulls_match = self.nulls[col] == table['nulls'][col]
+            checksum_match = self._checksum_matches(kind, expected_checksum, table['checksums'][col])
+            columns[col] = {
+                'kind': kind,
+                'expected_nulls': self.nulls[col],
+                'table_nulls': table['nulls'][col],
+                'coerced_to_null': self.nulls[col] - self.raw_nulls[col],
+                'expected_checksum': expected_checksum,
+                'table_checksum': table['checksums'][col],
+                'match': nulls_match and checksum_match,
+            }
+            if not columns[col]['match']:
+                mismatched.append(col)
+
+        coerced = sum(c['coerced_to_null'] for c in columns.values())
+        if table['rows'] != self.rows or mismatched:
+            result = 'MISMATCH'
+        elif self.failed_chunks or coerced:
+            result = 'MATCH_WITH_DATA_LOSS'
+        else:
+            result = 'MATCH'
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'status': 'VERIFICATION',
+            'result': result,
+            'verify_seconds': round(time.time() - start_time, 4),
+            'rows': {
+                'rows_read': self.rows + self.rows_in_failed_chunks + rows_filtered,
+                'rows_filtered': rows_filtered,
+                'rows_in_failed_chunks': self.rows_in_failed_chunks,
+                'failed_chunks': self.failed_chunks,
+                'rows_inserted': self.rows,
+                'table_rows': table['rows'],
+            },
+            'values_coerced_to_null': coerced,
+            'mismatched_columns': mismatched,
+            'columns': columns,
+        }
+
+
+def print_verification(record):
+    rows = record['rows']
+    print(f"\n--- 导入校验: {record['result']} ({record['verify_seconds']:.4f} 秒) ---")
+    print(f"读取 {rows['rows_read']} 行，过滤 {rows['rows_filtered']} 行，插入失败 {rows['rows_in_failed_chunks']} 行 "
+          f"({rows['failed_chunks']} 块)，插入 {rows['rows_inserted']} 行，表中 {rows['table_rows']} 行")
+    print(f"被 errors='coerce' 置为 NULL 的值: {record['values_coerced_to_null']}")
+    for col, c in record['columns'].items():
+        if not c['match'] or c['coerced_to_null']:
+            print(f"  {col} ({c['kind']}): NULL {c['expected_nulls']} / 表 {c['table_nulls']} (转换置空 {c['coerced_to_null']})，"
+                  f"校验和 {c['expected_checksum']} / 表 {c['table_checksum']}" + ("" if c['match'] else "  <-- 不一致"))